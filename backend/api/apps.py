@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.contrib.auth.signals import user_logged_in
+
+        from .replicas import pin_on_login
+        from .v1.cards import build_cards
+        from recipes.cards import register_card_builder
+        register_card_builder(build_cards)
+        user_logged_in.connect(pin_on_login)
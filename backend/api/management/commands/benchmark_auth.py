@@ -0,0 +1,69 @@
+from time import perf_counter
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.views import APIView
+
+from api.v1.authentication import (
+    StatelessTokenAuthentication, issue_tokens
+)
+from users.models import User
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение пропускной способности API при аутентификации '
+        'по токену из базы и по подписанному токену'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', required=True)
+        parser.add_argument('--path', default='/api/recipes/?limit=1')
+        parser.add_argument('--requests', type=int, default=500)
+
+    def run(self, title, authentication_class, key, options):
+        client = Client(HTTP_AUTHORIZATION=f'Token {key}')
+        with mock.patch.object(
+            APIView, 'authentication_classes', (authentication_class,)
+        ):
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                response = client.get(options['path'])
+            if response.status_code != 200:
+                raise CommandError(
+                    f'{title}: ответ {response.status_code} для '
+                    f'{options["path"]}!'
+                )
+            started = perf_counter()
+            for _ in range(options['requests']):
+                client.get(options['path'])
+            elapsed = perf_counter() - started
+        self.stdout.write(
+            f'{title}: {options["requests"] / elapsed:.0f} запросов/с, '
+            f'{queries.count} запросов к базе на запрос'
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options['email']).first()
+        if user is None:
+            raise CommandError('Пользователь не найден!')
+        token, _ = Token.objects.get_or_create(user=user)
+        self.run('Токен из базы', TokenAuthentication, token.key, options)
+        self.run(
+            'Подписанный токен', StatelessTokenAuthentication,
+            str(issue_tokens(user)[0]), options
+        )
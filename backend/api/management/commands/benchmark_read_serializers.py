@@ -0,0 +1,73 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.v1.read_serializers import (
+    FastRecipeReadSerializer, FastSubscriptionSerializer
+)
+from api.v1.serializers import RecipeReadSerializer, SubscriptionSerializer
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение времени работы сериализаторов DRF '
+        'и быстрых сериализаторов только для чтения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=60)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--recipes-limit', default='3')
+        parser.add_argument(
+            '--email',
+            help='Пользователь, от имени которого выполняется запрос.'
+        )
+
+    def get_request(self, user, recipes_limit):
+        django_request = APIRequestFactory().get(
+            '/api/', {'recipes_limit': recipes_limit})
+        if user is not None:
+            force_authenticate(django_request, user=user)
+        request = Request(django_request)
+        request.user
+        return request
+
+    def compare(self, title, slow, fast, instances, context, repeat):
+        # Совпадение вывода проверяется тестами api.tests.
+        timings = []
+        for serializer in (slow, fast):
+            started = perf_counter()
+            for _ in range(repeat):
+                serializer(instances, many=True, context=context).data
+            timings.append((perf_counter() - started) / repeat * 1000)
+        self.stdout.write(
+            f'{title}: объектов {len(instances)}, '
+            f'DRF {timings[0]:.2f} мс, быстрый {timings[1]:.2f} мс, '
+            f'ускорение x{timings[0] / max(timings[1], 1e-9):.1f}'
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['email']:
+            user = User.objects.filter(email=options['email']).first()
+            if user is None:
+                raise CommandError('Пользователь не найден!')
+        request = self.get_request(user, options['recipes_limit'])
+        context = {'request': request}
+
+        recipes = list(
+            Recipe.objects.select_related('author')[:options['limit']])
+        self.compare(
+            'Рецепты', RecipeReadSerializer, FastRecipeReadSerializer,
+            recipes, context, options['repeat']
+        )
+        authors = list(User.objects.filter(recipes__isnull=False).distinct()[
+            :options['limit']])
+        self.compare(
+            'Подписки', SubscriptionSerializer, FastSubscriptionSerializer,
+            authors, context, options['repeat']
+        )
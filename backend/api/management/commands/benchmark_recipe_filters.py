@@ -0,0 +1,102 @@
+from datetime import timedelta
+from itertools import product
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from api.v1.filters import RECIPE_ORDERINGS, RecipeFilter
+from foodgram_backend.settings import PAGE_SIZE
+from recipes.models import Recipe
+
+
+# Фильтры из RecipeFilter, для которых есть индексы.
+FILTERS = (
+    {},
+    {'cooking_time_min': 10, 'cooking_time_max': 30},
+    {'published_after': 30},
+    {'published_after': 365, 'published_before': 180},
+    {'cooking_time_max': 20, 'published_after': 90},
+)
+ORDERINGS = (None, *RECIPE_ORDERINGS)
+
+
+def is_full_scan(plan, table):
+    """Есть ли в плане полный просмотр таблицы без индекса."""
+    for line in plan.splitlines():
+        if connection.vendor == 'postgresql' and f'Seq Scan on {table}' in (
+            line
+        ):
+            return True
+        if (
+            connection.vendor == 'sqlite'
+            and f'SCAN {table}' in line and 'INDEX' not in line
+        ):
+            return True
+    return False
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка, что фильтры и сортировки списка рецептов выполняются '
+        'по индексам. Запускать на большой базе, например после '
+        'generate_data'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page', type=int, default=100,
+            help='Номер страницы, на которой измеряется время.'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        table = Recipe._meta.db_table
+        offset = (options['page'] - 1) * PAGE_SIZE
+        full_scans = 0
+        self.stdout.write(
+            f'Рецептов: {Recipe.objects.count()}, страница '
+            f'{options["page"]} по {PAGE_SIZE}'
+        )
+        for filters, ordering in product(FILTERS, ORDERINGS):
+            params = {
+                name: (
+                    (now - timedelta(days=value)).isoformat()
+                    if name.startswith('published') else value
+                )
+                for name, value in filters.items()
+            }
+            if ordering:
+                params['ordering'] = ordering
+            filterset = RecipeFilter(params, queryset=Recipe.objects.all())
+            if not filterset.is_valid():
+                raise CommandError(f'{params}: {filterset.errors}')
+            page = filterset.qs.values_list('id', flat=True)[
+                offset:offset + PAGE_SIZE]
+            plan = page.explain()
+            elapsed = []
+            for _ in range(options['repeat']):
+                started = perf_counter()
+                list(page.all())
+                elapsed.append(perf_counter() - started)
+            title = ', '.join(
+                f'{name}=-{value}д' if name.startswith('published')
+                else f'{name}={value}'
+                for name, value in (*filters.items(), ('ordering', ordering))
+                if value is not None
+            ) or 'без параметров'
+            line = f'{title}: {min(elapsed) * 1000:.1f} мс'
+            if is_full_scan(plan, table):
+                full_scans += 1
+                self.stdout.write(self.style.ERROR(
+                    f'{line}, полный просмотр таблицы'))
+                for plan_line in plan.splitlines():
+                    self.stdout.write(f'    {plan_line}')
+            else:
+                self.stdout.write(f'{line}, по индексу')
+        if full_scans:
+            raise CommandError(
+                f'Запросов с полным просмотром таблицы: {full_scans}')
+        self.stdout.write(self.style.SUCCESS('Все запросы идут по индексам'))
@@ -0,0 +1,145 @@
+import os
+import random
+import sqlite3
+import threading
+from contextlib import closing
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from rest_framework.test import APIClient
+
+from foodgram_backend.settings import BD_IS_SQLITE
+from recipes.models import Recipe
+from users.models import User
+
+
+MODES = (
+    ('Стандартные параметры', 'django.db.backends.sqlite3'),
+    ('Настроенные параметры', 'foodgram_backend.sqlite3'),
+)
+
+
+def copy_database(source, target):
+    """Копирует базу, возвращая журнал по умолчанию (rollback journal)."""
+    with closing(sqlite3.connect(source)) as source_connection:
+        with closing(sqlite3.connect(target)) as target_connection:
+            source_connection.backup(target_connection)
+            target_connection.execute('PRAGMA journal_mode = DELETE')
+
+
+def percentile(values, share):
+    if not values:
+        return 0
+    return sorted(values)[min(int(len(values) * share), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение SQLite со стандартными и настроенными параметрами под '
+        'смешанной нагрузкой API: чтение рецептов, добавление в избранное '
+        'и удаление из него из нескольких потоков на копиях текущей базы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--writes', type=float, default=0.3,
+            help='Доля изменяющих запросов'
+        )
+
+    def worker(self, user, recipe_ids, options, results):
+        client = APIClient()
+        client.force_authenticate(user)
+        generator = random.Random(user.id)
+        for _ in range(options['requests']):
+            recipe_id = generator.choice(recipe_ids)
+            payload = None
+            if generator.random() < options['writes']:
+                kind = 'write'
+                method = generator.choice(('post', 'delete'))
+                url = f'/api/recipes/{recipe_id}/favorite/'
+                if generator.random() < 0.5:
+                    # Пакетное удаление читает связи и удаляет их в одной
+                    # транзакции.
+                    url = '/api/recipes/favorite/'
+                    payload = {'ids': generator.sample(recipe_ids, 3)}
+            else:
+                kind = 'read'
+                method = 'get'
+                url = generator.choice((
+                    '/api/recipes/?limit=6', f'/api/recipes/{recipe_id}/'))
+            started = perf_counter()
+            try:
+                # Повторное добавление и удаление отсутствующего - 400.
+                error = getattr(client, method)(
+                    url, payload, format='json').status_code >= 500
+            except Exception as exception:
+                error = str(exception)
+            results.append((kind, perf_counter() - started, error))
+        connection.close()
+
+    def run(self, title, users, recipe_ids, options):
+        results = []
+        threads = [
+            threading.Thread(
+                target=self.worker,
+                args=(user, recipe_ids, options, results)
+            )
+            for user in users
+        ]
+        started = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = perf_counter() - started
+        errors = [error for _, _, error in results if error]
+        locked = sum(
+            1 for error in errors
+            if isinstance(error, str) and 'locked' in error
+        )
+        self.stdout.write(
+            f'{title}: {len(results) / elapsed:.0f} запросов/с, '
+            f'ошибок {len(errors)} (database is locked: {locked})'
+        )
+        for kind, kind_title in (('read', 'чтение'), ('write', 'запись')):
+            durations = [
+                duration for result_kind, duration, error in results
+                if result_kind == kind and not error
+            ]
+            self.stdout.write(
+                f'  {kind_title}: {len(durations)} запросов, '
+                f'p50 {percentile(durations, 0.5) * 1000:.1f} мс, '
+                f'p95 {percentile(durations, 0.95) * 1000:.1f} мс, '
+                f'p99 {percentile(durations, 0.99) * 1000:.1f} мс'
+            )
+
+    def handle(self, *args, **options):
+        if not BD_IS_SQLITE:
+            raise CommandError('Команда работает только с SQLite!')
+        users = list(User.objects.filter(
+            is_active=True).order_by('?')[:options['threads']])
+        recipe_ids = list(
+            Recipe.objects.order_by('?').values_list('id', flat=True)[:1000])
+        if len(users) < options['threads'] or not recipe_ids:
+            raise CommandError(
+                'Недостаточно пользователей или рецептов, заполните базу '
+                'командой generate_data!'
+            )
+        settings_dict = connections.databases['default']
+        source = settings_dict['NAME']
+        engine = settings_dict['ENGINE']
+        connections.close_all()
+        try:
+            with TemporaryDirectory() as directory:
+                for number, (title, mode_engine) in enumerate(MODES):
+                    name = os.path.join(directory, f'{number}.sqlite3')
+                    copy_database(source, name)
+                    # Потоки создают соединения по этим настройкам.
+                    settings_dict.update(ENGINE=mode_engine, NAME=name)
+                    self.run(title, users, recipe_ids, options)
+        finally:
+            settings_dict.update(ENGINE=engine, NAME=source)
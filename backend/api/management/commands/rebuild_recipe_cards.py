@@ -0,0 +1,36 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from recipes.batches import chunked
+from recipes.cards import refresh_cards
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Пересборка карточек рецептов для списка и страницы рецепта'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--missing', action='store_true',
+            help=(
+                'Собрать только недостающие карточки, например после '
+                'миграции, добавившей их.'
+            )
+        )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        recipes = Recipe.objects.all()
+        if options['missing']:
+            recipes = recipes.filter(card__isnull=True)
+        recipe_ids = list(
+            recipes.order_by('id').values_list('id', flat=True))
+        for batch in chunked(recipe_ids, options['batch_size']):
+            refresh_cards(batch)
+        elapsed = perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано карточек: {len(recipe_ids)} за {elapsed:.1f} с '
+            f'({len(recipe_ids) / elapsed:.0f} в секунду)'
+        ))
@@ -0,0 +1,285 @@
+import os
+import random
+import socket
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+from hmac import compare_digest
+from time import perf_counter
+
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from foodgram_backend.postgresql.pool import get_connection_stats
+from foodgram_backend.settings import METRICS_SAMPLE_RATE, METRICS_TOKEN
+
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+UNRESOLVED_VIEW = 'unresolved'
+
+_local = threading.local()
+_registries = []
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин."""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.sum += other.sum
+        self.count += other.count
+
+
+class ViewMetrics:
+    """Метрики одного представления, например RecipeViewSet.list."""
+    __slots__ = (
+        'duration', 'db_duration', 'queries', 'duplicate_queries',
+        'response_size', 'responses',
+    )
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERIES_BUCKETS)
+        self.duplicate_queries = Histogram(QUERIES_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.responses = Counter()
+
+    def merge(self, other):
+        for name in self.__slots__[:-1]:
+            getattr(self, name).merge(getattr(other, name))
+        self.responses.update(other.responses)
+
+
+def get_registry():
+    """Возвращает метрики текущего потока.
+
+    Каждый поток пишет только в свой словарь, поэтому блокировки на пути
+    запроса не нужны, а сложение выполняется при выгрузке метрик.
+    """
+    registry = getattr(_local, 'registry', None)
+    if registry is None:
+        registry = _local.registry = {}
+        _registries.append(registry)
+    return registry
+
+
+def collect():
+    merged = {}
+    for registry in list(_registries):
+        for view, metrics in list(registry.items()):
+            merged.setdefault(view, ViewMetrics()).merge(metrics)
+    return merged
+
+
+def get_view_name(request, view_func):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', UNRESOLVED_VIEW)
+    actions = getattr(view_func, 'actions', None) or {}
+    method = request.method.lower()
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class QueryTracker:
+    """Считает запросы к базе, их время и повторы одного и того же SQL."""
+
+    def __init__(self):
+        self.duration = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - started
+            self.statements[sql] += 1
+
+    @property
+    def count(self):
+        return sum(self.statements.values())
+
+    @property
+    def duplicates(self):
+        return self.count - len(self.statements)
+
+
+class RequestMetricsMiddleware:
+    """Собирает метрики запросов по представлениям.
+
+    Время обработки, статус и размер ответа записываются для каждого
+    запроса, запросы к базе - для доли METRICS_SAMPLE_RATE запросов.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tracker = None
+        with ExitStack() as stack:
+            if random.random() < METRICS_SAMPLE_RATE:
+                tracker = QueryTracker()
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(tracker))
+            started = perf_counter()
+            response = self.get_response(request)
+            duration = perf_counter() - started
+
+        view = getattr(request, 'metrics_view', UNRESOLVED_VIEW)
+        registry = get_registry()
+        metrics = registry.get(view)
+        if metrics is None:
+            metrics = registry[view] = ViewMetrics()
+        metrics.duration.observe(duration)
+        metrics.responses[response.status_code] += 1
+        if not response.streaming:
+            metrics.response_size.observe(len(response.content))
+        if tracker is not None:
+            metrics.db_duration.observe(tracker.duration)
+            metrics.queries.observe(tracker.count)
+            metrics.duplicate_queries.observe(tracker.duplicates)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = get_view_name(request, view_func)
+
+
+def escape_label(value):
+    return (
+        str(value).replace('\\', r'\\').replace('"', r'\"')
+        .replace('\n', r'\n')
+    )
+
+
+def get_worker_label():
+    """Метка процесса: метрики каждого процесса gunicorn - отдельные ряды.
+
+    Берется при выгрузке, а не при импорте: процессы gunicorn могут
+    создаваться копированием уже загруженного приложения.
+    """
+    return f'worker="{escape_label(f"{socket.gethostname()}:{os.getpid()}")}"'
+
+
+def format_histogram(name, description, histograms, worker):
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+    for view, histogram in histograms:
+        label = f'{worker},view="{escape_label(view)}"'
+        cumulative = 0
+        for bound, count in zip(
+            histogram.buckets + ('+Inf',), histogram.counts
+        ):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+        lines.append(f'{name}_count{{{label}}} {histogram.count}')
+    return lines
+
+
+def format_connection_stats(worker):
+    """Счетчики соединений с базой и заполненность пулов."""
+    stats = sorted(get_connection_stats().items())
+    if not stats:
+        return []
+    lines = []
+    for attribute, name, description in (
+        ('connects', 'foodgram_db_connects_total',
+         'Открыто новых соединений с базой.'),
+        ('checkouts', 'foodgram_db_checkouts_total',
+         'Выдано соединений запросам.'),
+        ('waits', 'foodgram_db_checkout_waits_total',
+         'Ожиданий свободного соединения пула.'),
+        ('wait_seconds', 'foodgram_db_checkout_wait_seconds_total',
+         'Суммарное время ожидания соединения пула.'),
+        ('reconnects', 'foodgram_db_reconnects_total',
+         'Соединений, замененных после неудачной проверки.'),
+        ('expired', 'foodgram_db_expired_connections_total',
+         'Соединений пула, закрытых по возрасту.'),
+    ):
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for alias, counters in stats:
+            lines.append(
+                f'{name}{{{worker},database="{escape_label(alias)}"}} '
+                f'{getattr(counters, attribute)}'
+            )
+    lines.append(
+        '# HELP foodgram_db_pool_connections Соединения пулов по состоянию.')
+    lines.append('# TYPE foodgram_db_pool_connections gauge')
+    for alias, counters in stats:
+        if counters.pools:
+            for state in ('idle', 'in_use'):
+                lines.append(
+                    f'foodgram_db_pool_connections{{{worker},database='
+                    f'"{escape_label(alias)}",state="{state}"}} '
+                    f'{getattr(counters, state)}'
+                )
+    return lines
+
+
+def is_authorized(request):
+    """Проверяет токен METRICS_TOKEN; без настроенного токена доступа нет."""
+    scheme, _, token = request.headers.get('Authorization', '').partition(
+        ' ')
+    return bool(METRICS_TOKEN) and scheme == 'Bearer' and compare_digest(
+        token.encode(), METRICS_TOKEN.encode())
+
+
+def metrics_view(request):
+    """Метрики текущего процесса в текстовом формате Prometheus.
+
+    Все ряды помечены процессом, ответившим на запрос: счетчики разных
+    процессов не смешиваются и не убывают между опросами.
+    """
+    if not is_authorized(request):
+        return HttpResponseForbidden()
+    worker = get_worker_label()
+    views = sorted(collect().items())
+    lines = []
+    for attribute, name, description in (
+        ('duration', 'foodgram_request_duration_seconds',
+         'Время обработки запроса.'),
+        ('db_duration', 'foodgram_request_db_duration_seconds',
+         'Время запросов к базе за один запрос (выборочно).'),
+        ('queries', 'foodgram_request_queries',
+         'Число запросов к базе за один запрос (выборочно).'),
+        ('duplicate_queries', 'foodgram_request_duplicate_queries',
+         'Число повторных одинаковых запросов к базе (выборочно).'),
+        ('response_size', 'foodgram_response_size_bytes',
+         'Размер ответа.'),
+    ):
+        lines.extend(format_histogram(name, description, (
+            (view, getattr(metrics, attribute)) for view, metrics in views
+        ), worker))
+    lines.append('# HELP foodgram_responses_total Число ответов по статусам.')
+    lines.append('# TYPE foodgram_responses_total counter')
+    for view, metrics in views:
+        for status, count in sorted(metrics.responses.items()):
+            lines.append(
+                f'foodgram_responses_total{{{worker},'
+                f'view="{escape_label(view)}",status="{status}"}} {count}'
+            )
+    lines.extend(format_connection_stats(worker))
+    return HttpResponse(
+        '\n'.join(lines) + '\n',
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,79 @@
+"""Чтение с реплик базы данных для безопасных запросов API.
+
+Представление выбирает реплику на время запроса через read_from_replica,
+маршрутизатор направляет на нее чтения, а все записи и чтения внутри
+транзакций - на основную базу. Пользователь после своей записи или входа
+REPLICA_READ_YOUR_WRITES_SECONDS секунд читает с основной базы, чтобы
+отставание реплики не скрывало его изменения. Отметки о записях хранятся
+в файловом кэше, общем для воркеров.
+"""
+import random
+from contextvars import ContextVar
+
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from foodgram_backend.settings import (
+    READ_REPLICAS, REPLICA_READ_YOUR_WRITES_SECONDS
+)
+
+
+RECENT_WRITES_CACHE = 'recent_writes'
+
+replica_alias = ContextVar('replica_alias', default=None)
+
+
+def get_recent_write_key(user):
+    return f'user:{user.pk}'
+
+
+def pin_to_primary(user):
+    """Отправляет чтения пользователя на основную базу на время окна."""
+    if READ_REPLICAS and user.is_authenticated:
+        caches[RECENT_WRITES_CACHE].set(
+            get_recent_write_key(user), True,
+            REPLICA_READ_YOUR_WRITES_SECONDS
+        )
+
+
+def pin_on_login(sender, user, **kwargs):
+    pin_to_primary(user)
+
+
+def read_from_replica(user):
+    """Направляет чтения текущего запроса на случайную реплику.
+
+    Возвращает токен для replica_alias.reset или None, если реплик нет
+    или пользователь недавно что-то изменил.
+    """
+    if not READ_REPLICAS:
+        return None
+    if user.is_authenticated and caches[RECENT_WRITES_CACHE].get(
+        get_recent_write_key(user), False
+    ):
+        return None
+    return replica_alias.set(random.choice(READ_REPLICAS))
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        alias = replica_alias.get()
+        if (
+            alias is None
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+            # Кэш в базе, например отозванные токены, читается с основной
+            # базы, чтобы отзыв действовал сразу.
+            or model._meta.app_label == 'django_cache'
+        ):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,785 @@
+import json
+import os
+import random
+import re
+import shutil
+import socket
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from difflib import unified_diff
+from io import BytesIO
+from pathlib import Path
+from tempfile import mkdtemp
+from threading import Barrier
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import (
+    APIClient, APIRequestFactory, force_authenticate
+)
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from .metrics import ViewMetrics, get_registry, metrics_view
+from .v1.authentication import StatelessTokenAuthentication, issue_tokens
+from .v1.read_serializers import (
+    FastRecipeReadSerializer, FastSubscriptionSerializer
+)
+from .v1.serializers import RecipeReadSerializer, SubscriptionSerializer
+from .v1.views import (
+    StatelessTokenDestroyView, StatelessTokenRefreshView, UserViewSet
+)
+from recipes.cards import refresh_cards
+from recipes.deletion import schedule_deletion
+from recipes.feed import backfill, get_popular_author_ids
+from recipes.models import (
+    Change, Favorite, Ingredient, IngredientInRecipe,
+    Recipe, RecipeCard, RecipeInShoppingCart, Tag
+)
+from recipes.pantry import pantry_index
+from recipes.similar import index_recipe
+from users.models import Subscription, User
+
+
+def make_png():
+    buffer = BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+PNG = make_png()
+IMAGE = 'data:image/png;base64,' + b64encode(PNG).decode()
+
+SMALL_PAGE = 6
+LARGE_PAGE = 60
+
+MEDIA_ROOT = mkdtemp()
+
+# Записанные запросы адресов API для сравнения при превышении бюджета,
+# отдельно для каждой СУБД. Перезаписываются запуском тестов с
+# RECORD_QUERY_BASELINES=True.
+QUERY_BASELINES_DIR = Path(__file__).resolve().parent / 'query_baselines'
+RECORD_QUERY_BASELINES = (
+    os.getenv('RECORD_QUERY_BASELINES', 'False') == 'True')
+
+
+def normalize_sql(sql):
+    """Заменяет значения, которые меняются от запуска к запуску."""
+    sql = re.sub(r"'(?:[^']|'')*'", "'?'", sql)
+    sql = re.sub(r'\bs\d+_x\d+\b', 's?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return re.sub(r'\?(?:, \?)+', '?, ...', sql)
+
+
+def seed():
+    """Пользователи, рецепты, избранное и подписки для проверки запросов.
+
+    Возвращает читателя с избранным и подписками и значения для адресов.
+    """
+    random.seed(1)
+    cache.clear()
+    User.objects.bulk_create(
+        User(
+            email=f'user{number}@foodgram.test',
+            username=f'user{number}',
+            first_name=f'Имя{number}',
+            last_name=f'Фамилия{number}',
+        )
+        for number in range(LARGE_PAGE + 10)
+    )
+    users = list(User.objects.order_by('id'))
+    for user in users[:10]:
+        user.avatar.save('avatar.png', ContentFile(PNG))
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {number}', slug=f'tag{number}')
+        for number in range(5)
+    )
+    tags = list(Tag.objects.all())
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'ing{number:03}', measurement_unit='г')
+        for number in range(200)
+    )
+    ingredients = list(Ingredient.objects.all())
+
+    for number in range(LARGE_PAGE * 2):
+        recipe = Recipe(
+            author=random.choice(users),
+            name=f'Рецепт {number}',
+            text='Описание рецепта',
+            cooking_time=random.randint(1, 120),
+        )
+        recipe.image.save('recipe.png', ContentFile(PNG), save=False)
+        recipe.save()
+        recipe.tags.set(random.sample(tags, random.randint(1, 3)))
+        # Ингредиенты берутся из небольшого набора, чтобы у рецептов были
+        # похожие.
+        recipe_ingredients = random.sample(
+            ingredients[:20], random.randint(3, 8))
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe, name=ingredient,
+                amount=random.randint(1, 500)
+            )
+            for ingredient in recipe_ingredients
+        )
+        index_recipe(
+            recipe.id,
+            [ingredient.id for ingredient in recipe_ingredients],
+            created=True
+        )
+    recipes = list(Recipe.objects.order_by('id'))
+    # Ингредиенты добавлены в обход моделей.
+    refresh_cards([recipe.id for recipe in recipes])
+
+    reader = users[0]
+    for model in (Favorite, RecipeInShoppingCart):
+        model.objects.bulk_create(
+            model(user=reader, recipe=recipe)
+            for recipe in recipes[:LARGE_PAGE + 5]
+        )
+    Subscription.objects.bulk_create(
+        Subscription(user=reader, following=user) for user in users[1:-1])
+    backfill(reader.id, [user.id for user in users[1:-1]])
+    # Список популярных авторов и индекс ингредиентов строятся при первом
+    # обращении, первые запросы не должны отличаться от остальных.
+    get_popular_author_ids()
+    pantry_index.rebuild()
+    pantry_index.search((), 0)
+    return reader, {
+        'tag': tags[0].id,
+        'tag_slug': tags[0].slug,
+        'ingredient': ingredients[0].id,
+        'another_ingredient': ingredients[1].id,
+        'pantry': '&'.join(
+            f'ingredients={ingredient.id}' for ingredient in ingredients[:10]
+        ),
+        'recipe': recipes[-1].id,
+        'recipe_ids': ','.join(str(recipe.id) for recipe in recipes[:20]),
+        'user': recipes[0].author_id,
+        'new_following': users[-1].id,
+    }
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class SeededTestCase(TestCase):
+    """Тесты на данных seed() с изображениями во временном каталоге."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.data = seed()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+class ReadSerializerTests(SeededTestCase):
+    """Быстрые сериализаторы выводят то же, что и сериализаторы DRF."""
+
+    def get_context(self, user=None, **params):
+        request = APIRequestFactory().get('/api/', params)
+        if user is not None:
+            force_authenticate(request, user=user)
+        request = Request(request)
+        request.user
+        return {'request': request}
+
+    def assert_same_output(self, slow, fast, instances, context):
+        renderer = JSONRenderer()
+        self.assertEqual(
+            json.loads(renderer.render(
+                fast(instances, many=True, context=context).data)),
+            json.loads(renderer.render(
+                slow(instances, many=True, context=context).data))
+        )
+
+    def test_recipes(self):
+        recipes = list(Recipe.objects.select_related('author'))
+        for user in (None, self.reader):
+            with self.subTest(user=user):
+                self.assert_same_output(
+                    RecipeReadSerializer, FastRecipeReadSerializer, recipes,
+                    self.get_context(user)
+                )
+
+    def test_subscriptions(self):
+        authors = list(User.objects.filter(
+            followings__user=self.reader).order_by('id'))
+        for params in (
+            {}, {'recipes_limit': 0}, {'recipes_limit': 1},
+            {'recipes_limit': 3}, {'recipes_limit': 1000},
+            {'recipes_limit': 'много'},
+        ):
+            with self.subTest(**params):
+                self.assert_same_output(
+                    SubscriptionSerializer, FastSubscriptionSerializer,
+                    authors, self.get_context(self.reader, **params)
+                )
+
+    def test_missing_cards(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        url = f'/api/recipes/?limit={SMALL_PAGE}'
+        expected = client.get(url).json()
+        RecipeCard.objects.filter(recipe_id__in=[
+            recipe['id'] for recipe in expected['results'][::2]
+        ]).delete()
+        cards = RecipeCard.objects.count()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.get(url).json(), expected)
+        self.assertEqual(RecipeCard.objects.count(), cards)
+        self.assertFalse([
+            query['sql'] for query in queries
+            if not query['sql'].startswith('SELECT')
+        ])
+
+
+class QueryCountTests(SeededTestCase):
+    """Число запросов к базе для основных адресов API.
+
+    В адресах с {limit} число запросов не должно зависеть от размера
+    страницы: они проверяются при limit=SMALL_PAGE и limit=LARGE_PAGE.
+    Запросы SAVEPOINT и RELEASE SAVEPOINT - это транзакции представлений
+    внутри транзакции теста. При превышении бюджета в сообщении выводится
+    разница между записанными и выполненными запросами.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.baselines_path = QUERY_BASELINES_DIR / f'{connection.vendor}.json'
+        try:
+            cls.baselines = json.loads(cls.baselines_path.read_text())
+        except FileNotFoundError:
+            cls.baselines = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if RECORD_QUERY_BASELINES:
+            QUERY_BASELINES_DIR.mkdir(exist_ok=True)
+            cls.baselines_path.write_text(json.dumps(
+                cls.baselines, ensure_ascii=False, indent=2, sort_keys=True
+            ) + '\n')
+        super().tearDownClass()
+
+    def setUp(self):
+        self.anonymous = APIClient()
+        self.authenticated = APIClient()
+        self.authenticated.force_authenticate(self.reader)
+
+    def request(self, client, method, url, payload=None):
+        response = getattr(client, method)(url, payload, format='json')
+        self.assertLess(
+            response.status_code, 400,
+            f'{method.upper()} {url}: {response.content[:300]!r}'
+        )
+        return response
+
+    def assert_queries(self, client, method, url, queries, payload=None):
+        limits = (SMALL_PAGE, LARGE_PAGE) if '{limit}' in url else (None,)
+        for limit in limits:
+            current_url = url.format(limit=limit, **self.data)
+            with self.subTest(url=current_url):
+                with CaptureQueriesContext(connection) as captured:
+                    self.request(client, method, current_url, payload)
+                self.assert_baseline(
+                    f'{method.upper()} {re.sub(r"[0-9]+", "?", url)}',
+                    [normalize_sql(query['sql']) for query in captured],
+                    queries
+                )
+
+    def assert_baseline(self, key, executed, queries):
+        if RECORD_QUERY_BASELINES:
+            self.baselines[key] = executed
+        if len(executed) == queries:
+            return
+        diff = list(unified_diff(
+            self.baselines.get(key, []), executed, 'записано', 'выполнено',
+            n=1, lineterm=''
+        ))
+        # Без записи или при совпадении с ней выводятся сами запросы.
+        details = '\n'.join(
+            diff if key in self.baselines and diff else executed)
+        self.fail(
+            f'{key}: {len(executed)} запросов вместо {queries}\n{details}')
+
+    def assert_reads(self, client, budgets):
+        for url, queries in budgets:
+            self.assert_queries(client, 'get', url, queries)
+
+    def get_recipe_payload(self):
+        return {
+            'tags': [self.data['tag']],
+            'ingredients': [
+                {'id': self.data['ingredient'], 'amount': 10},
+                {'id': self.data['another_ingredient'], 'amount': 20},
+            ],
+            'image': IMAGE,
+            'name': 'Проверочный рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+
+    def test_anonymous_reads(self):
+        self.assert_reads(self.anonymous, (
+            ('/api/tags/', 1),
+            ('/api/tags/{tag}/', 1),
+            ('/api/ingredients/?name=ing', 1),
+            ('/api/ingredients/{ingredient}/', 1),
+            ('/api/recipes/?limit={limit}', 2),
+            ('/api/recipes/?limit={limit}&ordering=trending', 2),
+            (
+                '/api/recipes/?limit={limit}&ordering=cooking_time'
+                '&cooking_time_max=60&published_after=2000-01-01',
+                2
+            ),
+            ('/api/recipes/{recipe}/', 1),
+            ('/api/recipes/pantry/?limit={limit}&{pantry}&missing=5', 3),
+            ('/api/recipes/{recipe}/similar/?limit={limit}', 5),
+            ('/api/recipes/{recipe}/get-link/', 1),
+            ('/api/users/?limit={limit}', 2),
+        ))
+
+    def test_authenticated_reads(self):
+        self.assert_reads(self.authenticated, (
+            ('/api/recipes/?limit={limit}', 5),
+            ('/api/recipes/?limit={limit}&tags={tag_slug}', 6),
+            ('/api/recipes/?limit={limit}&author={user}', 6),
+            ('/api/recipes/?limit={limit}&is_favorited=1', 5),
+            ('/api/recipes/?limit={limit}&is_in_shopping_cart=1', 5),
+            ('/api/recipes/?limit={limit}&view=card', 4),
+            ('/api/recipes/?ids={recipe_ids}', 4),
+            ('/api/recipes/feed/?limit={limit}', 6),
+            ('/api/recipes/{recipe}/', 4),
+            ('/api/recipes/pantry/?limit={limit}&{pantry}&tags={tag_slug}', 7),
+            ('/api/recipes/{recipe}/similar/?limit={limit}', 8),
+            ('/api/recipes/download_shopping_cart/', 2),
+            ('/api/changes/', 2),
+            ('/api/changes/?since=0', 3),
+            ('/api/users/?limit={limit}', 3),
+            ('/api/users/{user}/', 2),
+            ('/api/users/me/', 1),
+            ('/api/users/subscriptions/?limit={limit}&recipes_limit=3', 4),
+        ))
+
+    def test_relations(self):
+        for url in (
+            '/api/recipes/{recipe}/favorite/',
+            '/api/recipes/{recipe}/shopping_cart/',
+        ):
+            self.assert_queries(self.authenticated, 'post', url, 5)
+            self.assert_queries(self.authenticated, 'delete', url, 4)
+        url = '/api/users/{new_following}/subscribe/'
+        self.assert_queries(self.authenticated, 'post', url, 7)
+        self.assert_queries(self.authenticated, 'delete', url, 5)
+
+    def test_batch_relations(self):
+        payload = {
+            'ids': [int(id) for id in self.data['recipe_ids'].split(',')]}
+        self.assert_queries(
+            self.authenticated, 'post', '/api/recipes/favorite/', 4, payload)
+        self.assert_queries(
+            self.authenticated, 'delete', '/api/recipes/favorite/', 5,
+            payload
+        )
+
+    def test_account_writes(self):
+        # Сохранение профиля пересобирает карточки рецептов автора.
+        password = 'Старый-пароль-1'
+        self.reader.set_password(password)
+        self.reader.save()
+        self.assert_queries(
+            self.anonymous, 'post', '/api/auth/token/login/', 6,
+            {'email': self.reader.email, 'password': password}
+        )
+        self.assert_queries(
+            self.authenticated, 'post', '/api/auth/token/logout/', 1)
+        self.assert_queries(
+            self.authenticated, 'put', '/api/users/me/avatar/', 7,
+            {'avatar': IMAGE}
+        )
+        self.assert_queries(
+            self.authenticated, 'delete', '/api/users/me/avatar/', 7)
+        self.assert_queries(
+            self.authenticated, 'post', '/api/users/set_password/', 7,
+            {'current_password': password, 'new_password': 'Новый-пароль-2'}
+        )
+
+    def test_recipe_writes(self):
+        payload = self.get_recipe_payload()
+        self.assert_queries(
+            self.authenticated, 'post', '/api/recipes/', 23, payload)
+        recipe_id = self.request(
+            self.authenticated, 'post', '/api/recipes/', payload).json()['id']
+        for method, queries in (('patch', 26), ('delete', 5)):
+            self.assert_queries(
+                self.authenticated, method, f'/api/recipes/{recipe_id}/',
+                queries, payload
+            )
+
+
+class RelationTests(TestCase):
+    """Добавление и удаление избранного, списка покупок и подписок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = (
+            User.objects.create(
+                email=f'{username}@foodgram.test', username=username,
+                first_name=username, last_name=username,
+            )
+            for username in ('reader', 'author')
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}',
+                text='Описание', image='recipes/images/recipe.png',
+                cooking_time=10,
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_statuses(self):
+        first, second, _ = self.recipes
+        Favorite.objects.create(user=self.user, recipe=first)
+        missing_id = self.recipes[-1].id + 1
+        response = self.client.post(
+            '/api/recipes/favorite/',
+            {'ids': [first.id, second.id, missing_id, second.id]},
+            format='json'
+        )
+        self.assertEqual(response.json()['results'], [
+            {'id': first.id, 'status': 'already_present'},
+            {'id': second.id, 'status': 'added'},
+            {'id': missing_id, 'status': 'not_found'},
+        ])
+        self.assertEqual(
+            Favorite.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            list(Change.objects.filter(
+                user=self.user, kind=Change.FAVORITE
+            ).values_list('object_id', flat=True)),
+            [first.id, second.id]
+        )
+
+    def test_batch_subscribe_to_self(self):
+        response = self.client.post(
+            '/api/users/subscribe/',
+            {'ids': [self.user.id, self.author.id]}, format='json')
+        self.assertEqual(response.json()['results'], [
+            {'id': self.user.id, 'status': 'not_allowed'},
+            {'id': self.author.id, 'status': 'added'},
+        ])
+        self.assertEqual(
+            list(Subscription.objects.values_list('user', 'following')),
+            [(self.user.id, self.author.id)]
+        )
+
+    def test_hidden_recipe_is_not_added(self):
+        recipe = self.recipes[0]
+        Recipe.objects.filter(id=recipe.id).update(is_hidden=True)
+        for url in (
+            f'/api/recipes/{recipe.id}/favorite/',
+            f'/api/recipes/{recipe.id}/shopping_cart/',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url).status_code, 404)
+        response = self.client.post(
+            '/api/recipes/favorite/', {'ids': [recipe.id]}, format='json')
+        self.assertEqual(
+            response.json()['results'],
+            [{'id': recipe.id, 'status': 'not_found'}]
+        )
+        self.assertFalse(Favorite.objects.exists())
+        self.assertFalse(RecipeInShoppingCart.objects.exists())
+        self.assertFalse(Change.objects.filter(user=self.user).exists())
+
+    def test_inactive_user_is_not_followed(self):
+        User.objects.filter(id=self.author.id).update(is_active=False)
+        response = self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(
+            '/api/users/subscribe/', {'ids': [self.author.id]}, format='json')
+        self.assertEqual(
+            response.json()['results'],
+            [{'id': self.author.id, 'status': 'not_found'}]
+        )
+        self.assertFalse(Subscription.objects.exists())
+        self.assertFalse(Change.objects.filter(user=self.user).exists())
+
+    def test_repeated_add(self):
+        url = f'/api/recipes/{self.recipes[0].id}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        missing_url = f'/api/recipes/{self.recipes[-1].id + 1}/favorite/'
+        self.assertEqual(self.client.post(missing_url).status_code, 404)
+        self.assertEqual(self.client.delete(missing_url).status_code, 404)
+
+
+class RecipeIdsFilterTests(TestCase):
+    """Рецепты по ids возвращаются в порядке запроса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            email='author@foodgram.test', username='author',
+            first_name='author', last_name='author',
+        )
+        cls.recipe_ids = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                image='recipes/images/recipe.png', cooking_time=10 + number,
+            ).id
+            for number in range(3)
+        ]
+
+    def test_ids_order(self):
+        ids = [self.recipe_ids[2], self.recipe_ids[0], self.recipe_ids[1]]
+        response = APIClient().get(
+            f'/api/recipes/?ids={",".join(map(str, ids))}')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data], ids)
+
+    def test_ids_with_ordering_are_rejected(self):
+        response = APIClient().get(
+            f'/api/recipes/?ids={self.recipe_ids[0]}&ordering=cooking_time')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.data)
+
+
+class ConcurrentRelationTests(TransactionTestCase):
+    """Одновременные запросы на добавление и удаление одной связи."""
+    threads = 8
+
+    def setUp(self):
+        self.user, self.author = (
+            User.objects.create(
+                email=f'{username}@foodgram.test', username=username,
+                first_name=username, last_name=username,
+            )
+            for username in ('reader', 'author')
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            image='recipes/images/recipe.png', cooking_time=10,
+        )
+
+    def send_concurrently(self, method, url):
+        """Отправляет запросы из нескольких потоков одновременно."""
+        barrier = Barrier(self.threads)
+
+        def send():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                return getattr(client, method)(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.threads) as executor:
+            futures = [executor.submit(send) for _ in range(self.threads)]
+            return sorted(future.result() for future in futures)
+
+    def assert_single_change(self, url, model, kind):
+        rejected = [400] * (self.threads - 1)
+        self.assertEqual(
+            self.send_concurrently('post', url), [201, *rejected])
+        self.assertEqual(model.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(
+            self.send_concurrently('delete', url), [204, *rejected])
+        self.assertFalse(model.objects.filter(user=self.user).exists())
+        self.assertEqual(
+            list(Change.objects.filter(
+                user=self.user, kind=kind).values_list('deleted', flat=True)),
+            [False, True]
+        )
+
+    def test_favorite(self):
+        self.assert_single_change(
+            f'/api/recipes/{self.recipe.id}/favorite/', Favorite,
+            Change.FAVORITE
+        )
+
+    def test_shopping_cart(self):
+        self.assert_single_change(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/',
+            RecipeInShoppingCart, Change.SHOPPING_CART
+        )
+
+    def test_subscription(self):
+        self.assert_single_change(
+            f'/api/users/{self.author.id}/subscribe/', Subscription,
+            Change.SUBSCRIPTION
+        )
+
+
+class StatelessAuthenticationTests(TestCase):
+    """Подписанные токены: обновление и отзыв."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='reader@foodgram.test', username='reader',
+            first_name='reader', last_name='reader',
+        )
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def authenticate(self, access):
+        return StatelessTokenAuthentication().authenticate(
+            self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {access}'))
+
+    def refresh(self, refresh):
+        return StatelessTokenRefreshView.as_view()(self.factory.post(
+            '/', {'refresh_token': str(refresh)}, format='json'))
+
+    def assert_revoked(self, access, refresh):
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(access)
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+
+    def test_access_token_is_short_lived(self):
+        access, refresh = issue_tokens(self.user)
+        self.assertLessEqual(access['exp'] - access['iat'], 60 * 60)
+        self.assertGreater(refresh['exp'], access['exp'])
+
+    def test_authentication_does_not_query_database(self):
+        access, _ = issue_tokens(self.user)
+        with self.assertNumQueries(0):
+            self.authenticate(access)
+
+    def test_refresh_rotates_tokens(self):
+        access, refresh = issue_tokens(self.user)
+        response = self.refresh(refresh)
+        self.assertEqual(response.status_code, 200)
+        user, _ = self.authenticate(response.data['auth_token'])
+        self.assertEqual(user.id, self.user.id)
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+        self.assertEqual(
+            self.refresh(response.data['refresh_token']).status_code, 200)
+
+    def test_logout_revokes_both_tokens(self):
+        access, refresh = issue_tokens(self.user)
+        user, token = self.authenticate(access)
+        request = self.factory.post('/')
+        force_authenticate(request, user=user, token=token)
+        response = StatelessTokenDestroyView.as_view()(request)
+        self.assertEqual(response.status_code, 204)
+        self.assert_revoked(access, refresh)
+
+    def test_deactivation_revokes_tokens(self):
+        access, refresh = issue_tokens(self.user)
+        self.user.is_active = False
+        self.user.save()
+        self.assert_revoked(access, refresh)
+
+    def test_privilege_and_password_changes_revoke_tokens(self):
+        for field, value in (
+            ('is_staff', True), ('is_superuser', True), ('password', 'new'),
+        ):
+            with self.subTest(field=field):
+                access, refresh = issue_tokens(self.user)
+                user = User.objects.get(id=self.user.id)
+                if field == 'password':
+                    user.set_password(value)
+                else:
+                    setattr(user, field, value)
+                user.save()
+                self.assert_revoked(access, refresh)
+
+    def test_other_changes_keep_tokens(self):
+        access, refresh = issue_tokens(self.user)
+        user = User.objects.get(id=self.user.id)
+        user.first_name = 'Другое'
+        user.save()
+        user.is_staff = True
+        user.save(update_fields=('first_name',))
+        self.authenticate(access)
+        self.assertEqual(self.refresh(refresh).status_code, 200)
+
+    def test_deletion_revokes_tokens(self):
+        access, refresh = issue_tokens(self.user)
+        schedule_deletion((self.user,))
+        self.assert_revoked(access, refresh)
+
+    @override_settings(MEDIA_ROOT=MEDIA_ROOT)
+    @mock.patch.object(
+        UserViewSet, 'authentication_classes',
+        (StatelessTokenAuthentication,)
+    )
+    def test_token_flags_are_not_saved(self):
+        User.objects.filter(id=self.user.id).update(
+            is_staff=True, is_superuser=True)
+        self.user.refresh_from_db()
+        access, _ = issue_tokens(self.user)
+        # Понижение в обход сигналов: токен остается действительным.
+        User.objects.filter(id=self.user.id).update(
+            is_staff=False, is_superuser=False)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        for method, data in (('put', {'avatar': IMAGE}), ('delete', None)):
+            with self.subTest(method=method):
+                response = getattr(client, method)(
+                    '/api/users/me/avatar/', data, format='json')
+                self.assertLess(response.status_code, 300)
+                self.user.refresh_from_db()
+                self.assertFalse(self.user.is_staff)
+                self.assertFalse(self.user.is_superuser)
+
+    def test_new_tokens_after_reactivation(self):
+        self.user.is_active = False
+        self.user.save()
+        self.user.is_active = True
+        self.user.save()
+        access, refresh = issue_tokens(self.user)
+        self.authenticate(access)
+        self.assertEqual(self.refresh(refresh).status_code, 200)
+
+
+class MetricsTests(TestCase):
+    """Адрес метрик закрыт токеном, а ряды помечены процессом."""
+
+    def get(self, authorization=None):
+        headers = (
+            {} if authorization is None
+            else {'HTTP_AUTHORIZATION': authorization}
+        )
+        return metrics_view(APIRequestFactory().get('/metrics', **headers))
+
+    def test_token_is_required(self):
+        self.assertEqual(self.get('Bearer secret').status_code, 403)
+        with mock.patch('api.metrics.METRICS_TOKEN', 'secret'):
+            self.assertEqual(self.get().status_code, 403)
+            self.assertEqual(self.get('Bearer wrong').status_code, 403)
+            self.assertEqual(self.get('Token secret').status_code, 403)
+            self.assertEqual(self.get('Bearer secret').status_code, 200)
+
+    @mock.patch('api.metrics.METRICS_TOKEN', 'secret')
+    def test_series_are_labelled_by_worker(self):
+        metrics = get_registry().setdefault('MetricsTests.view', ViewMetrics())
+        metrics.duration.observe(0.01)
+        metrics.responses[200] += 1
+        body = self.get('Bearer secret').content.decode()
+        worker = f'worker="{socket.gethostname()}:{os.getpid()}"'
+        series = [
+            line for line in body.splitlines()
+            if line and not line.startswith('#')
+        ]
+        self.assertTrue(series)
+        for line in series:
+            self.assertIn(worker, line)
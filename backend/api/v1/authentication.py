@@ -0,0 +1,51 @@
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from users.models import User
+from users.revocation import get_timestamp, is_token_revoked
+
+
+USER_FLAGS = ('is_active', 'is_staff', 'is_superuser',)
+
+
+def issue_tokens(user):
+    """Выпускает токен доступа с флагами пользователя и токен обновления.
+
+    Токен доступа хранит jti своего токена обновления, чтобы выход
+    отзывал оба.
+    """
+    issued_at = get_timestamp()
+    refresh = RefreshToken.for_user(user)
+    refresh['iat'] = issued_at
+    access = AccessToken.for_user(user)
+    access['iat'] = issued_at
+    access['refresh_jti'] = refresh['jti']
+    for flag in USER_FLAGS:
+        access[flag] = getattr(user, flag)
+    return access, refresh
+
+
+class StatelessTokenAuthentication(JWTAuthentication):
+    """Аутентификация по подписанному токену без запросов к таблицам.
+
+    Пользователь собирается из утверждений токена: загружены только id и
+    флаги, остальные поля отложены и читаются из базы при обращении.
+    Отзыв токена проверяется в общем кэше отозванных токенов.
+    """
+
+    def get_user(self, validated_token):
+        if is_token_revoked(validated_token):
+            raise AuthenticationFailed('Токен отозван!', code='token_revoked')
+        if not validated_token.get('is_active', False):
+            raise AuthenticationFailed(
+                'Пользователь неактивен!', code='user_inactive')
+        field_names = ('id',) + USER_FLAGS
+        return User.from_db(
+            DEFAULT_DB_ALIAS,
+            field_names,
+            [validated_token['user_id']] + [
+                validated_token[flag] for flag in USER_FLAGS
+            ],
+        )
@@ -0,0 +1,116 @@
+"""Карточки рецептов: готовое представление для списка и страницы рецепта.
+
+Карточка - вывод FastRecipeReadSerializer без полей, зависящих от
+текущего пользователя, с относительными ссылками на изображения. Когда
+карточки пересобираются, см. recipes.cards; для недостающих карточек при
+чтении данные собираются сериализатором без записи в базу.
+"""
+from .read_serializers import FastRecipeReadSerializer, FastUserSerializer
+from recipes.models import Favorite, Recipe, RecipeCard, RecipeInShoppingCart
+from users.models import Subscription
+
+
+CARD_OMIT = ('is_favorited', 'is_in_shopping_cart', 'author.is_subscribed')
+
+
+def build_card_data(recipes):
+    recipes = FastRecipeReadSerializer.optimize_queryset(
+        recipes, omit=CARD_OMIT)
+    return FastRecipeReadSerializer(recipes, many=True, omit=CARD_OMIT).data
+
+
+def build_cards(recipe_ids):
+    return [
+        RecipeCard(recipe_id=data['id'], data=data)
+        for data in build_card_data(Recipe.objects.filter(id__in=recipe_ids))
+    ]
+
+
+class RecipeCardReadSerializer(FastRecipeReadSerializer):
+    """Чтение рецептов из карточек.
+
+    Страница рецептов читается одним запросом вместе с карточками,
+    отдельными запросами загружаются только отметки текущего пользователя.
+    """
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields=None, omit=None):
+        return queryset.select_related(None).select_related('card').only(
+            'id', 'card__data')
+
+    def prepare(self, instances):
+        self.cards = {}
+        missing = []
+        for recipe in instances:
+            try:
+                self.cards[recipe.id] = recipe.card.data
+            except RecipeCard.DoesNotExist:
+                missing.append(recipe.id)
+        if missing:
+            # Чтение не пишет в базу: недостающие карточки собираются
+            # обычным сериализатором из той же базы, что и страница.
+            self.cards.update(
+                (data['id'], data)
+                for data in build_card_data(Recipe.objects.using(
+                    instances[0]._state.db).filter(id__in=missing))
+            )
+        recipe_ids = list(self.cards)
+
+        self.favorited_ids = set()
+        if self.user is not None and 'is_favorited' in self.selected:
+            self.favorited_ids = set(Favorite.objects.filter(
+                user=self.user, recipe__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+
+        self.in_shopping_cart_ids = set()
+        if self.user is not None and 'is_in_shopping_cart' in self.selected:
+            self.in_shopping_cart_ids = set(
+                RecipeInShoppingCart.objects.filter(
+                    user=self.user, recipe__in=recipe_ids
+                ).values_list('recipe_id', flat=True))
+
+        self.subscribed_ids = set()
+        if 'author' in self.selected:
+            self.author_fields, _ = FastUserSerializer.parse_fields(
+                *self.nested_fields['author'])
+            if self.user is not None and 'is_subscribed' in (
+                self.author_fields
+            ):
+                self.subscribed_ids = set(Subscription.objects.filter(
+                    user=self.user,
+                    following__in={
+                        card['author']['id'] for card in self.cards.values()
+                    }
+                ).values_list('following_id', flat=True))
+
+    def absolute_url(self, url):
+        if url and self.request is not None:
+            return self.request.build_absolute_uri(url)
+        return url
+
+    def get_card_author(self, author):
+        data = {}
+        for name in self.author_fields:
+            if name == 'is_subscribed':
+                data[name] = author['id'] in self.subscribed_ids
+            elif name == 'avatar':
+                data[name] = self.absolute_url(author['avatar'])
+            else:
+                data[name] = author[name]
+        return data
+
+    def to_representation(self, instance):
+        card = self.cards[instance.id]
+        data = {}
+        for name in self.selected:
+            if name == 'is_favorited':
+                data[name] = instance.id in self.favorited_ids
+            elif name == 'is_in_shopping_cart':
+                data[name] = instance.id in self.in_shopping_cart_ids
+            elif name == 'author':
+                data[name] = self.get_card_author(card['author'])
+            elif name == 'image':
+                data[name] = self.absolute_url(card['image'])
+            else:
+                data[name] = card[name]
+        return data
@@ -1,15 +1,33 @@
+from django import forms
+from django.db.models import Case, When
 from django_filters import (
-    AllValuesMultipleFilter, FilterSet, TypedChoiceFilter)
+    BaseInFilter, ChoiceFilter, DateTimeFilter, FilterSet,
+    ModelMultipleChoiceFilter, NumberFilter, TypedChoiceFilter)
 from distutils.util import strtobool
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe
+from foodgram_backend.settings import MAX_BATCH_SIZE
+from recipes.models import Recipe, Tag
 
 
 RECIPE_FILTER_CHOICES = (
     (0, False),
     (1, True)
 )
+# Каждая сортировка совпадает с индексом рецептов или обратна ему.
+RECIPE_ORDERINGS = {
+    'newest': ('-pub_date', 'name'),
+    'oldest': ('pub_date', '-name'),
+    'cooking_time': ('cooking_time', 'name'),
+    '-cooking_time': ('-cooking_time', '-name'),
+    'popular': ('-popularity', '-pub_date'),
+    'trending': ('-trending', '-pub_date'),
+}
+
+
+class IntegerInFilter(BaseInFilter, NumberFilter):
+    field_class = forms.IntegerField
 
 
 class RecipeFilter(FilterSet):
@@ -23,7 +41,24 @@ class RecipeFilter(FilterSet):
         method='filter_is_in_shopping_cart',
         coerce=strtobool
     )
-    tags = AllValuesMultipleFilter(field_name='tags__slug',)
+    tags = ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+    )
+    ids = IntegerInFilter(method='filter_ids')
+    cooking_time_min = NumberFilter(
+        field_name='cooking_time', lookup_expr='gte')
+    cooking_time_max = NumberFilter(
+        field_name='cooking_time', lookup_expr='lte')
+    published_after = DateTimeFilter(
+        field_name='pub_date', lookup_expr='gte')
+    published_before = DateTimeFilter(
+        field_name='pub_date', lookup_expr='lt')
+    ordering = ChoiceFilter(
+        choices=tuple((ordering, ordering) for ordering in RECIPE_ORDERINGS),
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
@@ -39,6 +74,28 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
+    def filter_ordering(self, queryset, name, value):
+        # Рецепты по ids возвращаются в порядке запроса, сортировка
+        # молча его бы заменила.
+        if self.form.cleaned_data.get('ids'):
+            raise ValidationError(
+                {'ordering': 'Сортировка недоступна вместе с ids!'})
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
+    def filter_ids(self, queryset, name, value):
+        if len(value) > MAX_BATCH_SIZE:
+            raise ValidationError(
+                {'ids': f'Можно запросить не больше {MAX_BATCH_SIZE} '
+                        'рецептов за раз!'}
+            )
+        ids = list(dict.fromkeys(value))
+        return queryset.filter(id__in=ids).order_by(
+            Case(*(
+                When(id=recipe_id, then=position)
+                for position, recipe_id in enumerate(ids)
+            ))
+        )
+
 
 class IngredientNameSearchFilter(SearchFilter):
     search_param = 'name'
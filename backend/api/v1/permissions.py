@@ -8,5 +8,5 @@ class IsAdminAuthorOrReadOnly(permissions.IsAuthenticatedOrReadOnly):
         return (
             request.method in permissions.SAFE_METHODS
             or request.user.is_superuser
-            or obj.author == request.user
+            or obj.author_id == request.user.id
         )
@@ -0,0 +1,423 @@
+from collections import defaultdict
+from operator import attrgetter, itemgetter
+
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+
+from recipes.models import (
+    Favorite, IngredientInRecipe, Recipe, RecipeInShoppingCart
+)
+from users.models import Subscription
+
+
+class FastReadSerializer:
+    """Базовый сериализатор только для чтения.
+
+    Собирает обычные словари вместо дерева полей DRF. Способ получения
+    каждого поля определяется один раз при создании класса: метод
+    get_<поле>, если он объявлен, иначе getter_factory (attrgetter для
+    объектов моделей, itemgetter для строк из values()). Связанные данные
+    для всей страницы загружаются пакетно в prepare().
+
+    Параметры fields и omit ограничивают набор полей ответа, вложенные
+    поля указываются через точку: author.id.
+    """
+    fields = ()
+    query_fields = {}
+    nested = {}
+    select_related = ()
+    presets = {}
+    getter_factory = attrgetter
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        getters = []
+        for name in cls.fields:
+            method = getattr(cls, f'get_{name}', None)
+            if method is not None:
+                getters.append((name, method, True))
+            else:
+                getters.append((name, cls.getter_factory(name), False))
+        cls._getters = tuple(getters)
+
+    def __init__(
+        self, instance=None, many=False, context=None,
+        fields=None, omit=None, **kwargs
+    ):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+        self.request = self.context.get('request')
+        user = getattr(self.request, 'user', None)
+        self.user = user if user and user.is_authenticated else None
+        self.selected, self.nested_fields = self.parse_fields(fields, omit)
+        self.getters = tuple(
+            getter for getter in self._getters if getter[0] in self.selected
+        )
+
+    @classmethod
+    def parse_fields(cls, fields=None, omit=None):
+        """Возвращает выбранные поля и выбор полей для вложенных."""
+        nested_fields = defaultdict(list)
+        nested_omit = defaultdict(list)
+        if fields is None:
+            selected = set(cls.fields)
+        else:
+            selected = set()
+            for field in fields:
+                name, _, rest = field.partition('.')
+                selected.add(name)
+                if rest:
+                    nested_fields[name].append(rest)
+        for field in omit or ():
+            name, _, rest = field.partition('.')
+            if rest:
+                nested_omit[name].append(rest)
+            else:
+                selected.discard(name)
+        selected = tuple(name for name in cls.fields if name in selected)
+        nested = {
+            name: (nested_fields.get(name), nested_omit.get(name))
+            for name in cls.nested if name in selected
+        }
+        return selected, nested
+
+    @classmethod
+    def get_query_fields(cls, fields=None, omit=None, prefix=''):
+        """Возвращает поля модели, нужные для выбранных полей ответа."""
+        selected, nested = cls.parse_fields(fields, omit)
+        query_fields = []
+        for name in selected:
+            query_fields.extend(
+                prefix + field for field in cls.query_fields.get(name, ()))
+            if name in cls.select_related:
+                query_fields.extend(cls.nested[name].get_query_fields(
+                    *nested[name], prefix=f'{prefix}{name}__'))
+        return query_fields
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields=None, omit=None):
+        """Откладывает ненужные колонки и связи."""
+        selected, _ = cls.parse_fields(fields, omit)
+        queryset = queryset.select_related(None)
+        related = [name for name in cls.select_related if name in selected]
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*cls.get_query_fields(fields, omit))
+
+    def get_nested(self, name):
+        fields, omit = self.nested_fields[name]
+        return self.nested[name](
+            context=self.context, fields=fields, omit=omit)
+
+    def prepare(self, instances):
+        """Пакетно загружает данные, общие для всех объектов страницы."""
+
+    def image_url(self, name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        if self.request is not None:
+            return self.request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, instance):
+        return {
+            name: getter(self, instance) if is_method else getter(instance)
+            for name, getter, is_method in self.getters
+        }
+
+    @property
+    def data(self):
+        if self.many:
+            instances = list(self.instance)
+            self.prepare(instances)
+            return [
+                self.to_representation(instance) for instance in instances
+            ]
+        self.prepare((self.instance,))
+        return self.to_representation(self.instance)
+
+
+class FastUserSerializer(FastReadSerializer):
+    """Быстрый аналог UserSerializer."""
+    fields = (
+        'email',
+        'id',
+        'username',
+        'first_name',
+        'last_name',
+        'is_subscribed',
+        'avatar',
+    )
+    query_fields = {
+        'email': ('email',),
+        'id': ('id',),
+        'username': ('username',),
+        'first_name': ('first_name',),
+        'last_name': ('last_name',),
+        'avatar': ('avatar',),
+    }
+
+    def prepare(self, instances):
+        self.subscribed_ids = set()
+        if self.user is not None and 'is_subscribed' in self.selected:
+            self.subscribed_ids = set(
+                Subscription.objects.filter(
+                    user=self.user,
+                    following__in=[user.id for user in instances]
+                ).values_list('following_id', flat=True)
+            )
+
+    def get_is_subscribed(self, obj):
+        return obj.id in self.subscribed_ids
+
+    def get_avatar(self, obj):
+        return self.image_url(obj.avatar.name)
+
+
+class FastRecipeShortInformation(FastReadSerializer):
+    """Быстрый аналог RecipeShortInformation для строк из values()."""
+    fields = (
+        'id',
+        'name',
+        'image',
+        'cooking_time',
+    )
+    query_fields = {
+        'id': ('id',),
+        'name': ('name',),
+        'image': ('image',),
+        'cooking_time': ('cooking_time',),
+    }
+    getter_factory = itemgetter
+
+    def get_image(self, row):
+        return self.image_url(row['image'])
+
+
+class FastRecipeReadSerializer(FastReadSerializer):
+    """Быстрый аналог RecipeReadSerializer.
+
+    Автор берется из select_related, теги, ингредиенты и отметки
+    текущего пользователя загружаются одним запросом на страницу.
+    """
+    fields = (
+        'id',
+        'tags',
+        'author',
+        'ingredients',
+        'is_favorited',
+        'is_in_shopping_cart',
+        'name',
+        'image',
+        'text',
+        'cooking_time',
+    )
+    query_fields = {
+        'id': ('id',),
+        'author': ('author',),
+        'name': ('name',),
+        'image': ('image',),
+        'text': ('text',),
+        'cooking_time': ('cooking_time',),
+    }
+    nested = {'author': FastUserSerializer}
+    select_related = ('author',)
+    presets = {
+        'card': (
+            'id',
+            'tags',
+            'author.id',
+            'author.first_name',
+            'author.last_name',
+            'author.avatar',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'name',
+            'image',
+            'cooking_time',
+        ),
+    }
+
+    def prepare(self, instances):
+        recipe_ids = [recipe.id for recipe in instances]
+
+        self.tags = defaultdict(list)
+        if 'tags' in self.selected:
+            for row in Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values(
+                'recipe_id', 'tag_id', 'tag__name', 'tag__slug'
+            ).order_by('tag__name'):
+                self.tags[row['recipe_id']].append({
+                    'id': row['tag_id'],
+                    'name': row['tag__name'],
+                    'slug': row['tag__slug'],
+                })
+
+        self.ingredients = defaultdict(list)
+        if 'ingredients' in self.selected:
+            for row in IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values(
+                'recipe_id',
+                'name_id',
+                'name__name',
+                'name__measurement_unit',
+                'amount',
+            ).order_by('name__name', 'name__measurement_unit'):
+                self.ingredients[row['recipe_id']].append({
+                    'id': row['name_id'],
+                    'name': row['name__name'],
+                    'measurement_unit': row['name__measurement_unit'],
+                    'amount': row['amount'],
+                })
+
+        self.favorited_ids = set()
+        if self.user is not None and 'is_favorited' in self.selected:
+            self.favorited_ids = set(Favorite.objects.filter(
+                user=self.user, recipe__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+
+        self.in_shopping_cart_ids = set()
+        if self.user is not None and 'is_in_shopping_cart' in self.selected:
+            self.in_shopping_cart_ids = set(
+                RecipeInShoppingCart.objects.filter(
+                    user=self.user, recipe__in=recipe_ids
+                ).values_list('recipe_id', flat=True))
+
+        if 'author' in self.selected:
+            authors = {
+                recipe.author_id: recipe.author for recipe in instances}
+            self.author_serializer = self.get_nested('author')
+            self.author_serializer.prepare(authors.values())
+
+    def get_tags(self, obj):
+        return self.tags.get(obj.id, [])
+
+    def get_author(self, obj):
+        return self.author_serializer.to_representation(obj.author)
+
+    def get_ingredients(self, obj):
+        return self.ingredients.get(obj.id, [])
+
+    def get_is_favorited(self, obj):
+        return obj.id in self.favorited_ids
+
+    def get_is_in_shopping_cart(self, obj):
+        return obj.id in self.in_shopping_cart_ids
+
+    def get_image(self, obj):
+        return self.image_url(obj.image.name)
+
+
+class FastSubscriptionSerializer(FastUserSerializer):
+    """Быстрый аналог SubscriptionSerializer.
+
+    Рецепты всех авторов страницы загружаются одним запросом, при
+    recipes_limit - только первые recipes_limit рецептов каждого автора.
+    Ссылки на изображения в них относительные, как и в
+    SubscriptionSerializer.
+    """
+    fields = FastUserSerializer.fields + ('recipes', 'recipes_count',)
+    nested = {'recipes': FastRecipeShortInformation}
+
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit:
+            try:
+                return max(int(recipes_limit), 0)
+            except ValueError:
+                pass
+        return None
+
+    def prepare(self, instances):
+        super().prepare(instances)
+        author_ids = [user.id for user in instances]
+        self.recipes = defaultdict(list)
+        self.recipes_count = {}
+        self.recipes_limit = self.get_recipes_limit()
+
+        if 'recipes' in self.selected and self.recipes_limit != 0:
+            fields, omit = self.nested_fields['recipes']
+            self.recipe_serializer = FastRecipeShortInformation(
+                fields=fields, omit=omit)
+            query_fields = FastRecipeShortInformation.get_query_fields(
+                fields, omit)
+            if self.recipes_limit is not None:
+                self.load_first_recipes(author_ids, query_fields)
+                return
+            for row in Recipe.objects.filter(
+                author__in=author_ids
+            ).values('author_id', *query_fields):
+                self.recipes[row.pop('author_id')].append(row)
+            self.recipes_count = {
+                author_id: len(recipes)
+                for author_id, recipes in self.recipes.items()
+            }
+        elif 'recipes_count' in self.selected:
+            self.recipes_count = dict(
+                Recipe.objects.filter(
+                    author__in=author_ids
+                ).order_by().values('author_id').annotate(
+                    count=Count('id')
+                ).values_list('author_id', 'count')
+            )
+
+    def load_first_recipes(self, author_ids, query_fields):
+        """Загружает первые recipes_limit рецептов каждого автора.
+
+        Номер рецепта у автора и число рецептов автора считаются оконными
+        функциями, из базы читаются только выводимые рецепты.
+        """
+        partition = [F('author_id')]
+        queryset = Recipe.objects.filter(author__in=author_ids).annotate(
+            recipe_number=Window(
+                RowNumber(),
+                partition_by=partition,
+                order_by=[
+                    F(name[1:]).desc() if name.startswith('-')
+                    else F(name).asc()
+                    for name in Recipe._meta.ordering
+                ]
+            ),
+            author_recipes=Window(Count('id'), partition_by=partition),
+        ).order_by().values(
+            'author_id', 'author_recipes', 'recipe_number', *query_fields)
+        connection = connections[queryset.db]
+        columns = ', '.join(
+            f'recipe.{connection.ops.quote_name(column)}'
+            for column in (
+                'author_id', 'author_recipes',
+                *(Recipe._meta.get_field(name).column
+                  for name in query_fields)
+            )
+        )
+        # Django 3.2 не фильтрует по оконным функциям, поэтому запрос
+        # оборачивается в подзапрос.
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {columns} FROM ({sql}) recipe '
+                'WHERE recipe.recipe_number <= %s '
+                'ORDER BY recipe.author_id, recipe.recipe_number',
+                (*params, self.recipes_limit)
+            )
+            for author_id, count, *values in cursor.fetchall():
+                self.recipes_count[author_id] = count
+                self.recipes[author_id].append(dict(zip(query_fields, values)))
+
+    def get_recipes(self, obj):
+        recipes = self.recipes.get(obj.id, [])
+        if self.recipes_limit is not None:
+            recipes = recipes[:self.recipes_limit]
+        return [
+            self.recipe_serializer.to_representation(recipe)
+            for recipe in recipes
+        ]
+
+    def get_recipes_count(self, obj):
+        return self.recipes_count.get(obj.id, 0)
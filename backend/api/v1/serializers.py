@@ -2,15 +2,50 @@ from django.db import transaction
 from django.db.models import F
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
 
+from foodgram_backend.settings import MAX_BATCH_SIZE, PANTRY_MAX_MISSING
+from recipes.cards import defer_card_updates
 from recipes.models import (
     Favorite, Ingredient, IngredientInRecipe,
     Recipe, RecipeInShoppingCart, Tag
 )
+from recipes.similar import index_recipe
 from users.models import Subscription, User
 
 
+class BatchIdsSerializer(serializers.Serializer):
+    """Сериализатор списка идентификаторов для пакетных операций."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE,
+    )
+
+
+class PantrySearchSerializer(serializers.Serializer):
+    """Сериализатор параметров поиска рецептов по ингредиентам."""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE,
+    )
+    missing = serializers.IntegerField(
+        min_value=0,
+        max_value=PANTRY_MAX_MISSING,
+        default=0,
+    )
+
+
+class ChangesSerializer(serializers.Serializer):
+    """Сериализатор параметров запроса журнала изменений."""
+    since = serializers.IntegerField(min_value=0, required=False)
+
+
+class TokenRefreshSerializer(serializers.Serializer):
+    """Сериализатор запроса новой пары токенов."""
+    refresh_token = serializers.CharField()
+
+
 class AvatarSerializer(serializers.ModelSerializer):
     """Сериализатор для добавления аватара."""
     avatar = Base64ImageField()
@@ -201,13 +236,20 @@ class RecipeSerializer(serializers.ModelSerializer):
             all_ingredients.append(ingredient_in_recipe)
         IngredientInRecipe.objects.bulk_create(all_ingredients)
 
+    @staticmethod
+    def get_ingredient_ids(ingredients):
+        return [ingredient.get('name').id for ingredient in ingredients]
+
     @transaction.atomic
     def create(self, validated_data):
         self.is_valid(raise_exception=True)
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(**validated_data)
-        self.add_tags_and_ingredients_to_recipe(recipe, tags, ingredients)
+        with defer_card_updates():
+            recipe = Recipe.objects.create(**validated_data)
+            self.add_tags_and_ingredients_to_recipe(recipe, tags, ingredients)
+        index_recipe(
+            recipe.id, self.get_ingredient_ids(ingredients), created=True)
         return recipe
 
     @transaction.atomic
@@ -215,10 +257,13 @@ class RecipeSerializer(serializers.ModelSerializer):
         self.is_valid(raise_exception=True)
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        instance.tags.clear()
-        instance.ingredients.clear()
-        self.add_tags_and_ingredients_to_recipe(instance, tags, ingredients)
-        super().update(instance, validated_data)
+        with defer_card_updates():
+            instance.tags.clear()
+            instance.ingredients.clear()
+            self.add_tags_and_ingredients_to_recipe(
+                instance, tags, ingredients)
+            super().update(instance, validated_data)
+        index_recipe(instance.id, self.get_ingredient_ids(ingredients))
         return instance
 
     def to_representation(self, instance):
@@ -244,42 +289,6 @@ class RecipeShortInformation(serializers.ModelSerializer):
         )
 
 
-class RecipeInShoppingCartSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model = RecipeInShoppingCart
-        fields = ('user', 'recipe',)
-        validators = (
-            UniqueTogetherValidator(
-                queryset=RecipeInShoppingCart.objects.all(),
-                fields=('user', 'recipe'),
-                message='Этот рецепт уже добавлен в список покупок!'
-            ),
-        )
-
-    def to_representation(self, instance):
-        return RecipeShortInformation(
-            instance.recipe, context=self.context).data
-
-
-class FavoriteSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model = Favorite
-        fields = ('user', 'recipe',)
-        validators = (
-            UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe'),
-                message='Этот рецепт уже добавлен в избранное!'
-            ),
-        )
-
-    def to_representation(self, instance):
-        return RecipeShortInformation(
-            instance.recipe, context=self.context).data
-
-
 class SubscriptionSerializer(UserSerializer):
     "Сериализатор для модели Subscription."
     recipes = serializers.SerializerMethodField()
@@ -308,27 +317,3 @@ class SubscriptionSerializer(UserSerializer):
 
     def get_recipes_count(self, obj):
         return Recipe.objects.filter(author=obj).count()
-
-
-class FollowSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model = Subscription
-        fields = ('user', 'following',)
-        validators = (
-            UniqueTogetherValidator(
-                queryset=Subscription.objects.all(),
-                fields=('user', 'following'),
-                message='Такая подписка уже существует!'
-            ),
-        )
-
-    def validate_following(self, value):
-        if self.context.get('request').user == value:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя!')
-        return value
-
-    def to_representation(self, instance):
-        return SubscriptionSerializer(
-            instance.following, context=self.context).data
@@ -1,12 +1,17 @@
-from django.urls import include, path
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
+    ChangesView,
     IngredientViewSet,
     RecipeViewSet,
+    StatelessTokenCreateView,
+    StatelessTokenDestroyView,
+    StatelessTokenRefreshView,
     TagViewSet,
     UserViewSet
 )
+from foodgram_backend.settings import STATELESS_AUTH
 
 
 v1_router = DefaultRouter()
@@ -16,7 +21,29 @@ v1_router.register('recipes', RecipeViewSet, basename='recipes')
 v1_router.register('users', UserViewSet, basename='users')
 
 
+auth_urls = 'djoser.urls.authtoken'
+if STATELESS_AUTH:
+    auth_urls = [
+        re_path(
+            r'^token/login/?$',
+            StatelessTokenCreateView.as_view(),
+            name='login'
+        ),
+        re_path(
+            r'^token/refresh/?$',
+            StatelessTokenRefreshView.as_view(),
+            name='refresh'
+        ),
+        re_path(
+            r'^token/logout/?$',
+            StatelessTokenDestroyView.as_view(),
+            name='logout'
+        ),
+    ]
+
+
 urlpatterns = [
     path('', include(v1_router.urls)),
-    path('auth/', include('djoser.urls.authtoken')),
+    path('auth/', include(auth_urls)),
+    path('changes/', ChangesView.as_view(), name='changes'),
 ]
@@ -1,41 +1,107 @@
 from django_filters.rest_framework import DjangoFilterBackend
+from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.db.models import Sum
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
-from djoser.views import UserViewSet
+from djoser.views import TokenCreateView, TokenDestroyView, UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (
+    SAFE_METHODS, AllowAny, IsAuthenticated
+)
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed, InvalidToken, TokenError
+)
+from rest_framework_simplejwt.tokens import RefreshToken
 
+from .authentication import StatelessTokenAuthentication, issue_tokens
+from .cards import RecipeCardReadSerializer
 from .filters import IngredientNameSearchFilter, RecipeFilter
 from .pagination import PageLimitPagination
 from .permissions import IsAdminAuthorOrReadOnly
+from .read_serializers import (
+    FastSubscriptionSerializer,
+    FastUserSerializer
+)
 from .serializers import (
     AvatarSerializer,
-    FavoriteSerializer,
-    FollowSerializer,
+    ChangesSerializer,
     IngredientSerializer,
-    RecipeInShoppingCartSerializer,
+    PantrySearchSerializer,
     RecipeSerializer,
     RecipeReadSerializer,
-    SubscriptionSerializer,
+    RecipeShortInformation,
     TagSerializer,
+    TokenRefreshSerializer,
     UserSerializer
 )
-from .viewsets import ListRetrieveViewSet
-from foodgram_backend.settings import PREFIX_SHORT_LINK_RECIPE
+from .viewsets import (
+    UserRelationMixin, ListRetrieveViewSet, ReplicaReadMixin,
+    SparseFieldsMixin
+)
+from foodgram_backend.settings import (
+    CHANGES_PAGE_SIZE, MAX_SIMILAR_RECIPES_LIMIT, PANTRY_MAX_RESULTS,
+    PREFIX_SHORT_LINK_RECIPE, SIMILAR_RECIPES_LIMIT
+)
+from recipes.batches import chunked
+from recipes.changes import get_changes, get_initial_cursor, is_cursor_expired
+from recipes.deletion import schedule_deletion
+from recipes.feed import backfill, get_feed, remove_authors, schedule
 from recipes.models import (
     Favorite, Ingredient, Recipe, RecipeInShoppingCart, Tag)
+from recipes.pantry import pantry_index
+from recipes.similar import get_similar_ids
 from users.models import Subscription, User
+from users.revocation import is_token_revoked, revoke_token
 
 
-class UserViewSet(UserViewSet):
+class UserViewSet(
+    ReplicaReadMixin, UserRelationMixin, SparseFieldsMixin, UserViewSet
+):
     """Вьюсет для модели User."""
-    queryset = User.objects.all()
+    queryset = User.objects.filter(is_active=True)
     serializer_class = UserSerializer
     pagination_class = PageLimitPagination
     lookup_field = 'id'
+    sparse_fields_actions = ('list', 'retrieve', 'subscriptions',)
+    replica_actions = ('list', 'retrieve', 'subscriptions',)
+    # Действия, сохраняющие самого пользователя. Пользователь из токена
+    # собран из утверждений, и его save() записал бы в базу флаги из
+    # токена, поэтому для них пользователь загружается заново.
+    self_update_actions = (
+        'me', 'update_avatar', 'delete_avatar', 'set_password',
+        'set_username',
+    )
+
+    def get_serializer_class(self):
+        if self.request.method in SAFE_METHODS:
+            if self.action in ('list', 'retrieve',):
+                return FastUserSerializer
+            if self.action == 'subscriptions':
+                return FastSubscriptionSerializer
+        return super().get_serializer_class()
+
+    def get_instance(self):
+        user = self.request.user
+        if user.get_deferred_fields():
+            return User.objects.get(pk=user.pk)
+        return user
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method not in SAFE_METHODS
+            and self.action in self.self_update_actions
+            and request.user.is_authenticated
+        ):
+            request.user = self.get_instance()
+
+    def perform_destroy(self, instance):
+        # Токены пользователя отзываются при скрытии.
+        schedule_deletion((instance,))
 
     @action(
         detail=False,
@@ -67,14 +133,12 @@ class UserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
-        followings = User.objects.filter(
-            followings__user=request.user).prefetch_related('recipes')
-        pages = self.paginate_queryset(followings)
-        serializer = SubscriptionSerializer(
-            pages,
-            context={'request': request},
-            many=True
+        followings = FastSubscriptionSerializer.optimize_queryset(
+            User.objects.filter(followings__user=request.user),
+            *self.get_sparse_fields(FastSubscriptionSerializer)
         )
+        pages = self.paginate_queryset(followings)
+        serializer = self.get_serializer(pages, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(
@@ -82,27 +146,49 @@ class UserViewSet(UserViewSet):
         methods=('post',),
     )
     def subscribe(self, request, id=None):
-        subscription_data = {
-            'user': request.user.id,
-            'following': get_object_or_404(User, id=id).id
-        }
-        serializer = FollowSerializer(
-            data=subscription_data,
-            context={'request': request},
+        if self.get_relation_target_id() == request.user.id:
+            raise ValidationError(
+                {'following': ['Нельзя подписаться на самого себя!']})
+        following = self.add_relation(
+            request, Subscription, 'following', self.get_queryset(),
+            'Такая подписка уже существует!'
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        schedule(backfill, request.user.id, (following.id,))
+        serializer = FastSubscriptionSerializer(
+            following, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def unsubscribe(self, request, id=None):
-        deleted_subscriptions, _ = Subscription.objects.filter(
-            user=request.user,
-            following=get_object_or_404(User, id=id)
-        ).delete()
-        if not deleted_subscriptions:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        response = self.delete_relation(
+            request, Subscription, 'following', self.get_queryset())
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            remove_authors(request.user.id, (self.get_relation_target_id(),))
+        return response
+
+    @action(
+        detail=False,
+        methods=('post',),
+        url_path='subscribe',
+    )
+    def subscribe_batch(self, request):
+        response = self.add_batch(
+            request, Subscription, 'following', self.get_queryset(),
+            forbidden=(request.user.id,)
+        )
+        schedule(
+            backfill, request.user.id,
+            self.get_ids_with_status(response, 'added')
+        )
+        return response
+
+    @subscribe_batch.mapping.delete
+    def unsubscribe_batch(self, request):
+        response = self.delete_batch(
+            request, Subscription, 'following', self.get_queryset())
+        remove_authors(
+            request.user.id, self.get_ids_with_status(response, 'deleted'))
+        return response
 
 
 class TagViewSet(ListRetrieveViewSet):
@@ -119,43 +205,51 @@ class IngredientViewSet(ListRetrieveViewSet):
     search_fields = ('^name',)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ReplicaReadMixin, UserRelationMixin, SparseFieldsMixin,
+    viewsets.ModelViewSet
+):
     """Вьюсет для модели Recipe."""
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.select_related('author')
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     pagination_class = PageLimitPagination
     permission_classes = (IsAdminAuthorOrReadOnly,)
     http_method_names = ('get', 'post', 'patch', 'delete',)
     lookup_field = 'id'
+    sparse_fields_actions = (
+        'list', 'retrieve', 'feed', 'similar', 'pantry',)
+    replica_actions = (
+        'list', 'retrieve', 'feed', 'similar', 'pantry',
+        'download_shopping_cart',)
 
     def get_recipe(self):
-        return get_object_or_404(Recipe, id=self.kwargs.get('id'))
-
-    def add_recipe_to_model(self, request, serializer):
-        data = {
-            'user': request.user.id,
-            'recipe': self.get_recipe().id
-        }
-        serializer = serializer(
-            data=data,
-            context={'request': request},
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        return get_object_or_404(Recipe, id=self.get_relation_target_id())
+
+    def paginate_queryset(self, queryset):
+        if self.action == 'list' and self.request.query_params.get('ids'):
+            return None
+        return super().paginate_queryset(queryset)
+
+    def perform_destroy(self, instance):
+        schedule_deletion((instance,))
+        pantry_index.remove_recipe(instance.id)
+
+    def add_recipe_to_model(self, request, model, message):
+        recipe = self.add_relation(
+            request, model, 'recipe', self.get_queryset(), message)
+        serializer = RecipeShortInformation(
+            recipe, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete_recipe_from_model(self, request, model):
-        deleted_recipes, _ = model.objects.filter(
-            user=request.user,
-            recipe=self.get_recipe()
-        ).delete()
-        if not deleted_recipes:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.delete_relation(
+            request, model, 'recipe', self.get_queryset())
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve',):
+        if self.action in ('list', 'retrieve', 'feed', 'similar', 'pantry',):
+            if self.request.method in SAFE_METHODS:
+                return RecipeCardReadSerializer
             return RecipeReadSerializer
         return RecipeSerializer
 
@@ -178,12 +272,101 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def shopping_cart(self, request, id=None):
         return self.add_recipe_to_model(
-            request, RecipeInShoppingCartSerializer)
+            request, RecipeInShoppingCart,
+            'Этот рецепт уже добавлен в список покупок!'
+        )
 
     @shopping_cart.mapping.delete
     def delete_recipe_from_shopping_cart(self, request, id=None):
         return self.delete_recipe_from_model(request, RecipeInShoppingCart)
 
+    @action(
+        detail=False,
+        methods=('post',),
+        url_path='shopping_cart',
+    )
+    def shopping_cart_batch(self, request):
+        return self.add_batch(
+            request, RecipeInShoppingCart, 'recipe', self.get_queryset())
+
+    @shopping_cart_batch.mapping.delete
+    def delete_recipes_from_shopping_cart(self, request):
+        return self.delete_batch(
+            request, RecipeInShoppingCart, 'recipe', self.get_queryset())
+
+    def get_recipes_in_order(self, recipe_ids):
+        recipes = RecipeCardReadSerializer.optimize_queryset(
+            Recipe.objects.filter(id__in=recipe_ids),
+            *self.get_sparse_fields(RecipeCardReadSerializer)
+        ).in_bulk()
+        return [
+            recipes[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ]
+
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        page = self.paginate_queryset(get_feed(request.user))
+        serializer = self.get_serializer(
+            self.get_recipes_in_order([recipe_id for recipe_id, _ in page]),
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=True,
+        methods=('get',),
+    )
+    def similar(self, request, id=None):
+        try:
+            limit = min(
+                int(request.query_params.get('limit', SIMILAR_RECIPES_LIMIT)),
+                MAX_SIMILAR_RECIPES_LIMIT
+            )
+        except ValueError:
+            raise ValidationError({'limit': 'Укажите целое число!'})
+        recipe_id = self.get_recipe().id
+        recipe_ids = get_similar_ids(recipe_id, limit) if limit > 0 else []
+        serializer = self.get_serializer(
+            self.get_recipes_in_order(recipe_ids), many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(
+        detail=False,
+        methods=('get',),
+    )
+    def pantry(self, request):
+        params = PantrySearchSerializer(data={
+            'ingredients': request.query_params.getlist('ingredients'),
+            'missing': request.query_params.get('missing', 0),
+        })
+        params.is_valid(raise_exception=True)
+        candidates = pantry_index.search(
+            params.validated_data['ingredients'],
+            params.validated_data['missing']
+        )
+        # Фильтры RecipeFilter, скрытые и удаленные рецепты отсекаются в
+        # базе, а ограничение числа результатов - после них.
+        recipe_ids = []
+        for batch in chunked(candidates, PANTRY_MAX_RESULTS):
+            matching_ids = set(self.filter_queryset(
+                Recipe.objects.filter(id__in=batch)
+            ).values_list('id', flat=True))
+            recipe_ids.extend(
+                recipe_id for recipe_id in batch
+                if recipe_id in matching_ids
+            )
+            if len(recipe_ids) >= PANTRY_MAX_RESULTS:
+                break
+        page = self.paginate_queryset(recipe_ids[:PANTRY_MAX_RESULTS])
+        serializer = self.get_serializer(
+            self.get_recipes_in_order(page), many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=False,
         methods=('get',),
@@ -215,12 +398,117 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=('post',),
     )
     def favorite(self, request, id=None):
-        return self.add_recipe_to_model(request, FavoriteSerializer)
+        return self.add_recipe_to_model(
+            request, Favorite, 'Этот рецепт уже добавлен в избранное!')
 
     @favorite.mapping.delete
     def delete_recipe_from_favorite(self, request, id=None):
         return self.delete_recipe_from_model(request, Favorite)
 
+    @action(
+        detail=False,
+        methods=('post',),
+        url_path='favorite',
+    )
+    def favorite_batch(self, request):
+        return self.add_batch(request, Favorite, 'recipe', self.get_queryset())
+
+    @favorite_batch.mapping.delete
+    def delete_recipes_from_favorite(self, request):
+        return self.delete_batch(
+            request, Favorite, 'recipe', self.get_queryset())
+
+
+class ChangesView(APIView):
+    """События изменений рецептов, избранного, списка покупок и подписок.
+
+    Без параметра since возвращает только курсор, с которого нужно начать
+    синхронизацию после полной загрузки данных.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        params = ChangesSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        since = params.validated_data.get('since')
+        if since is None:
+            return Response(
+                {'cursor': get_initial_cursor(), 'has_more': False,
+                 'results': []},
+                status=status.HTTP_200_OK
+            )
+        cursor, has_more, results = get_changes(
+            request.user, since, CHANGES_PAGE_SIZE)
+        # Проверка после чтения: записи могли удалить во время запроса.
+        if is_cursor_expired(since):
+            return Response(
+                {'since': ['Изменения после этого курсора удалены, '
+                           'загрузите данные заново!']},
+                status=status.HTTP_410_GONE
+            )
+        return Response(
+            {'cursor': cursor, 'has_more': has_more, 'results': results},
+            status=status.HTTP_200_OK
+        )
+
+
+class StatelessTokenCreateView(TokenCreateView):
+    """Выдача подписанного токена доступа без записи в базу."""
+
+    def _action(self, serializer):
+        user = serializer.user
+        user_logged_in.send(
+            sender=user.__class__, request=self.request, user=user)
+        access, refresh = issue_tokens(user)
+        return Response(
+            {'auth_token': str(access), 'refresh_token': str(refresh)},
+            status=status.HTTP_200_OK
+        )
+
+
+class StatelessTokenRefreshView(APIView):
+    """Новая пара токенов по токену обновления.
+
+    Активность пользователя проверяется по базе, старый токен обновления
+    отзывается.
+    """
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    def get_authenticate_header(self, request):
+        return StatelessTokenAuthentication().authenticate_header(request)
+
+    def post(self, request):
+        serializer = TokenRefreshSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            refresh = RefreshToken(serializer.validated_data['refresh_token'])
+        except TokenError as error:
+            raise InvalidToken(error.args[0])
+        if is_token_revoked(refresh):
+            raise AuthenticationFailed('Токен отозван!', code='token_revoked')
+        user = User.objects.filter(
+            id=refresh['user_id'], is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed(
+                'Пользователь неактивен!', code='user_inactive')
+        revoke_token(refresh)
+        access, refresh = issue_tokens(user)
+        return Response(
+            {'auth_token': str(access), 'refresh_token': str(refresh)},
+            status=status.HTTP_200_OK
+        )
+
+
+class StatelessTokenDestroyView(TokenDestroyView):
+    """Отзыв подписанного токена доступа и его токена обновления."""
+
+    def post(self, request):
+        revoke_token(request.auth)
+        user_logged_out.send(
+            sender=request.user.__class__, request=request, user=request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 def redirect_to_recipe(request, short_link):
     recipe_id = get_object_or_404(Recipe, short_link=short_link).id
@@ -1,9 +1,275 @@
-from rest_framework import mixins, viewsets
+from django.db import connections, router, transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework import mixins, serializers, status, viewsets
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .read_serializers import FastReadSerializer
+from .serializers import BatchIdsSerializer
+from api.replicas import pin_to_primary, read_from_replica, replica_alias
+from recipes.changes import record_changes
+
+
+class ReplicaReadMixin:
+    """Чтение с реплики для безопасных запросов из replica_actions.
+
+    Пользователь аутентифицируется по основной базе. После изменяющего
+    запроса его чтения на время окна идут на основную базу.
+    """
+    replica_actions = ('list', 'retrieve',)
+    replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method in SAFE_METHODS
+            and self.action in self.replica_actions
+        ):
+            self.replica_token = read_from_replica(request.user)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self.replica_token is not None:
+            replica_alias.reset(self.replica_token)
+            self.replica_token = None
+        elif request.method not in SAFE_METHODS:
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
 
 
 class ListRetrieveViewSet(
+    ReplicaReadMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     viewsets.GenericViewSet
 ):
     pass
+
+
+class SparseFieldsMixin:
+    """Выбор полей ответа параметрами fields, omit и view.
+
+    Работает с быстрыми сериализаторами чтения: пропущенные поля не
+    попадают ни в ответ, ни в SQL-запросы.
+    """
+    sparse_fields_actions = ('list', 'retrieve',)
+
+    @staticmethod
+    def split_query_param(value):
+        if not value:
+            return None
+        return [field.strip() for field in value.split(',') if field.strip()]
+
+    def get_sparse_fields(self, serializer_class):
+        params = self.request.query_params
+        fields = self.split_query_param(params.get('fields'))
+        preset = params.get('view')
+        if fields is None and preset:
+            if preset not in serializer_class.presets:
+                raise serializers.ValidationError(
+                    {'view': f'Неизвестное представление "{preset}"!'})
+            fields = serializer_class.presets[preset]
+        return fields, self.split_query_param(params.get('omit'))
+
+    def uses_sparse_fields(self, serializer_class):
+        return (
+            self.action in self.sparse_fields_actions
+            and self.request.method in SAFE_METHODS
+            and issubclass(serializer_class, FastReadSerializer)
+        )
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if self.uses_sparse_fields(serializer_class):
+            queryset = serializer_class.optimize_queryset(
+                queryset, *self.get_sparse_fields(serializer_class))
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        if self.uses_sparse_fields(serializer_class):
+            kwargs['fields'], kwargs['omit'] = self.get_sparse_fields(
+                serializer_class)
+        return super().get_serializer(*args, **kwargs)
+
+
+class UserRelationMixin:
+    """Добавление и удаление связей пользователя с объектами.
+
+    Связь - модель с полями user и field, например Favorite с полем
+    recipe. Целевые объекты берутся из queryset targets, например только
+    видимые рецепты или активные пользователи. Добавление выполняется
+    одним INSERT ... ON CONFLICT ... RETURNING, удаление - одним
+    DELETE ... RETURNING. В ответе пакетных операций для каждого
+    идентификатора указывается статус. Оба запроса идут в обход сигналов,
+    поэтому изменения связей записываются в журнал изменений здесь, в той
+    же транзакции.
+    """
+
+    def get_relation_target_id(self):
+        try:
+            return int(self.kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+
+    @staticmethod
+    def insert_relations(model, user, field, targets, target_ids):
+        """Добавляет связи с объектами из targets.
+
+        Возвращает id объектов, связи с которыми были добавлены.
+        """
+        connection = connections[router.db_for_write(model)]
+        quote_name = connection.ops.quote_name
+        target_model = targets.model
+        target_pk = quote_name(target_model._meta.pk.column)
+        field_column = quote_name(model._meta.get_field(field).column)
+        # Остальные поля связи, например дата добавления, заполняются
+        # значениями по умолчанию.
+        defaults = [
+            model_field for model_field in model._meta.concrete_fields
+            if model_field.has_default()
+            and model_field.name not in ('user', field)
+        ]
+        columns = ''.join(
+            f', {quote_name(model_field.column)}' for model_field in defaults)
+        found_sql, found_params = targets.filter(
+            pk__in=target_ids
+        ).order_by().values('pk').query.get_compiler(
+            connection=connection).as_sql()
+        sql = (
+            f'INSERT INTO {quote_name(model._meta.db_table)} '
+            f'({quote_name(model._meta.get_field("user").column)}, '
+            f'{field_column}{columns}) '
+            f'SELECT %s, {target_pk}{", %s" * len(defaults)} '
+            f'FROM {quote_name(target_model._meta.db_table)} '
+            f'WHERE {target_pk} IN ({found_sql}) '
+            f'ON CONFLICT DO NOTHING RETURNING {field_column}'
+        )
+        values = [
+            model_field.get_db_prep_save(
+                model_field.get_default(), connection)
+            for model_field in defaults
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (user.id, *values, *found_params))
+            return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def delete_relations(model, user, field, target_ids):
+        """Удаляет связи и возвращает id объектов, связи с которыми удалены.
+        """
+        connection = connections[router.db_for_write(model)]
+        quote_name = connection.ops.quote_name
+        field_column = quote_name(model._meta.get_field(field).column)
+        sql = (
+            f'DELETE FROM {quote_name(model._meta.db_table)} '
+            f'WHERE {quote_name(model._meta.get_field("user").column)} = %s '
+            f'AND {field_column} IN ({", ".join(["%s"] * len(target_ids))}) '
+            f'RETURNING {field_column}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (user.id, *target_ids))
+            return [row[0] for row in cursor.fetchall()]
+
+    def add_relation(self, request, model, field, targets, message):
+        """Добавляет связь и возвращает целевой объект.
+
+        Объект ищется до записи: со скрытым рецептом или неактивным
+        пользователем связь не создается.
+        """
+        target = get_object_or_404(targets, id=self.get_relation_target_id())
+        with transaction.atomic(using=router.db_for_write(model)):
+            inserted = self.insert_relations(
+                model, request.user, field, targets, (target.id,))
+            record_changes(model, inserted, request.user.id)
+        if not inserted:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [message]})
+        return target
+
+    def delete_relation(self, request, model, field, targets):
+        target_id = self.get_relation_target_id()
+        with transaction.atomic(using=router.db_for_write(model)):
+            deleted = self.delete_relations(
+                model, request.user, field, (target_id,))
+            record_changes(model, deleted, request.user.id, deleted=True)
+        if not deleted:
+            get_object_or_404(targets, id=target_id)
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def get_batch_ids(request):
+        serializer = BatchIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['ids']))
+
+    @staticmethod
+    def get_ids_with_status(response, item_status):
+        return [
+            item['id'] for item in response.data['results']
+            if item['status'] == item_status
+        ]
+
+    @staticmethod
+    def get_existing_ids(targets, ids):
+        return set(targets.filter(id__in=ids).values_list('id', flat=True))
+
+    def add_batch(self, request, model, field, targets, forbidden=()):
+        """Добавляет связи пакетом одним INSERT ... RETURNING.
+
+        Статус каждого идентификатора определяется по добавленным строкам,
+        поэтому параллельные запросы не приводят к неверным статусам.
+        """
+        ids = self.get_batch_ids(request)
+        allowed_ids = [
+            object_id for object_id in ids if object_id not in forbidden]
+        added_ids = set()
+        if allowed_ids:
+            with transaction.atomic(using=router.db_for_write(model)):
+                added_ids = set(self.insert_relations(
+                    model, request.user, field, targets, allowed_ids))
+                record_changes(
+                    model, sorted(added_ids), request.user.id)
+        found_ids = added_ids | self.get_existing_ids(targets, [
+            object_id for object_id in ids if object_id not in added_ids
+        ])
+
+        results = []
+        for object_id in ids:
+            if object_id not in found_ids:
+                item_status = 'not_found'
+            elif object_id in forbidden:
+                item_status = 'not_allowed'
+            elif object_id in added_ids:
+                item_status = 'added'
+            else:
+                item_status = 'already_present'
+            results.append({'id': object_id, 'status': item_status})
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    def delete_batch(self, request, model, field, targets):
+        ids = self.get_batch_ids(request)
+        found_ids = self.get_existing_ids(targets, ids)
+        present_ids = set()
+        if found_ids:
+            with transaction.atomic(using=router.db_for_write(model)):
+                present_ids = set(self.delete_relations(
+                    model, request.user, field, sorted(found_ids)))
+                record_changes(
+                    model, sorted(present_ids), request.user.id,
+                    deleted=True
+                )
+
+        results = []
+        for object_id in ids:
+            if object_id not in found_ids:
+                item_status = 'not_found'
+            elif object_id in present_ids:
+                item_status = 'deleted'
+            else:
+                item_status = 'not_present'
+            results.append({'id': object_id, 'status': item_status})
+        return Response({'results': results}, status=status.HTTP_200_OK)
@@ -0,0 +1,109 @@
+"""Бэкенд PostgreSQL с проверкой постоянных соединений и пулом.
+
+Постоянное соединение (CONN_MAX_AGE) перед первым запросом к базе в
+очередном HTTP-запросе проверяется запросом SELECT 1 и при ошибке
+открывается заново, поэтому перезапуск базы или обрыв соединения не
+приводит к ошибке запроса. При DB_POOL_SIZE больше нуля потоки воркера
+берут соединения из общего пула и возвращают их в конце запроса.
+"""
+from functools import partial
+
+from django.db.backends.postgresql import base
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from .pool import get_pool, get_stats
+from foodgram_backend.settings import (
+    DB_CONN_HEALTH_CHECKS, DB_CONN_MAX_AGE, DB_POOL_SIZE, DB_POOL_TIMEOUT
+)
+
+
+Database = base.Database
+
+
+def is_usable(connection):
+    if connection.closed:
+        return False
+    if not DB_CONN_HEALTH_CHECKS:
+        return True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+def reset(connection):
+    """Откатывает незавершенную транзакцию перед возвратом в пул."""
+    if connection.closed:
+        return False
+    try:
+        if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connection_stats = get_stats(self.alias)
+        self.health_check_done = False
+        self.pool = None
+
+    def get_new_connection(self, conn_params):
+        if not DB_POOL_SIZE:
+            self.connection_stats.add('connects')
+            self.connection_stats.add('checkouts')
+            return super().get_new_connection(conn_params)
+        self.pool = get_pool(
+            self.alias, conn_params,
+            is_usable=is_usable,
+            reset=reset,
+            size=DB_POOL_SIZE,
+            max_age=DB_CONN_MAX_AGE,
+            timeout=DB_POOL_TIMEOUT,
+        )
+        connection = self.pool.checkout(
+            partial(super().get_new_connection, conn_params))
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            self.pool.checkin(self.connection)
+
+    def connect(self):
+        # Новое соединение не проверяется: connect сам вызывает
+        # ensure_connection до включения автокоммита.
+        self.health_check_done = True
+        super().connect()
+
+    def close_if_unusable_or_obsolete(self):
+        # Вызывается в начале и в конце HTTP-запроса и сама обращается к
+        # ensure_connection, проверка выполняется позже, при первом
+        # запросе к базе.
+        self.health_check_done = True
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and not self.health_check_done
+            and not self.in_atomic_block
+        ):
+            self.health_check_done = True
+            if DB_CONN_HEALTH_CHECKS and not self.is_usable():
+                self.connection_stats.add('reconnects')
+                self.close()
+            else:
+                self.connection_stats.add('checkouts')
+        super().ensure_connection()
@@ -0,0 +1,186 @@
+"""Пул соединений с базой для воркеров с потоками и статистика соединений.
+
+Соединение выдается запросу из пула и возвращается в него при закрытии.
+Перед выдачей проверяется возраст соединения и его работоспособность,
+старые и сломанные соединения заменяются новыми. Если все DB_POOL_SIZE
+соединений заняты, поток ждет освобождения не дольше DB_POOL_TIMEOUT
+секунд.
+"""
+import threading
+from collections import deque
+from time import monotonic
+
+from django.db import OperationalError
+
+
+_stats = {}
+_pools = {}
+_lock = threading.Lock()
+
+
+class ConnectionStats:
+    """Счетчики соединений одной базы в текущем процессе."""
+    COUNTERS = (
+        'connects', 'checkouts', 'waits', 'wait_seconds', 'reconnects',
+        'expired',
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = []
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+
+    def add(self, name, value=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def idle(self):
+        return sum(len(pool.idle) for pool in self.pools)
+
+    @property
+    def in_use(self):
+        return sum(pool.total - len(pool.idle) for pool in self.pools)
+
+
+def get_stats(alias):
+    with _lock:
+        if alias not in _stats:
+            _stats[alias] = ConnectionStats()
+        return _stats[alias]
+
+
+def get_connection_stats():
+    return dict(_stats)
+
+
+def close_connection(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class Waiter:
+    """Поток, ожидающий соединение или свободное место в пуле."""
+    __slots__ = ('event', 'connection')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.connection = None
+
+
+class ConnectionPool:
+    """Пул соединений одной базы.
+
+    Освободившееся соединение передается ожидающим потокам по очереди,
+    поэтому поток, только что вернувший соединение, не может забрать его
+    снова раньше тех, кто ждет дольше.
+    """
+
+    def __init__(self, is_usable, reset, size, max_age, timeout, stats):
+        self.is_usable = is_usable
+        self.reset = reset
+        self.size = size
+        self.max_age = max_age
+        self.timeout = timeout
+        self.stats = stats
+        self.idle = deque()
+        self.waiters = deque()
+        self.created_at = {}
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def checkout(self, connect):
+        """Выдает свободное соединение или открывает новое через connect."""
+        waiter = None
+        with self.lock:
+            if self.idle:
+                # Последнее возвращенное соединение - самое "теплое".
+                connection = self.idle.pop()
+            elif self.total < self.size:
+                connection = None
+                self.total += 1
+            else:
+                waiter = Waiter()
+                self.waiters.append(waiter)
+        if waiter is not None:
+            self.stats.add('waits')
+            started = monotonic()
+            if not waiter.event.wait(self.timeout):
+                with self.lock:
+                    if waiter in self.waiters:
+                        self.waiters.remove(waiter)
+                        raise OperationalError(
+                            f'Нет свободного соединения с базой за '
+                            f'{self.timeout} с'
+                        )
+            self.stats.add('wait_seconds', monotonic() - started)
+            connection = waiter.connection
+        self.stats.add('checkouts')
+        if connection is not None:
+            if monotonic() - self.created_at[connection] >= self.max_age:
+                self.stats.add('expired')
+                self.discard(connection)
+                connection = None
+            elif not self.is_usable(connection):
+                self.stats.add('reconnects')
+                self.discard(connection)
+                connection = None
+        if connection is None:
+            try:
+                connection = connect()
+            except Exception:
+                self.hand_over(None)
+                raise
+            self.created_at[connection] = monotonic()
+            self.stats.add('connects')
+        return connection
+
+    def checkin(self, connection):
+        if not self.reset(connection):
+            self.discard(connection)
+            connection = None
+        self.hand_over(connection)
+
+    def hand_over(self, connection):
+        """Отдает соединение или место в пуле (None) первому ожидающему."""
+        with self.lock:
+            if self.waiters:
+                waiter = self.waiters.popleft()
+                waiter.connection = connection
+                waiter.event.set()
+            elif connection is not None:
+                self.idle.append(connection)
+            else:
+                self.total -= 1
+
+    def discard(self, connection):
+        self.created_at.pop(connection, None)
+        close_connection(connection)
+
+    def close_idle(self):
+        with self.lock:
+            connections = list(self.idle)
+            self.idle.clear()
+            self.total -= len(connections)
+        for connection in connections:
+            self.discard(connection)
+
+
+def get_pool(alias, params, **kwargs):
+    """Возвращает пул базы alias для параметров подключения params."""
+    key = (alias, repr(sorted(params.items())))
+    stats = get_stats(alias)
+    with _lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(stats=stats, **kwargs)
+            stats.pools.append(_pools[key])
+        return _pools[key]
+
+
+def close_pools():
+    """Закрывает свободные соединения, например перед удалением базы."""
+    for pool in list(_pools.values()):
+        pool.close_idle()
@@ -1,4 +1,5 @@
 import os
+import sys
 from datetime import timedelta
 from pathlib import Path
 
@@ -18,6 +19,46 @@ DEBUG = os.getenv('DEBUG', 'False') == 'True'
 
 BD_IS_SQLITE = os.getenv('BD_IS_SQLITE', 'False') == 'True'
 
+SQLITE_TUNED = os.getenv('SQLITE_TUNED', 'True') == 'True'
+
+STATELESS_AUTH = os.getenv('STATELESS_AUTH', 'False') == 'True'
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+
+# Метрики отдаются только с заголовком Authorization: Bearer <токен>.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 0.1))
+
+# Тесты не запускают фоновые задачи: задача, пережившая тест, писала бы
+# уже не в тестовую базу.
+TESTING = sys.argv[1:2] == ['test']
+
+FEED_BACKGROUND = (
+    not TESTING and os.getenv('FEED_BACKGROUND', 'True') == 'True')
+
+FEED_POPULAR_AUTHOR_FOLLOWERS = int(
+    os.getenv('FEED_POPULAR_AUTHOR_FOLLOWERS', 10000))
+
+DELETION_BACKGROUND = (
+    not TESTING and os.getenv('DELETION_BACKGROUND', 'True') == 'True')
+
+# Реплики только для чтения: файлы SQLite или хосты Postgres через запятую.
+DB_REPLICAS = [
+    name.strip() for name in os.getenv('DB_REPLICAS', '').split(',')
+    if name.strip()
+]
+
+REPLICA_READ_YOUR_WRITES_SECONDS = int(
+    os.getenv('REPLICA_READ_YOUR_WRITES_SECONDS', 10))
+
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+# Размер пула соединений на процесс, 0 - без пула.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0))
+
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '*').split(', ')
 
 
@@ -47,6 +88,9 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'api.metrics.RequestMetricsMiddleware')
+
 ROOT_URLCONF = 'foodgram_backend.urls'
 
 TEMPLATES = [
@@ -71,22 +115,66 @@ WSGI_APPLICATION = 'foodgram_backend.wsgi.application'
 if BD_IS_SQLITE:
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
+            'ENGINE': (
+                'foodgram_backend.sqlite3' if SQLITE_TUNED
+                else 'django.db.backends.sqlite3'
+            ),
             'NAME': 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            # Тестовая база в файле: общую базу в памяти потоки блокируют
+            # целиком, не дожидаясь busy_timeout.
+            'TEST': {'NAME': 'test_db.sqlite3'},
         }
     }
 else:
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'foodgram_backend.postgresql',
             'NAME': os.getenv('POSTGRES_DB', 'django'),
             'USER': os.getenv('POSTGRES_USER', 'django'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
             'HOST': os.getenv('DB_HOST', ''),
-            'PORT': os.getenv('DB_PORT', 5432)
+            'PORT': os.getenv('DB_PORT', 5432),
+            # Соединения пула живут DB_CONN_MAX_AGE в самом пуле.
+            'CONN_MAX_AGE': 0 if DB_POOL_SIZE else DB_CONN_MAX_AGE,
         }
     }
 
+for number, name in enumerate(DB_REPLICAS, 1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'NAME' if BD_IS_SQLITE else 'HOST': name,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Отзыв токенов проверяется на каждом запросе, поэтому кэш хранится в
+    # памяти. LocMemCache виден только своему процессу: при нескольких
+    # процессах или серверах нужен общий кэш - Docker Compose запускает
+    # для него memcached.
+    'revoked_tokens': {
+        'BACKEND': os.getenv(
+            'REVOKED_TOKENS_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv(
+            'REVOKED_TOKENS_CACHE_LOCATION', 'revoked_tokens'),
+    },
+    'recent_writes': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'RECENT_WRITES_DIR', '/tmp/foodgram/recent_writes'),
+    },
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -132,15 +220,85 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.v1.authentication.StatelessTokenAuthentication'
+        if STATELESS_AUTH
+        else 'rest_framework.authentication.TokenAuthentication',
     ],
 }
 
 PAGE_SIZE = 6
 
+MAX_BATCH_SIZE = 100
+
+FEED_BACKFILL_SIZE = 100
+
+FEED_POPULAR_AUTHORS_CACHE_SECONDS = 5 * 60
+
+SIMILAR_RECIPES_LIMIT = 6
+
+MAX_SIMILAR_RECIPES_LIMIT = 50
+
+SIMILAR_CANDIDATES_LIMIT = 200
+
+SIMILAR_BUCKET_LIMIT = 500
+
+PANTRY_INDEX_REBUILD_SECONDS = 10 * 60
+
+PANTRY_MAX_RESULTS = 1000
+
+PANTRY_MAX_MISSING = 5
+
+TRENDING_HALF_LIFE_HOURS = 24
+
+TRENDING_WINDOW_DAYS = 14
+
+TRENDING_FAVORITE_WEIGHT = 1
+
+TRENDING_SHOPPING_CART_WEIGHT = 0.5
+
+CHANGES_PAGE_SIZE = 500
+
+CHANGES_CURSOR_LAG_SECONDS = 60
+
+CHANGES_RETENTION_DAYS = 30
+
+ADMIN_COUNT_LIMIT = 10000
+
+CSV_EXPORT_CHUNK_SIZE = 2000
+
+DELETION_BATCH_SIZE = 1000
+
+DELETION_MAX_ATTEMPTS = 5
+
+DELETION_RETRY_SECONDS = 60
+
+DB_POOL_TIMEOUT = 10
+
+# busy_timeout задается первым, чтобы остальные параметры ждали блокировку.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}
+
+SQLITE_LOCK_RETRIES = 5
+
+SQLITE_LOCK_RETRY_DELAY = 0.05
+
+SQLITE_OPTIMIZE_INTERVAL = 60 * 60
+
+ACCESS_TOKEN_LIFETIME = timedelta(
+    minutes=int(os.getenv('ACCESS_TOKEN_LIFETIME_MINUTES', 15)))
+
+REFRESH_TOKEN_LIFETIME = timedelta(
+    days=int(os.getenv('REFRESH_TOKEN_LIFETIME_DAYS', 14)))
+
 SIMPLE_JWT = {
-    'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
-    'AUTH_HEADER_TYPES': ('Bearer',),
+    'ACCESS_TOKEN_LIFETIME': ACCESS_TOKEN_LIFETIME,
+    'REFRESH_TOKEN_LIFETIME': REFRESH_TOKEN_LIFETIME,
+    'AUTH_HEADER_TYPES': ('Bearer', 'Token',),
 }
 
 DJOSER = {
@@ -0,0 +1,84 @@
+"""Бэкенд SQLite, настроенный на одновременные запросы.
+
+При подключении задаются SQLITE_PRAGMAS: журнал WAL позволяет читать во
+время записи, synchronous=NORMAL в режиме WAL не нарушает целостность
+базы при сбое, mmap и увеличенный кэш ускоряют чтение. Транзакции
+начинаются с BEGIN IMMEDIATE: блокировка записи берется сразу, и
+конкурирующие записи ждут busy_timeout, а не падают с "database is
+locked" при повышении блокировки чтения до записи. Если база занята
+дольше busy_timeout, начало транзакции или отдельный запрос вне
+транзакции повторяется с экспоненциальной задержкой. Раз в
+SQLITE_OPTIMIZE_INTERVAL секунд при закрытии соединения выполняется
+PRAGMA optimize.
+"""
+import random
+from time import monotonic, sleep
+
+from django.db.backends.sqlite3 import base
+
+from foodgram_backend.settings import (
+    SQLITE_LOCK_RETRIES, SQLITE_LOCK_RETRY_DELAY, SQLITE_OPTIMIZE_INTERVAL,
+    SQLITE_PRAGMAS
+)
+
+
+Database = base.Database
+
+
+def is_locked(error):
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_if_locked(operation, *args):
+    """Выполняет операцию, повторяя ее, пока база занята записью."""
+    for attempt in range(SQLITE_LOCK_RETRIES):
+        try:
+            return operation(*args)
+        except Database.OperationalError as error:
+            if not is_locked(error):
+                raise
+        sleep(
+            SQLITE_LOCK_RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5))
+    return operation(*args)
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    """Повторяет запросы вне транзакции: неудачный запрос не менял базу."""
+
+    def execute(self, query, params=None):
+        if self.connection.in_transaction:
+            return super().execute(query, params)
+        return retry_if_locked(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        if self.connection.in_transaction:
+            return super().executemany(query, param_list)
+        return retry_if_locked(super().executemany, query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Общее для процесса время последнего PRAGMA optimize.
+    optimized_at = monotonic()
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in SQLITE_PRAGMAS.items():
+            retry_if_locked(connection.execute, f'PRAGMA {name} = {value}')
+        return connection
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=SQLiteCursorWrapper)
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
+
+    def _close(self):
+        if (
+            self.connection is not None
+            and monotonic() - self.optimized_at >= SQLITE_OPTIMIZE_INTERVAL
+        ):
+            type(self).optimized_at = monotonic()
+            with self.wrap_database_errors:
+                self.connection.execute('PRAGMA optimize')
+        super()._close()
@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import include, path, re_path
 
+from api.metrics import metrics_view
 from api.v1.views import redirect_to_recipe
-from foodgram_backend.settings import PREFIX_SHORT_LINK_RECIPE
+from foodgram_backend.settings import (
+    METRICS_ENABLED, PREFIX_SHORT_LINK_RECIPE
+)
 
 
 urlpatterns = [
@@ -13,3 +16,6 @@ urlpatterns = [
         redirect_to_recipe
     ),
 ]
+
+if METRICS_ENABLED:
+    urlpatterns.append(path('metrics', metrics_view))
@@ -1,12 +1,19 @@
 from django.contrib import admin
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 from .models import (
-    Favorite, Ingredient, IngredientInRecipe,
+    DeletionTask, Favorite, Ingredient, IngredientInRecipe,
     Recipe, RecipeInShoppingCart, Tag
 )
+from .cards import defer_card_updates, refresh_cards
+from .csv_export import CsvExportAdminMixin
+from .deletion import BackgroundDeletionAdminMixin
+from .paginator import CappedCountAdminMixin
+from .similar import defer_similar_updates, reindex_recipes
 
 
-class TagAdmin(admin.ModelAdmin):
+class TagAdmin(CappedCountAdminMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'name',
@@ -18,7 +25,9 @@ class TagAdmin(admin.ModelAdmin):
     )
 
 
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(
+    CsvExportAdminMixin, CappedCountAdminMixin, admin.ModelAdmin
+):
     list_display = (
         'name',
         'measurement_unit',
@@ -27,65 +36,149 @@ class IngredientAdmin(admin.ModelAdmin):
         'measurement_unit',
     )
     search_fields = ('name',)
+    csv_export_fields = (
+        ('id', 'id'),
+        ('name', 'Название'),
+        ('measurement_unit', 'Единица измерения'),
+    )
 
 
 class IngredientInRecipeInline(admin.TabularInline):
     model = IngredientInRecipe
+    autocomplete_fields = ('name',)
     min_num = 1
     extra = 0
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('name')
+
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(
+    BackgroundDeletionAdminMixin, CsvExportAdminMixin, CappedCountAdminMixin,
+    admin.ModelAdmin
+):
     inlines = (IngredientInRecipeInline,)
     list_display = (
         'name',
         'author',
         'count_is_favorited',
     )
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)
     search_fields = ('author__username', 'name',)
     list_filter = ('tags',)
+    csv_export_fields = (
+        ('id', 'id'),
+        ('name', 'Название'),
+        ('author__username', 'Автор'),
+        ('author__email', 'Почта автора'),
+        ('cooking_time', 'Время приготовления'),
+        ('pub_date', 'Дата публикации'),
+        ('favorites_count', 'Добавлений в избранное'),
+        ('popularity', 'Популярность'),
+    )
+
+    def get_queryset(self, request):
+        favorites_count = Favorite.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            count=Count('id')
+        ).values('count')
+        # Подзапрос выполняется только для строк страницы, в отличие от
+        # Count с JOIN, который группирует всю таблицу. Автор нужен для
+        # __str__ рецепта, в том числе в подсказках автодополнения.
+        return super().get_queryset(request).select_related(
+            'author'
+        ).annotate(favorites_count=Coalesce(
+            Subquery(favorites_count, output_field=IntegerField()), 0))
 
     @admin.display(description="Количество добавлений в избранное")
     def count_is_favorited(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        # Карточка собирается после сохранения тегов и ингредиентов,
+        # в том числе удаленных из формы.
+        with defer_card_updates(), defer_similar_updates():
+            super().save_related(request, form, formsets, change)
+            refresh_cards((form.instance.id,))
+            reindex_recipes((form.instance.id,))
 
 
-class IngredientInRecipeAdmin(admin.ModelAdmin):
+class IngredientInRecipeAdmin(CappedCountAdminMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'name',
         'recipe',
         'amount',
     )
+    # Внешние ключи не редактируются в списке: каждая строка выводила бы
+    # список всех ингредиентов и рецептов.
     list_editable = (
-        'name',
-        'recipe',
         'amount',
     )
+    list_select_related = ('name', 'recipe__author',)
+    autocomplete_fields = ('name', 'recipe',)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_cards((obj.recipe_id,))
+        reindex_recipes((obj.recipe_id,))
 
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        refresh_cards(recipe_ids)
+        reindex_recipes(sorted(set(recipe_ids)))
 
-class FavoriteAdmin(admin.ModelAdmin):
+
+class FavoriteAdmin(
+    CsvExportAdminMixin, CappedCountAdminMixin, admin.ModelAdmin
+):
     list_display = (
         'id',
         'user',
         'recipe',
     )
-    list_editable = (
-        'user',
-        'recipe',
+    list_select_related = ('user', 'recipe__author',)
+    autocomplete_fields = ('user', 'recipe',)
+    csv_export_fields = (
+        ('id', 'id'),
+        ('user__username', 'Пользователь'),
+        ('user__email', 'Почта пользователя'),
+        ('recipe_id', 'id рецепта'),
+        ('recipe__name', 'Рецепт'),
+        ('added_at', 'Дата добавления'),
     )
 
 
-class RecipeInShoppingCartAdmin(admin.ModelAdmin):
+class RecipeInShoppingCartAdmin(CappedCountAdminMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'user',
         'recipe',
     )
-    list_editable = (
-        'user',
-        'recipe',
+    list_select_related = ('user', 'recipe__author',)
+    autocomplete_fields = ('user', 'recipe',)
+
+
+class DeletionTaskAdmin(CappedCountAdminMixin, admin.ModelAdmin):
+    list_display = (
+        'model',
+        'object_id',
+        'deleted_rows',
+        'attempts',
+        'created_at',
+        'finished_at',
     )
+    list_filter = ('model',)
+    readonly_fields = ('error',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 admin.site.register(Tag, TagAdmin)
@@ -94,3 +187,4 @@ admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(IngredientInRecipe, IngredientInRecipeAdmin)
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(RecipeInShoppingCart, RecipeInShoppingCartAdmin)
+admin.site.register(DeletionTask, DeletionTaskAdmin)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from . import cards, changes, feed, similar
+        cards.connect_signals()
+        changes.connect_signals()
+        feed.connect_signals()
+        similar.connect_signals()
@@ -0,0 +1,47 @@
+"""Разбиение потоков строк на пакеты и пакетная вставка."""
+import csv
+import io
+from itertools import islice
+
+from django.db import connection
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class RowWriter:
+    """Пакетная вставка строк: COPY для PostgreSQL, executemany иначе."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.use_copy = connection.vendor == 'postgresql'
+
+    def write(self, model, fields, rows):
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = ', '.join(
+            connection.ops.quote_name(model._meta.get_field(field).column)
+            for field in fields
+        )
+        if self.use_copy:
+            sql = f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)'
+        else:
+            placeholders = ', '.join(['%s'] * len(fields))
+            sql = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
+        count = 0
+        with connection.cursor() as cursor:
+            for batch in chunked(rows, self.batch_size):
+                if self.use_copy:
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(batch)
+                    buffer.seek(0)
+                    cursor.copy_expert(sql, buffer)
+                else:
+                    cursor.executemany(sql, batch)
+                count += len(batch)
+        return count
@@ -0,0 +1,136 @@
+"""Обновление карточек рецептов (RecipeCard).
+
+Карточки пересобираются в той же транзакции, что и изменение рецепта, его
+тегов и ингредиентов, а также самих тегов, ингредиентов и профиля автора.
+Данные карточки собирает функция, которую при запуске регистрирует
+приложение api: карточка - это представление рецепта в API. Команды
+загрузки данных пишут в обход сигналов и вызывают refresh_cards сами;
+после других изменений в обход моделей карточки пересобирает команда
+rebuild_recipe_cards.
+"""
+from contextlib import contextmanager
+from threading import local
+
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+
+from recipes.batches import chunked
+from recipes.models import (
+    Ingredient, IngredientInRecipe, Recipe, RecipeCard, Tag
+)
+from users.models import User
+
+
+# Поля профиля, которые входят в карточку.
+CARD_USER_FIELDS = {'email', 'username', 'first_name', 'last_name', 'avatar'}
+CARD_BATCH_SIZE = 500
+
+state = local()
+card_builders = []
+
+
+def register_card_builder(build_cards):
+    """Регистрирует функцию, которая по id рецептов возвращает RecipeCard."""
+    card_builders[:] = [build_cards]
+
+
+def refresh_cards(recipe_ids):
+    """Пересобирает карточки рецептов.
+
+    Внутри defer_card_updates() рецепты только запоминаются, и карточки
+    пересобираются один раз при выходе из блока.
+    """
+    pending = getattr(state, 'pending', None)
+    if pending is not None:
+        pending.update(recipe_ids)
+        return
+    if not card_builders:
+        return
+    build_cards, = card_builders
+    for batch in chunked(recipe_ids, CARD_BATCH_SIZE):
+        with transaction.atomic(savepoint=False):
+            RecipeCard.objects.filter(recipe_id__in=batch).delete()
+            RecipeCard.objects.bulk_create(build_cards(batch))
+
+
+@contextmanager
+def defer_card_updates():
+    if getattr(state, 'pending', None) is not None:
+        yield
+        return
+    state.pending = set()
+    try:
+        yield
+        recipe_ids = state.pending
+    finally:
+        state.pending = None
+    refresh_cards(sorted(recipe_ids))
+
+
+def get_related_recipe_ids(instance):
+    if isinstance(instance, Tag):
+        return Recipe.tags.through.objects.filter(
+            tag=instance).values_list('recipe_id', flat=True)
+    return IngredientInRecipe.objects.filter(
+        name=instance).values_list('recipe_id', flat=True).distinct()
+
+
+def recipe_saved(sender, instance, **kwargs):
+    refresh_cards((instance.id,))
+
+
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        refresh_cards((instance.id,))
+    elif action == 'post_clear':
+        refresh_cards(instance._card_recipe_ids)
+    else:
+        refresh_cards(pk_set)
+
+
+def recipe_tags_clearing(sender, instance, action, reverse, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._card_recipe_ids = list(get_related_recipe_ids(instance))
+
+
+def ingredient_in_recipe_saved(sender, instance, **kwargs):
+    refresh_cards((instance.recipe_id,))
+
+
+def tag_or_ingredient_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_cards(list(get_related_recipe_ids(instance)))
+
+
+def tag_or_ingredient_deleting(sender, instance, **kwargs):
+    instance._card_recipe_ids = list(get_related_recipe_ids(instance))
+
+
+def tag_or_ingredient_deleted(sender, instance, **kwargs):
+    refresh_cards(instance._card_recipe_ids)
+
+
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    if created or (
+        update_fields is not None
+        and not CARD_USER_FIELDS.intersection(update_fields)
+    ):
+        return
+    refresh_cards(list(
+        Recipe.objects.filter(author=instance).values_list('id', flat=True)))
+
+
+def connect_signals():
+    post_save.connect(recipe_saved, sender=Recipe)
+    m2m_changed.connect(recipe_tags_clearing, sender=Recipe.tags.through)
+    m2m_changed.connect(recipe_tags_changed, sender=Recipe.tags.through)
+    post_save.connect(ingredient_in_recipe_saved, sender=IngredientInRecipe)
+    for model in (Tag, Ingredient):
+        post_save.connect(tag_or_ingredient_saved, sender=model)
+        pre_delete.connect(tag_or_ingredient_deleting, sender=model)
+        post_delete.connect(tag_or_ingredient_deleted, sender=model)
+    post_save.connect(user_saved, sender=User)
@@ -0,0 +1,257 @@
+"""Журнал изменений для синхронизации клиентов.
+
+Изменения рецептов, избранного, списков покупок и подписок записываются в
+Change в той же транзакции, что и сами изменения: сигналами моделей
+(админка, код, каскадное удаление Collector'ом), а запись в обход
+сигналов - явно: добавление и удаление связей одним запросом в API и
+фоновое удаление. Внутри defer_changes() записи накапливаются и
+вставляются одним запросом. Клиент запрашивает события после курсора -
+id последней полученной записи. Запись с меньшим
+id может стать видна позже, пока ее транзакция не зафиксирована, поэтому
+курсор не сдвигается за записи моложе CHANGES_CURSOR_LAG_SECONDS: они
+отдаются повторно, что безопасно, так как события идемпотентны.
+"""
+from contextlib import contextmanager
+from datetime import timedelta
+from heapq import merge
+from itertools import groupby
+from operator import itemgetter
+from threading import local
+
+from django.db.models import Exists, Min, OuterRef
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from foodgram_backend.settings import CHANGES_CURSOR_LAG_SECONDS
+from recipes.models import (
+    Change, Favorite, IngredientInRecipe, Recipe, RecipeInShoppingCart
+)
+from users.models import Subscription
+
+
+KINDS = {
+    Recipe: Change.RECIPE,
+    Favorite: Change.FAVORITE,
+    RecipeInShoppingCart: Change.SHOPPING_CART,
+    Subscription: Change.SUBSCRIPTION,
+}
+# Поле связи, id из которого записывается в журнал.
+RELATION_TARGETS = {
+    Favorite: 'recipe_id',
+    RecipeInShoppingCart: 'recipe_id',
+    Subscription: 'following_id',
+}
+
+state = local()
+
+
+def record_changes(model, object_ids, user_id=None, deleted=False):
+    """Записывает изменения объектов; user_id - владелец связи."""
+    kind = KINDS.get(model)
+    if kind is None or not object_ids:
+        return
+    changes = [
+        Change(
+            user_id=user_id, kind=kind, object_id=object_id, deleted=deleted
+        )
+        for object_id in object_ids
+    ]
+    pending = getattr(state, 'pending', None)
+    if pending is not None:
+        pending.extend(changes)
+        return
+    Change.objects.bulk_create(changes)
+
+
+@contextmanager
+def defer_changes():
+    """Накапливает записи и вставляет их одним запросом при выходе."""
+    outer = getattr(state, 'pending', None)
+    state.pending = changes = []
+    try:
+        yield
+    finally:
+        state.pending = outer
+    if outer is not None:
+        outer.extend(changes)
+    else:
+        Change.objects.bulk_create(changes)
+
+
+def record_deleted(queryset):
+    """Записывает удаление строк queryset, которые удаляются без сигналов."""
+    model = queryset.model
+    if model is Recipe:
+        record_changes(
+            Recipe, list(queryset.values_list('pk', flat=True)),
+            deleted=True
+        )
+    elif model in RELATION_TARGETS:
+        rows = queryset.order_by('user_id').values_list(
+            'user_id', RELATION_TARGETS[model])
+        with defer_changes():
+            for user_id, user_rows in groupby(rows, key=itemgetter(0)):
+                record_changes(
+                    model, [target_id for _, target_id in user_rows],
+                    user_id, deleted=True
+                )
+
+
+def recipe_saved(sender, instance, **kwargs):
+    record_changes(Recipe, (instance.id,))
+
+
+def recipe_deleted(sender, instance, **kwargs):
+    record_changes(Recipe, (instance.id,), deleted=True)
+
+
+def relation_saved(sender, instance, created, **kwargs):
+    if created:
+        record_changes(
+            sender, (getattr(instance, RELATION_TARGETS[sender]),),
+            instance.user_id
+        )
+
+
+def relation_deleted(sender, instance, **kwargs):
+    record_changes(
+        sender, (getattr(instance, RELATION_TARGETS[sender]),),
+        instance.user_id, deleted=True
+    )
+
+
+def ingredient_saved(sender, instance, **kwargs):
+    """Изменение ингредиента вне формы рецепта, например в админке.
+
+    Удаление не отслеживается: сигнал post_delete заставил бы очистку
+    ингредиентов при изменении рецепта загружать и удалять строки по
+    одной, а рецепт при этом сохраняется и записывается в журнал сам.
+    """
+    record_changes(Recipe, (instance.recipe_id,))
+
+
+def connect_signals():
+    post_save.connect(recipe_saved, sender=Recipe)
+    post_delete.connect(recipe_deleted, sender=Recipe)
+    post_save.connect(ingredient_saved, sender=IngredientInRecipe)
+    for model in RELATION_TARGETS:
+        post_save.connect(relation_saved, sender=model)
+        post_delete.connect(relation_deleted, sender=model)
+
+
+def get_oldest_id():
+    return Change.objects.aggregate(oldest=Min('id'))['oldest']
+
+
+def get_cutoff():
+    return timezone.now() - timedelta(seconds=CHANGES_CURSOR_LAG_SECONDS)
+
+
+def get_initial_cursor():
+    """Курсор для клиента, который только что загрузил все данные."""
+    cursor = Change.objects.filter(
+        created_at__lt=get_cutoff()
+    ).order_by('-created_at').values_list('id', flat=True).first()
+    if cursor is None:
+        cursor = max((get_oldest_id() or 1) - 1, 0)
+    return cursor
+
+
+def is_cursor_expired(since):
+    """Удалены ли командой compact_changes записи после курсора."""
+    oldest_id = get_oldest_id()
+    return oldest_id is not None and since < oldest_id - 1
+
+
+def get_changes(user, since, limit):
+    """Возвращает новый курсор, признак наличия еще событий и события.
+
+    События пользователя и общие события рецептов читаются по индексу
+    (user, id). Из нескольких событий одного объекта остается последнее.
+    """
+    entries = list(merge(
+        *(
+            Change.objects.filter(
+                user=owner, id__gt=since
+            ).order_by('id').values_list(
+                'id', 'created_at', 'kind', 'object_id', 'deleted'
+            )[:limit]
+            for owner in (user, None)
+        ),
+        key=itemgetter(0)
+    ))[:limit]
+    cutoff = get_cutoff()
+    cursor = since
+    for entry_id, created_at, *_ in entries:
+        if created_at >= cutoff:
+            break
+        cursor = entry_id
+    events = {}
+    for _, _, kind, object_id, deleted in entries:
+        events.pop((kind, object_id), None)
+        events[kind, object_id] = deleted
+    return (
+        cursor,
+        len(entries) == limit and cursor == entries[-1][0],
+        [
+            {
+                'type': kind,
+                'id': object_id,
+                'action': 'delete' if deleted else 'upsert',
+            }
+            for (kind, object_id), deleted in events.items()
+        ]
+    )
+
+
+def get_superseded_ids(oldest_id, owned):
+    """id записей, для объекта которых есть более поздняя запись.
+
+    Самая старая запись не удаляется: по ней определяется, что курсор
+    устарел.
+    """
+    newer = Change.objects.filter(
+        kind=OuterRef('kind'),
+        object_id=OuterRef('object_id'),
+        id__gt=OuterRef('id'),
+    )
+    if owned:
+        newer = newer.filter(user=OuterRef('user'))
+    else:
+        newer = newer.filter(user__isnull=True)
+    return Change.objects.filter(
+        Exists(newer), id__gt=oldest_id, user__isnull=not owned
+    ).values_list('id', flat=True)
+
+
+def delete_in_batches(ids, batch_size):
+    deleted = 0
+    while True:
+        batch = list(ids[:batch_size])
+        if not batch:
+            return deleted
+        deleted += Change.objects.filter(id__in=batch).delete()[0]
+
+
+def compact(before, batch_size):
+    """Удаляет записи старше before и записи, замененные более поздними.
+
+    Самая новая запись сохраняется всегда, чтобы курсоры клиентов, не
+    получивших удаленные записи, считались устаревшими.
+    """
+    newest = Change.objects.order_by('-id').values_list(
+        'id', flat=True).first()
+    if newest is None:
+        return 0, 0
+    expired = delete_in_batches(
+        Change.objects.filter(
+            created_at__lt=before, id__lt=newest
+        ).values_list('id', flat=True),
+        batch_size
+    )
+    oldest_id = get_oldest_id()
+    superseded = sum(
+        delete_in_batches(get_superseded_ids(oldest_id, owned), batch_size)
+        for owned in (True, False)
+    )
+    return expired, superseded
@@ -0,0 +1,233 @@
+"""Фоновое удаление пользователей и рецептов с большим числом связей.
+
+Collector Django перед удалением загружает в память все зависимые строки,
+для автора с тысячами рецептов это минуты блокировок. Здесь объект сразу
+скрывается (рецепт - is_hidden, пользователь - is_active, скрытие его
+рецептов и отзыв его токенов), а строки удаляются в фоновом потоке пачками по
+DELETION_BATCH_SIZE: для каждой связи с CASCADE выбираются id очередной
+пачки и удаляются одним DELETE без Collector'а, каждая пачка - в своей
+короткой транзакции. Файлы изображений удаляются после фиксации пачки.
+Прогресс записывается в DeletionTask. Удаление продолжается с места
+остановки, поэтому после ошибки фоновая задача повторяется через
+DELETION_RETRY_SECONDS (с удвоением паузы) до DELETION_MAX_ATTEMPTS раз,
+число неудачных попыток и последняя ошибка видны в админке. Незавершенные
+после перезапуска или всех попыток задачи выполняет команда run_deletions.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Timer
+from traceback import format_exc
+
+from django.db import connection, models, router, transaction
+from django.db.models import F
+from django.db.models.deletion import get_candidate_relations_to_delete
+from django.utils import timezone
+
+from foodgram_backend.settings import (
+    DELETION_BACKGROUND, DELETION_BATCH_SIZE, DELETION_MAX_ATTEMPTS,
+    DELETION_RETRY_SECONDS
+)
+from recipes.changes import record_deleted
+from recipes.models import DeletionTask, Recipe
+from users.models import User
+from users.revocation import revoke_user_tokens
+
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='deletion')
+
+
+def get_model_label(model):
+    return model._meta.label_lower
+
+
+def hide(instances):
+    model = type(instances[0])
+    ids = [instance.pk for instance in instances]
+    if model is User:
+        User.objects.filter(id__in=ids).update(is_active=False)
+        Recipe.objects.filter(author__in=ids).update(is_hidden=True)
+        revoke_user_tokens(ids)
+    else:
+        Recipe.objects.filter(id__in=ids).update(is_hidden=True)
+
+
+def schedule_deletion(instances):
+    """Скрывает пользователей или рецепты и ставит их удаление в очередь.
+
+    При DELETION_BACKGROUND удаление выполняется в фоновом потоке после
+    фиксации транзакции, иначе - сразу после нее в том же запросе.
+    """
+    instances = list(instances)
+    if not instances:
+        return
+    label = get_model_label(type(instances[0]))
+    ids = [instance.pk for instance in instances]
+    with transaction.atomic():
+        hide(instances)
+        DeletionTask.objects.bulk_create(
+            (DeletionTask(model=label, object_id=pk) for pk in ids),
+            ignore_conflicts=True
+        )
+        if DELETION_BACKGROUND:
+            transaction.on_commit(
+                lambda: executor.submit(run_in_background, label, ids))
+        else:
+            transaction.on_commit(lambda: run_tasks(label, ids))
+
+
+def run_in_background(label, ids, attempt=1):
+    try:
+        run_tasks(label, ids)
+    except Exception:
+        logger.exception('Ошибка при фоновом удалении, попытка %s', attempt)
+        if attempt < DELETION_MAX_ATTEMPTS:
+            retry(label, ids, attempt + 1)
+    finally:
+        connection.close()
+
+
+def retry(label, ids, attempt):
+    timer = Timer(
+        DELETION_RETRY_SECONDS * 2 ** (attempt - 2),
+        executor.submit, (run_in_background, label, ids, attempt)
+    )
+    timer.daemon = True
+    timer.start()
+
+
+def run_tasks(label, ids):
+    for task in DeletionTask.objects.filter(
+        model=label, object_id__in=ids, finished_at=None
+    ):
+        run_task(task)
+
+
+def run_task(task, progress=None):
+    """Удаляет объект задачи; progress(task) вызывается после каждой пачки.
+
+    Ошибка записывается в задачу и пробрасывается дальше.
+    """
+    model = next(
+        model for model in (User, Recipe)
+        if get_model_label(model) == task.model
+    )
+
+    def on_deleted(count):
+        DeletionTask.objects.filter(id=task.id).update(
+            deleted_rows=F('deleted_rows') + count)
+        task.deleted_rows += count
+        logger.info('%s: удалено строк %s', task, task.deleted_rows)
+        if progress is not None:
+            progress(task)
+
+    try:
+        delete_rows(model, [task.object_id], on_deleted)
+    except Exception:
+        task.attempts += 1
+        task.error = format_exc()
+        DeletionTask.objects.filter(id=task.id).update(
+            attempts=F('attempts') + 1, error=task.error)
+        raise
+    task.finished_at = timezone.now()
+    task.save(update_fields=('finished_at',))
+    logger.info('%s: завершено', task)
+
+
+def get_cascades(model):
+    """Связи, строки которых удаляются вместе с объектами model.
+
+    Строки удаляются в обход Collector'а, поэтому другие варианты
+    on_delete, например SET_NULL, не поддерживаются.
+    """
+    cascades = []
+    for relation in get_candidate_relations_to_delete(model._meta):
+        on_delete = relation.field.remote_field.on_delete
+        if on_delete is models.CASCADE:
+            cascades.append((relation.related_model, relation.field.name))
+        elif on_delete is not models.DO_NOTHING:
+            raise ValueError(
+                f'{relation.related_model._meta.label}.'
+                f'{relation.field.name}: фоновое удаление поддерживает '
+                f'только CASCADE и DO_NOTHING!'
+            )
+    return cascades
+
+
+def get_file_names(queryset):
+    fields = [
+        field for field in queryset.model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+    ]
+    if not fields:
+        return []
+    return [
+        (field, name)
+        for names in queryset.values_list(
+            *(field.attname for field in fields))
+        for field, name in zip(fields, names)
+        if name
+    ]
+
+
+def delete_files(files):
+    for field, name in files:
+        try:
+            field.storage.delete(name)
+        except Exception:
+            logger.exception('Не удалось удалить файл %s', name)
+
+
+def delete_rows(model, ids, on_deleted):
+    """Удаляет строки model с первичными ключами ids и все зависимые.
+
+    Зависимые строки удаляются пачками, начиная с самых дальних связей,
+    после чего сами строки удаляются одним DELETE без Collector'а и
+    сигналов, поэтому удаление рецептов и связей записывается в журнал
+    изменений явно. Строки читаются и удаляются в основной базе, а не на
+    реплике.
+    """
+    using = router.db_for_write(model)
+    for related_model, field_name in get_cascades(model):
+        related = related_model._base_manager.using(using).filter(
+            **{f'{field_name}__in': ids}).order_by()
+        while True:
+            batch = list(related.values_list('pk', flat=True)[
+                :DELETION_BATCH_SIZE])
+            if not batch:
+                break
+            delete_rows(related_model, batch, on_deleted)
+    queryset = model._base_manager.using(using).filter(pk__in=ids)
+    files = get_file_names(queryset)
+    with transaction.atomic(using=using):
+        record_deleted(queryset)
+        deleted = queryset._raw_delete(using)
+        transaction.on_commit(lambda: delete_files(files), using=using)
+    on_deleted(deleted)
+
+
+class BackgroundDeletionAdminMixin:
+    """Удаление из админки в фоне: объекты сразу скрываются.
+
+    Страница подтверждения не перечисляет зависимые объекты: их сбор
+    Collector'ом и есть медленная часть удаления.
+    """
+
+    def delete_model(self, request, obj):
+        schedule_deletion((obj,))
+
+    def delete_queryset(self, request, queryset):
+        schedule_deletion(queryset)
+
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        perms_needed = (
+            set() if self.has_delete_permission(request)
+            else {self.opts.verbose_name}
+        )
+        return (
+            [str(obj) for obj in objs],
+            {self.opts.verbose_name_plural: len(objs)},
+            perms_needed,
+            [],
+        )
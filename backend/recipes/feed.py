@@ -0,0 +1,223 @@
+"""Ленты подписок: рецепты авторов, на которых подписан пользователь.
+
+Новый рецепт копируется в ленты всех подписчиков автора (TimelineEntry)
+в фоновом потоке после фиксации транзакции, поэтому чтение ленты - это
+один проход по индексу (user, -pub_date). Рецепты авторов, у которых
+больше FEED_POPULAR_AUTHOR_FOLLOWERS подписчиков, не копируются, а
+добавляются к ленте при чтении. Список таких авторов хранится в
+PopularAuthor и пересчитывается командой update_popular_authors, а не
+при запросах.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.signals import post_save
+
+from foodgram_backend.settings import (
+    FEED_BACKFILL_SIZE, FEED_BACKGROUND, FEED_POPULAR_AUTHOR_FOLLOWERS,
+    FEED_POPULAR_AUTHORS_CACHE_SECONDS
+)
+from recipes.models import Recipe, TimelineEntry
+from users.models import PopularAuthor, Subscription
+
+
+POPULAR_AUTHORS_CACHE_KEY = 'feed_popular_authors'
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='feed')
+
+
+def run_task(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Ошибка при обновлении лент подписок')
+    finally:
+        connection.close()
+
+
+def schedule(function, *args):
+    """Выполняет функцию после фиксации текущей транзакции.
+
+    При FEED_BACKGROUND функция выполняется в фоновом потоке, и ответ на
+    запрос ее не ждет.
+    """
+    if FEED_BACKGROUND:
+        transaction.on_commit(
+            lambda: executor.submit(run_task, function, *args))
+    else:
+        transaction.on_commit(lambda: function(*args))
+
+
+def get_popular_author_ids():
+    author_ids = cache.get(POPULAR_AUTHORS_CACHE_KEY)
+    if author_ids is None:
+        author_ids = set(
+            PopularAuthor.objects.values_list('author_id', flat=True))
+        cache.set(
+            POPULAR_AUTHORS_CACHE_KEY, author_ids,
+            FEED_POPULAR_AUTHORS_CACHE_SECONDS
+        )
+    return author_ids
+
+
+def get_tables():
+    quote_name = connection.ops.quote_name
+    return {
+        'timeline': quote_name(TimelineEntry._meta.db_table),
+        'recipe': quote_name(Recipe._meta.db_table),
+        'subscription': quote_name(Subscription._meta.db_table),
+    }
+
+
+def fan_out(recipe_id):
+    """Добавляет рецепт в ленты подписчиков автора одним запросом."""
+    author_id = Recipe.objects.filter(id=recipe_id).values_list(
+        'author_id', flat=True).first()
+    if author_id is None or author_id in get_popular_author_ids():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {timeline} (user_id, recipe_id, author_id, pub_date) '
+            'SELECT subscription.user_id, recipe.id, recipe.author_id, '
+            'recipe.pub_date '
+            'FROM {recipe} recipe '
+            'JOIN {subscription} subscription '
+            'ON subscription.following_id = recipe.author_id '
+            'WHERE recipe.id = %s '
+            'ON CONFLICT DO NOTHING'.format(**get_tables()),
+            (recipe_id,)
+        )
+
+
+def fan_out_author(author_id):
+    """Добавляет последние рецепты автора в ленты всех его подписчиков."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {timeline} (user_id, recipe_id, author_id, pub_date) '
+            'SELECT subscription.user_id, recipe.id, recipe.author_id, '
+            'recipe.pub_date '
+            'FROM {recipe} recipe '
+            'JOIN {subscription} subscription '
+            'ON subscription.following_id = recipe.author_id '
+            'WHERE recipe.id IN ('
+            'SELECT latest.id FROM {recipe} latest '
+            'WHERE latest.author_id = %s '
+            'ORDER BY latest.pub_date DESC LIMIT %s) '
+            'ON CONFLICT DO NOTHING'.format(**get_tables()),
+            (author_id, FEED_BACKFILL_SIZE)
+        )
+
+
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        schedule(fan_out, instance.id)
+
+
+def connect_signals():
+    post_save.connect(recipe_saved, sender=Recipe)
+
+
+def backfill(user_id, author_ids):
+    """Добавляет в ленту последние рецепты авторов, на которых подписались.
+
+    Рецепты добавляются, только если подписка еще существует: отписка
+    могла произойти раньше, чем выполнилась эта задача.
+    """
+    popular_author_ids = get_popular_author_ids()
+    sql = (
+        'INSERT INTO {timeline} (user_id, recipe_id, author_id, pub_date) '
+        'SELECT %s, recipe.id, recipe.author_id, recipe.pub_date '
+        'FROM {recipe} recipe '
+        'WHERE recipe.author_id = %s AND EXISTS ('
+        'SELECT 1 FROM {subscription} subscription '
+        'WHERE subscription.user_id = %s '
+        'AND subscription.following_id = recipe.author_id) '
+        'ORDER BY recipe.pub_date DESC LIMIT %s '
+        'ON CONFLICT DO NOTHING'.format(**get_tables())
+    )
+    with connection.cursor() as cursor:
+        for author_id in author_ids:
+            if author_id not in popular_author_ids:
+                cursor.execute(
+                    sql, (user_id, author_id, user_id, FEED_BACKFILL_SIZE))
+
+
+def backfill_subscriptions(subscriptions):
+    """Заполняет ленты по подпискам; возвращает число пользователей."""
+    users = 0
+    for user_id, rows in groupby(
+        subscriptions.order_by('user_id').values_list(
+            'user_id', 'following_id').iterator(),
+        key=itemgetter(0)
+    ):
+        with transaction.atomic():
+            backfill(user_id, [author_id for _, author_id in rows])
+        users += 1
+    return users
+
+
+@transaction.atomic
+def update_popular_authors():
+    """Пересчитывает популярных авторов по числу подписчиков.
+
+    Рецепты авторов, переставших быть популярными, добавляются в ленты их
+    подписчиков. Возвращает множества новых и бывших популярных авторов.
+    """
+    followers = dict(
+        Subscription.objects.order_by().values('following').annotate(
+            followers=Count('id')
+        ).filter(
+            followers__gt=FEED_POPULAR_AUTHOR_FOLLOWERS
+        ).values_list('following', 'followers')
+    )
+    old_ids = set(PopularAuthor.objects.select_for_update().values_list(
+        'author_id', flat=True))
+    removed = old_ids - followers.keys()
+    PopularAuthor.objects.filter(author_id__in=removed).delete()
+    PopularAuthor.objects.bulk_create(
+        (
+            PopularAuthor(author_id=author_id, followers=count)
+            for author_id, count in followers.items()
+        ),
+        ignore_conflicts=True
+    )
+    PopularAuthor.objects.bulk_update(
+        (
+            PopularAuthor(author_id=author_id, followers=followers[author_id])
+            for author_id in old_ids & followers.keys()
+        ),
+        ('followers',)
+    )
+    cache.delete(POPULAR_AUTHORS_CACHE_KEY)
+    for author_id in removed:
+        fan_out_author(author_id)
+    return followers.keys() - old_ids, removed
+
+
+def remove_authors(user_id, author_ids):
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids).delete()
+
+
+def get_feed(user):
+    """Возвращает пары (id рецепта, дата публикации), новые сначала."""
+    entries = TimelineEntry.objects.filter(user=user).order_by().values_list(
+        'recipe_id', 'pub_date')
+    popular_author_ids = get_popular_author_ids()
+    if popular_author_ids:
+        followed_popular_ids = list(Subscription.objects.filter(
+            user=user, following__in=popular_author_ids
+        ).values_list('following_id', flat=True))
+        if followed_popular_ids:
+            entries = entries.union(
+                Recipe.objects.filter(
+                    author__in=followed_popular_ids
+                ).order_by().values_list('id', 'pub_date')
+            )
+    return entries.order_by('-pub_date', '-recipe_id')
@@ -0,0 +1,34 @@
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodgram_backend.settings import CHANGES_RETENTION_DAYS
+from recipes.changes import compact
+
+
+class Command(BaseCommand):
+    help = (
+        'Сжатие журнала изменений: удаляются записи старше --days дней и '
+        'записи, после которых у того же объекта есть более поздняя'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=CHANGES_RETENTION_DAYS,
+            help='Сколько дней хранить записи. Клиентам с более старым '
+                 'курсором придется загрузить данные заново.'
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        expired, superseded = compact(
+            timezone.now() - timedelta(days=options['days']),
+            options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено устаревших записей: {expired}, замененных: '
+            f'{superseded} за {perf_counter() - started:.1f} с'
+        ))
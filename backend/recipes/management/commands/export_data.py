@@ -0,0 +1,114 @@
+import sys
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from recipes.batches import chunked
+from recipes.models import (
+    Favorite, Ingredient, IngredientInRecipe, Recipe,
+    RecipeInShoppingCart, Tag
+)
+from users.models import Subscription, User
+
+
+USER_FIELDS = (
+    'id', 'email', 'username', 'first_name', 'last_name', 'password',
+    'avatar', 'is_active', 'is_staff', 'is_superuser', 'date_joined',
+    'last_login',
+)
+TAG_FIELDS = ('id', 'name', 'slug')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit')
+RECIPE_FIELDS = (
+    'id', 'author', 'name', 'text', 'image', 'cooking_time', 'pub_date',
+    'short_link', 'is_hidden',
+)
+# Тип записи и модель связи пользователя с рецептом или автором.
+RELATIONS = (
+    ('favorite', Favorite, ('user', 'recipe')),
+    ('shopping_cart', RecipeInShoppingCart, ('user', 'recipe')),
+    ('subscription', Subscription, ('user', 'following')),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковая выгрузка пользователей, тегов, ингредиентов, рецептов, '
+        'избранного, списков покупок и подписок в NDJSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output', nargs='?', default='-',
+            help='Файл для выгрузки, по умолчанию стандартный вывод.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        self.counts = Counter()
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        if options['output'] == '-':
+            self.export(sys.stdout, encoder)
+            log = self.stderr
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                self.export(output, encoder)
+            log = self.stdout
+        log.write(
+            ', '.join(
+                f'{record_type}: {count}'
+                for record_type, count in self.counts.items()
+            ),
+            style_func=self.style.SUCCESS
+        )
+
+    def export(self, output, encoder):
+        self.output = output
+        self.encoder = encoder
+        for record_type, queryset, fields in (
+            ('user', User.objects, USER_FIELDS),
+            ('tag', Tag.objects, TAG_FIELDS),
+            ('ingredient', Ingredient.objects, INGREDIENT_FIELDS),
+        ):
+            for row in self.iterate(queryset, fields):
+                self.write(record_type, row)
+
+        # Скрытые до удаления рецепты выгружаются вместе с признаком, иначе
+        # выгруженные избранное и списки покупок ссылались бы на
+        # отсутствующие рецепты.
+        for recipes in chunked(
+            self.iterate(Recipe._base_manager, RECIPE_FIELDS), self.chunk_size
+        ):
+            recipe_ids = [recipe['id'] for recipe in recipes]
+            tags = defaultdict(list)
+            for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by('id').values_list('recipe_id', 'tag_id'):
+                tags[recipe_id].append(tag_id)
+            ingredients = defaultdict(list)
+            for recipe_id, ingredient_id, amount in (
+                IngredientInRecipe.objects.filter(
+                    recipe_id__in=recipe_ids
+                ).order_by('id').values_list('recipe_id', 'name_id', 'amount')
+            ):
+                ingredients[recipe_id].append(
+                    {'id': ingredient_id, 'amount': amount})
+            for recipe in recipes:
+                recipe['tags'] = tags[recipe['id']]
+                recipe['ingredients'] = ingredients[recipe['id']]
+                self.write('recipe', recipe)
+
+        for record_type, model, fields in RELATIONS:
+            for row in self.iterate(model.objects, fields):
+                self.write(record_type, row)
+
+    def iterate(self, queryset, fields):
+        """Читает строки курсором на стороне сервера, где он доступен."""
+        return queryset.order_by('id').values(*fields).iterator(
+            chunk_size=self.chunk_size)
+
+    def write(self, record_type, row):
+        self.output.write(self.encoder.encode({'type': record_type, **row}))
+        self.output.write('\n')
+        self.counts[record_type] += 1
@@ -0,0 +1,288 @@
+from datetime import timedelta
+from itertools import accumulate, islice
+from random import Random
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.batches import RowWriter
+from recipes.cards import refresh_cards
+from recipes.feed import backfill_subscriptions, update_popular_authors
+from recipes.models import (
+    MAX_LENGTH_SHORT_LINK, Favorite, Ingredient, IngredientInRecipe,
+    Recipe, RecipeInShoppingCart, Tag
+)
+from recipes.similar import reindex_recipes
+from users.models import Subscription, User
+
+
+SHORT_LINK_ALPHABET = (
+    'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+)
+SHORT_LINK_SPACE = len(SHORT_LINK_ALPHABET) ** MAX_LENGTH_SHORT_LINK
+# Нечетное и не кратное 13 число, поэтому умножение на него по модулю
+# 52 ** 10 переставляет номера рецептов, и короткие ссылки уникальны.
+SHORT_LINK_MULTIPLIER = 7_919_000_000_017
+RECIPE_IMAGE = 'recipes/images/generated.png'
+PUBLICATION_PERIOD_DAYS = 3 * 365
+ACTIVITY_PERIOD_DAYS = 30
+# Сколько раз добирать недостающие элементы в ZipfSampler.sample.
+SAMPLE_ROUNDS = 20
+
+
+def make_short_link(number):
+    number = number * SHORT_LINK_MULTIPLIER % SHORT_LINK_SPACE
+    letters = []
+    for _ in range(MAX_LENGTH_SHORT_LINK):
+        number, index = divmod(number, len(SHORT_LINK_ALPHABET))
+        letters.append(SHORT_LINK_ALPHABET[index])
+    return ''.join(letters)
+
+
+class ZipfSampler:
+    """Выбор элементов с вероятностью, обратной степени ранга.
+
+    Ранги назначаются случайно, поэтому популярные объекты не совпадают
+    с первыми id.
+    """
+
+    def __init__(self, random, items, exponent):
+        self.random = random
+        self.items = list(items)
+        random.shuffle(self.items)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)
+        ))
+
+    def choice(self):
+        return self.random.choices(
+            self.items, cum_weights=self.cum_weights)[0]
+
+    def sample(self, size, exclude=None):
+        """Возвращает до size разных элементов, кроме exclude.
+
+        Редкие элементы при сильном перекосе могут не выпасть и за
+        SAMPLE_ROUNDS попыток, тогда элементов будет меньше.
+        """
+        size = min(size, len(self.items) - (exclude is not None))
+        chosen = set()
+        for _ in range(SAMPLE_ROUNDS):
+            missing = size - len(chosen)
+            if missing <= 0:
+                break
+            chosen.update(self.random.choices(
+                self.items, cum_weights=self.cum_weights, k=missing))
+            chosen.discard(exclude)
+        return list(islice(chosen, size))
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерация пользователей, рецептов, избранного, списков покупок '
+        'и подписок для нагрузочного тестирования'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном у пользователя.'
+        )
+        parser.add_argument(
+            '--shopping-cart', type=int, default=5,
+            help='Среднее число рецептов в списке покупок у пользователя.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее число подписок у пользователя.'
+        )
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=12)
+        parser.add_argument('--max-tags', type=int, default=3)
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности.'
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--password', default='foodgram-load',
+            help='Пароль всех созданных пользователей.'
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError(
+                'Нужно хотя бы два пользователя и один рецепт!')
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not tag_ids:
+            raise CommandError('Сначала создайте теги!')
+        if not ingredient_ids:
+            raise CommandError(
+                'Сначала загрузите ингредиенты командой load_ingredients!')
+
+        self.random = Random(options['seed'])
+        self.options = options
+        self.writer = RowWriter(options['batch_size'])
+        self.total_rows = 0
+        self.total_time = 0
+
+        first_user = (User.objects.aggregate(id=Max('id'))['id'] or 0) + 1
+        first_recipe = (
+            Recipe.objects.aggregate(id=Max('id'))['id'] or 0) + 1
+        user_ids = range(first_user, first_user + options['users'])
+        recipe_ids = range(first_recipe, first_recipe + options['recipes'])
+        self.users = ZipfSampler(self.random, user_ids, options['zipf'])
+        self.recipes = ZipfSampler(self.random, recipe_ids, options['zipf'])
+        self.tags = ZipfSampler(self.random, tag_ids, options['zipf'])
+        self.ingredients = ZipfSampler(
+            self.random, ingredient_ids, options['zipf'])
+
+        with transaction.atomic():
+            self.load(
+                User,
+                ('id', 'password', 'is_superuser', 'is_staff', 'is_active',
+                 'date_joined', 'email', 'username', 'first_name',
+                 'last_name'),
+                self.generate_users(user_ids)
+            )
+            self.load(
+                Recipe,
+                ('id', 'author', 'name', 'image', 'text', 'cooking_time',
+                 'pub_date', 'short_link', 'popularity', 'trending',
+                 'is_hidden'),
+                self.generate_recipes(recipe_ids)
+            )
+            self.load(
+                Recipe.tags.through, ('recipe', 'tag'),
+                self.generate_recipe_tags(recipe_ids)
+            )
+            self.load(
+                IngredientInRecipe, ('recipe', 'name', 'amount'),
+                self.generate_recipe_ingredients(recipe_ids)
+            )
+            for model, mean in (
+                (Favorite, options['favorites']),
+                (RecipeInShoppingCart, options['shopping_cart']),
+            ):
+                self.load(
+                    model, ('user', 'recipe', 'added_at'),
+                    self.generate_user_recipes(user_ids, mean)
+                )
+            self.load(
+                Subscription, ('user', 'following'),
+                self.generate_subscriptions(user_ids)
+            )
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                    no_style(), (User, Recipe)
+                ):
+                    cursor.execute(sql)
+
+        # Строки вставлены без сигналов, поэтому карточки рецептов, индекс
+        # похожих рецептов и ленты созданных пользователей заполняются
+        # здесь.
+        started = perf_counter()
+        refresh_cards(recipe_ids)
+        reindex_recipes(recipe_ids)
+        self.stdout.write(
+            f'Карточки и индекс похожих рецептов: {len(recipe_ids)} за '
+            f'{perf_counter() - started:.1f} с'
+        )
+        started = perf_counter()
+        update_popular_authors()
+        users = backfill_subscriptions(
+            Subscription.objects.filter(user_id__gte=first_user))
+        self.stdout.write(
+            f'Ленты подписок: {users} за {perf_counter() - started:.1f} с')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего: {self.total_rows} строк за {self.total_time:.1f} с '
+            f'({self.total_rows / self.total_time:.0f} строк/с)'
+        ))
+
+    def load(self, model, fields, rows):
+        started = perf_counter()
+        count = self.writer.write(model, fields, rows)
+        elapsed = perf_counter() - started
+        self.total_rows += count
+        self.total_time += elapsed
+        self.stdout.write(
+            f'{model._meta.db_table}: {count} строк за {elapsed:.1f} с '
+            f'({count / elapsed:.0f} строк/с)'
+        )
+
+    def count(self, mean):
+        """Число связей пользователя: у немногих много, у большинства мало."""
+        if mean <= 0:
+            return 0
+        return int(self.random.expovariate(1 / mean))
+
+    def generate_users(self, user_ids):
+        password = make_password(self.options['password'])
+        date_joined = connection.ops.adapt_datetimefield_value(timezone.now())
+        for user_id in user_ids:
+            yield (
+                user_id, password, False, False, True, date_joined,
+                f'load{user_id}@foodgram.test', f'load{user_id}',
+                f'Имя{user_id}', f'Фамилия{user_id}',
+            )
+
+    def generate_recipes(self, recipe_ids):
+        now = timezone.now()
+        period = timedelta(days=PUBLICATION_PERIOD_DAYS).total_seconds()
+        for recipe_id in recipe_ids:
+            pub_date = now - timedelta(seconds=self.random.random() * period)
+            yield (
+                recipe_id,
+                self.users.choice(),
+                f'Рецепт {recipe_id}',
+                RECIPE_IMAGE,
+                f'Описание рецепта {recipe_id}',
+                self.random.randint(1, 180),
+                connection.ops.adapt_datetimefield_value(pub_date),
+                make_short_link(recipe_id),
+                0,
+                0,
+                False,
+            )
+
+    def generate_recipe_tags(self, recipe_ids):
+        max_tags = min(self.options['max_tags'], len(self.tags.items))
+        for recipe_id in recipe_ids:
+            for tag_id in self.tags.sample(self.random.randint(1, max_tags)):
+                yield recipe_id, tag_id
+
+    def generate_recipe_ingredients(self, recipe_ids):
+        for recipe_id in recipe_ids:
+            for ingredient_id in self.ingredients.sample(self.random.randint(
+                self.options['min_ingredients'],
+                self.options['max_ingredients']
+            )):
+                yield recipe_id, ingredient_id, self.random.randint(1, 1000)
+
+    def generate_user_recipes(self, user_ids, mean):
+        now = timezone.now()
+        period = timedelta(days=ACTIVITY_PERIOD_DAYS).total_seconds()
+        for user_id in user_ids:
+            for recipe_id in self.recipes.sample(self.count(mean)):
+                added_at = now - timedelta(
+                    seconds=self.random.random() * period)
+                yield (
+                    user_id, recipe_id,
+                    connection.ops.adapt_datetimefield_value(added_at),
+                )
+
+    def generate_subscriptions(self, user_ids):
+        for user_id in user_ids:
+            for following_id in self.users.sample(
+                self.count(self.options['subscriptions']), exclude=user_id
+            ):
+                yield user_id, following_id
@@ -0,0 +1,221 @@
+import json
+import sys
+from collections import Counter
+from functools import partial
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.management.commands.export_data import (
+    INGREDIENT_FIELDS, RELATIONS, TAG_FIELDS, USER_FIELDS
+)
+from recipes.cards import refresh_cards
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from recipes.similar import reindex_recipes
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковая загрузка данных, выгруженных командой export_data. '
+        'Уже существующие объекты пропускаются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input', nargs='?', default='-',
+            help='Файл NDJSON, по умолчанию стандартный ввод.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        # Старые id пользователей, тегов, ингредиентов и рецептов -> новые.
+        self.ids = {
+            'user': {}, 'tag': {}, 'ingredient': {}, 'recipe': {},
+        }
+        self.inserted = Counter()
+        self.skipped = Counter()
+        self.loaders = {
+            'user': self.load_users,
+            'tag': self.load_tags,
+            'ingredient': self.load_ingredients,
+            'recipe': self.load_recipes,
+        }
+        for record_type, model, fields in RELATIONS:
+            self.loaders[record_type] = partial(
+                self.load_relations, model=model, fields=fields)
+
+        started = perf_counter()
+        if options['input'] == '-':
+            self.import_lines(sys.stdin, options['batch_size'])
+        else:
+            try:
+                with open(options['input'], encoding='utf-8') as data:
+                    self.import_lines(data, options['batch_size'])
+            except FileNotFoundError:
+                raise CommandError(f'Файл {options["input"]} не найден!')
+        elapsed = perf_counter() - started
+        for record_type in self.loaders:
+            if self.inserted[record_type] or self.skipped[record_type]:
+                self.stdout.write(
+                    f'{record_type}: добавлено {self.inserted[record_type]}, '
+                    f'пропущено {self.skipped[record_type]}'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Загрузка заняла {elapsed:.1f} с'))
+
+    def import_lines(self, lines, batch_size):
+        batch = []
+        batch_type = None
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                record_type = record.pop('type')
+            except (ValueError, KeyError, AttributeError):
+                raise CommandError(f'Строка {number}: некорректная запись!')
+            if record_type not in self.loaders:
+                raise CommandError(
+                    f'Строка {number}: неизвестный тип "{record_type}"!')
+            if batch and (
+                record_type != batch_type or len(batch) >= batch_size
+            ):
+                self.flush(batch_type, batch)
+                batch = []
+            batch_type = record_type
+            batch.append(record)
+        if batch:
+            self.flush(batch_type, batch)
+
+    def flush(self, record_type, batch):
+        with transaction.atomic():
+            inserted = self.loaders[record_type](batch)
+        self.inserted[record_type] += inserted
+        self.skipped[record_type] += len(batch) - inserted
+
+    def insert_missing(self, model, batch, record_type, key_fields, fields):
+        """Добавляет объекты, которых нет в базе, и запоминает их новые id.
+
+        Объекты сопоставляются по естественному ключу key_fields, поэтому
+        повторная загрузка того же файла ничего не дублирует. Существующие
+        объекты ищутся базовым менеджером, включая скрытые рецепты.
+        """
+        def get_key(values):
+            return tuple(values[field] for field in key_fields)
+
+        keys = {get_key(record): record['id'] for record in batch}
+        lookup = {f'{key_fields[0]}__in': [key[0] for key in keys]}
+        existing = {
+            get_key(row): row['id']
+            for row in model._base_manager.filter(**lookup).values(
+                'id', *key_fields)
+        }
+        new = [
+            model(**{field: record[field] for field in fields[1:]})
+            for record in batch if get_key(record) not in existing
+        ]
+        model.objects.bulk_create(new, ignore_conflicts=True)
+        ids = self.ids[record_type]
+        for row in model._base_manager.filter(**lookup).values(
+            'id', *key_fields
+        ):
+            key = get_key(row)
+            if key in keys:
+                ids[keys[key]] = row['id']
+        new_keys = {
+            key for key in keys if key not in existing and keys[key] in ids}
+        return new_keys
+
+    def load_users(self, batch):
+        return len(self.insert_missing(
+            User, batch, 'user', ('email',), USER_FIELDS))
+
+    def load_tags(self, batch):
+        return len(self.insert_missing(
+            Tag, batch, 'tag', ('slug',), TAG_FIELDS))
+
+    def load_ingredients(self, batch):
+        return len(self.insert_missing(
+            Ingredient, batch, 'ingredient', ('name', 'measurement_unit'),
+            INGREDIENT_FIELDS
+        ))
+
+    def load_recipes(self, batch):
+        user_ids = self.ids['user']
+        batch = [record for record in batch if record['author'] in user_ids]
+        for record in batch:
+            record['author_id'] = user_ids[record['author']]
+            # В выгрузках до появления признака скрытых рецептов нет.
+            record.setdefault('is_hidden', False)
+        new_keys = self.insert_missing(
+            Recipe, batch, 'recipe', ('short_link',),
+            ('id', 'author_id', 'name', 'text', 'image', 'cooking_time',
+             'short_link', 'is_hidden')
+        )
+        recipe_ids = self.ids['recipe']
+        new = [
+            record for record in batch if (record['short_link'],) in new_keys
+        ]
+
+        # pub_date заполняется при вставке, исходные даты восстанавливаются
+        # отдельным запросом на пакет.
+        Recipe._base_manager.bulk_update(
+            [
+                Recipe(
+                    id=recipe_ids[record['id']], pub_date=record['pub_date'])
+                for record in new
+            ],
+            ('pub_date',)
+        )
+        tag_ids = self.ids['tag']
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(
+                recipe_id=recipe_ids[record['id']], tag_id=tag_ids[tag_id])
+            for record in new
+            for tag_id in record['tags'] if tag_id in tag_ids
+        )
+        ingredient_ids = self.ids['ingredient']
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe_id=recipe_ids[record['id']],
+                name_id=ingredient_ids[ingredient['id']],
+                amount=ingredient['amount'],
+            )
+            for record in new
+            for ingredient in record['ingredients']
+            if ingredient['id'] in ingredient_ids
+        )
+        new_ids = [recipe_ids[record['id']] for record in new]
+        refresh_cards(new_ids)
+        reindex_recipes(new_ids)
+        return len(new)
+
+    def load_relations(self, batch, model, fields):
+        """Связи с пользователем или рецептом, которых нет, пропускаются."""
+        first, second = fields
+        first_ids = self.ids['user']
+        second_ids = self.ids['user' if second == 'following' else 'recipe']
+        pairs = set()
+        for record in batch:
+            first_id = first_ids.get(record[first])
+            second_id = second_ids.get(record[second])
+            if first_id is None or second_id is None:
+                continue
+            if second == 'following' and first_id == second_id:
+                continue
+            pairs.add((first_id, second_id))
+        existing = set(model.objects.filter(**{
+            f'{first}_id__in': {pair[0] for pair in pairs},
+            f'{second}_id__in': {pair[1] for pair in pairs},
+        }).values_list(f'{first}_id', f'{second}_id'))
+        new = pairs - existing
+        model.objects.bulk_create(
+            (
+                model(**{f'{first}_id': first_id, f'{second}_id': second_id})
+                for first_id, second_id in new
+            ),
+            ignore_conflicts=True
+        )
+        return len(new)
@@ -1,34 +1,209 @@
+import csv
 import json
 import os
+from time import perf_counter
 
 from django.core.management.base import BaseCommand, CommandError
-from django.db.utils import IntegrityError
+from django.db import connections, router, transaction
 
-from recipes.models import Ingredient
+from recipes.batches import chunked
+from recipes.cards import refresh_cards
+from recipes.models import (
+    MAX_LENGTH_INGREDIENT_NAME, MAX_LENGTH_MEASUREMENT_UNIT, Ingredient,
+    IngredientInRecipe
+)
 from foodgram_backend.settings import BASE_DIR
 
 
+CSV_HEADER = ['name', 'measurement_unit']
+JSON_SEPARATORS = ' \t\r\n,[]'
+READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for number, row in enumerate(csv.reader(file), start=1):
+        if number == 1 and row == CSV_HEADER:
+            continue
+        if len(row) != 2:
+            raise CommandError(
+                f'Строка {number}: ожидается два столбца - '
+                'название и единица измерения!'
+            )
+        yield number, row[0], row[1]
+
+
+def read_json(file):
+    """Читает массив объектов или объекты по одному на строку.
+
+    Объекты разбираются по мере чтения файла, весь файл в память не
+    загружается.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    number = 0
+    finished = False
+    while True:
+        position = 0
+        while True:
+            while (
+                position < len(buffer) and buffer[position] in JSON_SEPARATORS
+            ):
+                position += 1
+            if position == len(buffer):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if finished:
+                    raise CommandError(
+                        f'Объект {number + 1}: некорректный JSON!')
+                break
+            number += 1
+            try:
+                yield number, item['name'], item['measurement_unit']
+            except (KeyError, TypeError):
+                raise CommandError(
+                    f'Объект {number}: нужны поля name и measurement_unit!')
+        if finished:
+            return
+        chunk = file.read(READ_SIZE)
+        finished = not chunk
+        buffer = buffer[position:] + chunk
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
 class Command(BaseCommand):
     help = 'Loading ingredients from data'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(BASE_DIR, 'data/ingredients.json'),
+            help='Файл CSV или JSON, по умолчанию data/ingredients.json.'
+        )
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла, по умолчанию по расширению.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--update-units', action='store_true',
+            help=(
+                'Обновлять единицу измерения, если ингредиент с таким '
+                'названием уже есть с другой единицей.'
+            )
+        )
+
     def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(
+            path)[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(
+                'Неизвестный формат файла, укажите --format csv или json!')
+        self.inserted = self.skipped = self.updated = 0
+        started = perf_counter()
         try:
-            with open(
-                os.path.join(
-                    BASE_DIR,
-                    'data/ingredients.json'
-                ),
-                'r',
-                encoding='utf-8'
-            ) as data:
-                data = json.load(data)
-                for ingredient in data:
-                    try:
-                        Ingredient.objects.create(
-                            name=ingredient['name'],
-                            measurement_unit=ingredient['measurement_unit']
-                        )
-                    except IntegrityError:
-                        pass
+            with open(path, 'r', encoding='utf-8', newline='') as data:
+                rows = (
+                    self.clean(*row) for row in READERS[file_format](data)
+                )
+                for batch in chunked(rows, options['batch_size']):
+                    self.load(batch, options['update_units'])
         except FileNotFoundError:
-            raise CommandError('Файл ingredients.json не найден!')
+            raise CommandError(f'Файл {path} не найден!')
+        elapsed = perf_counter() - started
+        total = self.inserted + self.skipped + self.updated
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {self.inserted}, пропущено: {self.skipped}, '
+            f'обновлено: {self.updated} за {elapsed:.2f} с '
+            f'({total / elapsed:.0f} строк/с)'
+        ))
+
+    @staticmethod
+    def clean(number, name, measurement_unit):
+        name = str(name).strip()
+        measurement_unit = str(measurement_unit).strip()
+        if not name or not measurement_unit:
+            raise CommandError(
+                f'Запись {number}: пустое название или единица измерения!')
+        if (
+            len(name) > MAX_LENGTH_INGREDIENT_NAME
+            or len(measurement_unit) > MAX_LENGTH_MEASUREMENT_UNIT
+        ):
+            raise CommandError(
+                f'Запись {number}: слишком длинное название '
+                'или единица измерения!'
+            )
+        return name, measurement_unit
+
+    def load(self, batch, update_units):
+        """Добавляет новые ингредиенты пакета одним запросом.
+
+        Уже существующие пары название - единица измерения пропускаются,
+        одновременная загрузка того же файла отсекается ON CONFLICT DO NOTHING.
+        """
+        units = {}
+        for name, measurement_unit in batch:
+            units.setdefault(name, set()).add(measurement_unit)
+        existing = {}
+        for ingredient in Ingredient.objects.filter(name__in=units):
+            existing.setdefault(ingredient.name, []).append(ingredient)
+
+        new = []
+        changed = []
+        for name, measurement_units in units.items():
+            present = existing.get(name, [])
+            present_units = {
+                ingredient.measurement_unit for ingredient in present}
+            missing = sorted(measurement_units - present_units)
+            if (
+                update_units and len(present) == 1
+                and len(measurement_units) == 1 and missing
+            ):
+                present[0].measurement_unit = missing[0]
+                changed.append(present[0])
+                continue
+            new.extend((name, unit) for unit in missing)
+        with transaction.atomic():
+            inserted = self.insert(new)
+            Ingredient.objects.bulk_update(changed, ('measurement_unit',))
+            # bulk_update не отправляет сигналов: карточки рецептов с
+            # измененными ингредиентами пересобираются здесь.
+            refresh_cards(list(IngredientInRecipe.objects.filter(
+                name__in=changed
+            ).values_list('recipe_id', flat=True).distinct()))
+        self.inserted += inserted
+        self.updated += len(changed)
+        self.skipped += len(batch) - inserted - len(changed)
+
+    @staticmethod
+    def insert(rows):
+        """Добавляет ингредиенты и возвращает число действительно добавленных.
+
+        bulk_create с ignore_conflicts не сообщает, какие строки пропущены
+        из-за одновременной загрузки, поэтому добавленные строки
+        считаются по RETURNING.
+        """
+        connection = connections[router.db_for_write(Ingredient)]
+        quote_name = connection.ops.quote_name
+        meta = Ingredient._meta
+        fields = [meta.get_field('name'), meta.get_field('measurement_unit')]
+        inserted = 0
+        with connection.cursor() as cursor:
+            for batch in chunked(
+                rows, connection.ops.bulk_batch_size(fields, rows) or 1
+            ):
+                cursor.execute(
+                    f'INSERT INTO {quote_name(meta.db_table)} '
+                    f'({quote_name(fields[0].column)}, '
+                    f'{quote_name(fields[1].column)}) '
+                    f'VALUES {", ".join(["(%s, %s)"] * len(batch))} '
+                    'ON CONFLICT DO NOTHING '
+                    f'RETURNING {quote_name(meta.pk.column)}',
+                    [value for row in batch for value in row]
+                )
+                inserted += len(cursor.fetchall())
+        return inserted
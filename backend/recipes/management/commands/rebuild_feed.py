@@ -0,0 +1,35 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from recipes.feed import backfill_subscriptions
+from recipes.models import TimelineEntry
+from users.models import Subscription
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересборка лент подписок: в ленту каждого пользователя '
+        'добавляются последние рецепты авторов, на которых он подписан'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, default=None,
+            help='id пользователя, по умолчанию пересобираются все ленты.'
+        )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        entries = TimelineEntry.objects.all()
+        subscriptions = Subscription.objects.all()
+        if options['user'] is not None:
+            entries = entries.filter(user_id=options['user'])
+            subscriptions = subscriptions.filter(user_id=options['user'])
+        entries.delete()
+        users = backfill_subscriptions(subscriptions)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано лент: {users}, записей: '
+            f'{TimelineEntry.objects.count()} '
+            f'за {perf_counter() - started:.1f} с'
+        ))
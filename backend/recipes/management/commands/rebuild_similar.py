@@ -0,0 +1,79 @@
+import os
+from collections import deque
+from itertools import groupby
+from multiprocessing import Pool
+from operator import itemgetter
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from recipes.batches import RowWriter, chunked
+from recipes.models import IngredientInRecipe, SimilarityBucket
+from recipes.similar import get_buckets
+
+
+def get_chunk_buckets(chunk):
+    return [
+        (recipe_id, bucket)
+        for recipe_id, ingredient_ids in chunk
+        for bucket in set(get_buckets(ingredient_ids))
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересборка индекса похожих рецептов: сигнатуры MinHash '
+        'считаются параллельно на всех ядрах'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов, по умолчанию по числу ядер.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Число рецептов в задании для одного процесса.'
+        )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        workers = max(options['workers'], 1)
+        # Процессы создаются до открытия соединения с базой и к ней не
+        # обращаются: в них только считаются хеши.
+        connections.close_all()
+        writer = RowWriter(options['chunk_size'] * 20)
+        recipes = rows = 0
+        with Pool(workers) as pool, transaction.atomic():
+            SimilarityBucket.objects.all().delete()
+            ingredients = IngredientInRecipe.objects.order_by(
+                'recipe_id').values_list('recipe_id', 'name_id').iterator(
+                    chunk_size=options['chunk_size'] * 10)
+            pending = deque()
+            for chunk in chunked(
+                (
+                    (recipe_id, [ingredient_id for _, ingredient_id in pairs])
+                    for recipe_id, pairs in groupby(
+                        ingredients, key=itemgetter(0))
+                ),
+                options['chunk_size']
+            ):
+                recipes += len(chunk)
+                pending.append(pool.apply_async(get_chunk_buckets, (chunk,)))
+                if len(pending) >= workers * 2:
+                    rows += writer.write(
+                        SimilarityBucket, ('recipe', 'bucket'),
+                        pending.popleft().get()
+                    )
+            while pending:
+                rows += writer.write(
+                    SimilarityBucket, ('recipe', 'bucket'),
+                    pending.popleft().get()
+                )
+        elapsed = perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано рецептов: {recipes}, корзин: {rows} '
+            f'за {elapsed:.1f} с ({recipes / elapsed:.0f} рецептов/с, '
+            f'процессов: {workers})'
+        ))
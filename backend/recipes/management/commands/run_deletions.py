@@ -0,0 +1,26 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from recipes.deletion import run_task
+from recipes.models import DeletionTask
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполнение незавершенных фоновых удалений пользователей и '
+        'рецептов, например после перезапуска сервера'
+    )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        tasks = DeletionTask.objects.filter(
+            finished_at=None).order_by('created_at')
+        for task in tasks:
+            run_task(task, progress=lambda task: self.stdout.write(
+                f'{task}: удалено строк {task.deleted_rows}'))
+            self.stdout.write(f'{task}: завершено')
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено удалений: {len(tasks)} '
+            f'за {perf_counter() - started:.1f} с'
+        ))
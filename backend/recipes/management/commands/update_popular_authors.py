@@ -0,0 +1,21 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from recipes.feed import update_popular_authors
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчет популярных авторов, рецепты которых добавляются к лентам '
+        'подписок при чтении'
+    )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        added, removed = update_popular_authors()
+        self.stdout.write(self.style.SUCCESS(
+            f'Новых популярных авторов: {len(added)}, '
+            f'перестали быть популярными: {len(removed)} '
+            f'за {perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,53 @@
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.batches import chunked
+from recipes.models import Recipe
+from recipes.scores import get_active_recipe_ids, update_scores
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчет популярности рецептов для сортировки '
+        'ordering=popular и ordering=trending'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', type=int, default=15,
+            help=(
+                'Пересчитать рецепты, добавленные в избранное или список '
+                'покупок за последние столько минут.'
+            )
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help=(
+                'Пересчитать все рецепты, в том числе после удаления из '
+                'избранного и списков покупок.'
+            )
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        now = timezone.now()
+        if options['full']:
+            recipe_ids = list(
+                Recipe.objects.order_by('id').values_list('id', flat=True))
+        else:
+            recipe_ids = sorted(get_active_recipe_ids(
+                now - timedelta(minutes=options['since'])))
+        recipes = changed = 0
+        for batch in chunked(recipe_ids, options['batch_size']):
+            with transaction.atomic():
+                changed += update_scores(batch, now)
+            recipes += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {recipes}, изменилось: {changed} '
+            f'за {perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.3 on 2026-10-19 07:44
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    """Оставляет из повторяющихся пар (user, recipe) строку с меньшим id."""
+    for model_name in ('Favorite', 'RecipeInShoppingCart'):
+        model = apps.get_model('recipes', model_name)
+        model.objects.using(schema_editor.connection.alias).filter(
+            models.Exists(model.objects.filter(
+                user=models.OuterRef('user'),
+                recipe=models.OuterRef('recipe'),
+                id__lt=models.OuterRef('id'),
+            ))
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_alter_recipe_short_link'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipeinshoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
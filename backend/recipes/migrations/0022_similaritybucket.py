@@ -0,0 +1,30 @@
+# Generated by Django 3.2.3 on 2026-10-19 08:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(verbose_name='Хеш полосы сигнатуры')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarity_buckets', to='recipes.recipe')),
+            ],
+            options={
+                'verbose_name': 'корзина похожих рецептов',
+                'verbose_name_plural': 'Корзины похожих рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='similaritybucket',
+            index=models.Index(fields=['bucket', 'recipe'], name='similarity_bucket'),
+        ),
+    ]
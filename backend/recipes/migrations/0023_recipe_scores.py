@@ -0,0 +1,42 @@
+# Generated by Django 3.2.3 on 2026-10-19 08:11
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_similaritybucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='added_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность за последнее время'),
+        ),
+        migrations.AddField(
+            model_name='recipeinshoppingcart',
+            name='added_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-pub_date'], name='recipe_popularity'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending', '-pub_date'], name='recipe_trending'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.3 on 2026-10-19 08:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0023_recipe_scores'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', 'name'], name='recipe_pub_date'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['cooking_time', 'name'], name='recipe_cooking_time'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.3 on 2026-10-19 08:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0024_recipe_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeCard',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='recipes.recipe')),
+                ('data', models.JSONField(verbose_name='Представление рецепта')),
+            ],
+            options={
+                'verbose_name': 'карточка рецепта',
+                'verbose_name_plural': 'Карточки рецептов',
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.3 on 2026-10-19 08:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0025_recipecard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('recipe', 'Рецепт'), ('favorite', 'Избранное'), ('shopping_cart', 'Список покупок'), ('subscription', 'Подписка')], max_length=13, verbose_name='Тип объекта')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Удален')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата изменения')),
+                ('user', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='changes', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'изменение',
+                'verbose_name_plural': 'Журнал изменений',
+                'ordering': ('id',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user', 'id'], name='change_user'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['kind', 'object_id'], name='change_object'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.3 on 2026-10-19 08:33
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0026_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=64, verbose_name='Модель')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+                ('deleted_rows', models.PositiveBigIntegerField(default=0, verbose_name='Удалено строк')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата создания')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+            ],
+            options={
+                'verbose_name': 'фоновое удаление',
+                'verbose_name_plural': 'Фоновые удаления',
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='is_hidden',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Скрыт до удаления'),
+        ),
+        migrations.AddConstraint(
+            model_name='deletiontask',
+            constraint=models.UniqueConstraint(fields=('model', 'object_id'), name='unique_deletion_task'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.3 on 2026-10-19 09:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0027_recipe_is_hidden_deletiontask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deletiontask',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Неудачных попыток'),
+        ),
+        migrations.AddField(
+            model_name='deletiontask',
+            name='error',
+            field=models.TextField(blank=True, verbose_name='Последняя ошибка'),
+        ),
+    ]
@@ -3,6 +3,7 @@ from string import ascii_letters
 
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.utils import timezone
 
 from users.models import User
 
@@ -66,6 +67,13 @@ class Ingredient(models.Model):
         return f'Ингредиент "{self.name}"'
 
 
+class VisibleRecipeManager(models.Manager):
+    """Рецепты без скрытых до фонового удаления."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_hidden=False)
+
+
 class Recipe(models.Model):
     """Модель рецепта."""
     tags = models.ManyToManyField(
@@ -113,19 +121,57 @@ class Recipe(models.Model):
         unique=True,
         blank=True,
     )
+    popularity = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность',
+    )
+    trending = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность за последнее время',
+    )
+    is_hidden = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Скрыт до удаления',
+    )
+
+    objects = VisibleRecipeManager()
+    all_objects = models.Manager()
 
     class Meta:
         default_related_name = 'recipes'
         ordering = ('-pub_date', 'name',)
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(
+                fields=('-pub_date', 'name'),
+                name='recipe_pub_date',
+            ),
+            models.Index(
+                fields=('cooking_time', 'name'),
+                name='recipe_cooking_time',
+            ),
+            models.Index(
+                fields=('-popularity', '-pub_date'),
+                name='recipe_popularity',
+            ),
+            models.Index(
+                fields=('-trending', '-pub_date'),
+                name='recipe_trending',
+            ),
+        )
 
     def generate_short_link(self):
         while True:
             short_link = ''.join(
                 random.choices(ascii_letters, k=MAX_LENGTH_SHORT_LINK)
             )
-            if not Recipe.objects.filter(short_link=short_link).exists():
+            if not Recipe.all_objects.filter(
+                short_link=short_link
+            ).exists():
                 return short_link
 
     def save(self, *args, **kwargs):
@@ -182,6 +228,11 @@ class FavoriteAndShoppingCartModel(models.Model):
         Recipe,
         on_delete=models.CASCADE,
     )
+    added_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Дата добавления',
+    )
 
     class Meta:
         abstract = True
@@ -194,6 +245,11 @@ class Favorite(FavoriteAndShoppingCartModel):
         ordering = ('recipe',)
         verbose_name = 'рецепт в избранном'
         verbose_name_plural = 'Рецепты в избранном'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'), name='unique_favorite'
+            ),
+        )
 
     def __str__(self):
         return f'"{self.recipe.name}" в избранном "{self.user.username}"'
@@ -206,9 +262,182 @@ class RecipeInShoppingCart(FavoriteAndShoppingCartModel):
         ordering = ('recipe',)
         verbose_name = 'рецепт в списке покупок'
         verbose_name_plural = 'Рецепты в списке покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'), name='unique_shopping_cart'
+            ),
+        )
 
     def __str__(self):
         return (
             f'Рецепт "{self.recipe.name}" в списке '
             f'покупок пользователя: "{self.user.username}"'
         )
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='timeline',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации',)
+
+    class Meta:
+        ordering = ('-pub_date', '-recipe',)
+        verbose_name = 'рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'), name='unique_timeline_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date',
+            ),
+        )
+
+    def __str__(self):
+        return f'Рецепт "{self.recipe_id}" в ленте "{self.user_id}"'
+
+
+class SimilarityBucket(models.Model):
+    """Корзина LSH, в которую попал набор ингредиентов рецепта."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similarity_buckets',
+    )
+    bucket = models.BigIntegerField(verbose_name='Хеш полосы сигнатуры',)
+
+    class Meta:
+        verbose_name = 'корзина похожих рецептов'
+        verbose_name_plural = 'Корзины похожих рецептов'
+        indexes = (
+            models.Index(
+                fields=('bucket', 'recipe'), name='similarity_bucket',
+            ),
+        )
+
+    def __str__(self):
+        return f'Рецепт "{self.recipe_id}" в корзине "{self.bucket}"'
+
+
+class RecipeCard(models.Model):
+    """Готовое представление рецепта без полей текущего пользователя."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='card',
+    )
+    data = models.JSONField(verbose_name='Представление рецепта',)
+
+    class Meta:
+        verbose_name = 'карточка рецепта'
+        verbose_name_plural = 'Карточки рецептов'
+
+    def __str__(self):
+        return f'Карточка рецепта "{self.recipe_id}"'
+
+
+class Change(models.Model):
+    """Запись журнала изменений для синхронизации клиентов."""
+    RECIPE = 'recipe'
+    FAVORITE = 'favorite'
+    SHOPPING_CART = 'shopping_cart'
+    SUBSCRIPTION = 'subscription'
+    KINDS = (
+        (RECIPE, 'Рецепт'),
+        (FAVORITE, 'Избранное'),
+        (SHOPPING_CART, 'Список покупок'),
+        (SUBSCRIPTION, 'Подписка'),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_index=False,
+        null=True,
+        related_name='changes',
+        verbose_name='Пользователь',
+    )
+    kind = models.CharField(
+        max_length=max(len(kind) for kind, _ in KINDS),
+        choices=KINDS,
+        verbose_name='Тип объекта',
+    )
+    object_id = models.BigIntegerField(verbose_name='id объекта',)
+    deleted = models.BooleanField(default=False, verbose_name='Удален',)
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Дата изменения',
+    )
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = 'изменение'
+        verbose_name_plural = 'Журнал изменений'
+        indexes = (
+            models.Index(fields=('user', 'id'), name='change_user',),
+            models.Index(
+                fields=('kind', 'object_id'), name='change_object',),
+        )
+
+    def __str__(self):
+        return f'Изменение "{self.kind}" "{self.object_id}"'
+
+
+class DeletionTask(models.Model):
+    """Фоновое удаление пользователя или рецепта со всеми связями."""
+    model = models.CharField(max_length=64, verbose_name='Модель',)
+    object_id = models.BigIntegerField(verbose_name='id объекта',)
+    deleted_rows = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Удалено строк',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Неудачных попыток',
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка',
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Дата создания',
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата завершения',
+    )
+
+    class Meta:
+        ordering = ('-created_at',)
+        verbose_name = 'фоновое удаление'
+        verbose_name_plural = 'Фоновые удаления'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('model', 'object_id'), name='unique_deletion_task'
+            ),
+        )
+
+    def __str__(self):
+        return f'Удаление "{self.model}" "{self.object_id}"'
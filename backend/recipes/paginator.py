@@ -0,0 +1,28 @@
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+from foodgram_backend.settings import ADMIN_COUNT_LIMIT
+
+
+class CappedCountPaginator(Paginator):
+    """Пагинатор админки, который считает не больше ADMIN_COUNT_LIMIT строк.
+
+    COUNT(*) по большой таблице, особенно с фильтрами, выполняется дольше
+    самой страницы. Ограниченный подсчет читает не больше
+    ADMIN_COUNT_LIMIT + 1 строк, дальние страницы при этом недоступны.
+    """
+
+    @cached_property
+    def count(self):
+        return min(
+            self.object_list.order_by().values('pk')[
+                :ADMIN_COUNT_LIMIT + 1].count(),
+            ADMIN_COUNT_LIMIT
+        )
+
+
+class CappedCountAdminMixin:
+    """Ограниченный подсчет строк в списке объектов админки."""
+    paginator = CappedCountPaginator
+    # Без фильтров Django считает все строки таблицы отдельным запросом.
+    show_full_result_count = False
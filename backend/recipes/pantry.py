@@ -0,0 +1,167 @@
+"""Поиск рецептов по ингредиентам, которые есть у пользователя.
+
+Каждый процесс держит в памяти инвертированный индекс: для ингредиента -
+отсортированный массив id рецептов, для рецепта - его ингредиенты. Перед
+поиском из журнала изменений (Change) дочитываются изменения рецептов
+после курсора, и ингредиенты этих рецептов загружаются заново, а
+удаленные рецепты убираются из индекса. Как и у клиентов синхронизации,
+курсор не сдвигается за записи моложе CHANGES_CURSOR_LAG_SECONDS: запись
+с меньшим id может стать видна позже. Уже примененные записи после
+курсора запоминаются и повторно не загружаются. Индекс целиком
+перестраивается раз в PANTRY_INDEX_REBUILD_SECONDS - это гораздо раньше,
+чем compact_changes удалит записи после курсора; новый индекс строится без
+блокировки и подменяет старый целиком.
+"""
+import heapq
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+from threading import Lock
+from time import monotonic
+
+from foodgram_backend.settings import PANTRY_INDEX_REBUILD_SECONDS
+from recipes.changes import get_cutoff, get_initial_cursor
+from recipes.models import Change, IngredientInRecipe
+
+
+def pop_ranked(ranked):
+    while ranked:
+        yield -heapq.heappop(ranked)[2]
+
+
+class PantryIndex:
+    """Инвертированный индекс ингредиент -> рецепты."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.rebuild_lock = Lock()
+        self.postings = {}
+        self.recipes = {}
+        self.cursor = 0
+        self.applied_ids = set()
+        self.built_at = None
+
+    def rebuild(self):
+        # Изменения после курсора применяются повторно после подмены
+        # индекса, поэтому курсор берется до чтения ингредиентов.
+        cursor = get_initial_cursor()
+        recipes = {}
+        for recipe_id, ingredient_id in (
+            IngredientInRecipe.objects.order_by().values_list(
+                'recipe_id', 'name_id').iterator(chunk_size=10000)
+        ):
+            recipes.setdefault(recipe_id, []).append(ingredient_id)
+        postings = {}
+        for recipe_id in sorted(recipes):
+            for ingredient_id in recipes[recipe_id]:
+                postings.setdefault(ingredient_id, []).append(recipe_id)
+        postings = {
+            ingredient_id: array('q', recipe_ids)
+            for ingredient_id, recipe_ids in postings.items()
+        }
+        recipes = {
+            recipe_id: tuple(ingredient_ids)
+            for recipe_id, ingredient_ids in recipes.items()
+        }
+        with self.lock:
+            self.postings = postings
+            self.recipes = recipes
+            self.cursor = cursor
+            self.applied_ids = set()
+            self.built_at = monotonic()
+
+    def is_stale(self):
+        return (
+            self.built_at is None
+            or monotonic() - self.built_at > PANTRY_INDEX_REBUILD_SECONDS
+        )
+
+    def apply_changes(self):
+        cutoff = get_cutoff()
+        recipe_ids = set()
+        advancing = True
+        for change_id, created_at, recipe_id in Change.objects.filter(
+            user__isnull=True, kind=Change.RECIPE, id__gt=self.cursor
+        ).order_by('id').values_list('id', 'created_at', 'object_id'):
+            if change_id not in self.applied_ids:
+                recipe_ids.add(recipe_id)
+            if advancing and created_at < cutoff:
+                self.cursor = change_id
+            else:
+                advancing = False
+                self.applied_ids.add(change_id)
+        self.applied_ids = {
+            change_id for change_id in self.applied_ids
+            if change_id > self.cursor
+        }
+        if not recipe_ids:
+            return
+        rows = IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('recipe_id').values_list('recipe_id', 'name_id')
+        for recipe_id in recipe_ids:
+            self.remove(recipe_id)
+        for recipe_id, recipe_rows in groupby(rows, key=itemgetter(0)):
+            self.recipes[recipe_id] = tuple(row[1] for row in recipe_rows)
+            for ingredient_id in self.recipes[recipe_id]:
+                insort(
+                    self.postings.setdefault(ingredient_id, array('q')),
+                    recipe_id
+                )
+
+    def refresh(self):
+        """Перестраивает устаревший индекс вне основной блокировки.
+
+        Пока один поток строит индекс, остальные ищут по старому; ждут
+        только запросы к еще не построенному индексу.
+        """
+        if self.is_stale() and self.rebuild_lock.acquire(
+            blocking=self.built_at is None
+        ):
+            try:
+                if self.is_stale():
+                    self.rebuild()
+            finally:
+                self.rebuild_lock.release()
+
+    def remove(self, recipe_id):
+        for ingredient_id in self.recipes.pop(recipe_id, ()):
+            recipe_ids = self.postings[ingredient_id]
+            position = bisect_left(recipe_ids, recipe_id)
+            if (
+                position < len(recipe_ids)
+                and recipe_ids[position] == recipe_id
+            ):
+                del recipe_ids[position]
+
+    def remove_recipe(self, recipe_id):
+        with self.lock:
+            self.remove(recipe_id)
+
+    def search(self, ingredient_ids, missing):
+        """id рецептов, которым не хватает не больше missing ингредиентов.
+
+        Рецепты упорядочены по доле имеющихся ингредиентов, затем по их
+        числу, новые - раньше. Возвращается итератор: порядок строится по
+        куче по мере чтения, поэтому отбор первых рецептов после
+        фильтрации не сортирует всех кандидатов.
+        """
+        self.refresh()
+        with self.lock:
+            self.apply_changes()
+            covered = Counter()
+            for ingredient_id in set(ingredient_ids):
+                covered.update(self.postings.get(ingredient_id, ()))
+            recipes = self.recipes
+            ranked = [
+                (-count / len(recipes[recipe_id]), -count, -recipe_id)
+                for recipe_id, count in covered.items()
+                if len(recipes[recipe_id]) - count <= missing
+            ]
+        heapq.heapify(ranked)
+        return pop_ranked(ranked)
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,85 @@
+"""Популярность рецептов для сортировки списка.
+
+popularity - число добавлений в избранное и в списки покупок.
+trending - двоичный логарифм суммы весов добавлений за последние
+TRENDING_WINDOW_DAYS, где вес растет вдвое каждые TRENDING_HALF_LIFE_HOURS
+от фиксированной даты EPOCH. Это равносильно затуханию старых добавлений
+с периодом полураспада TRENDING_HALF_LIFE_HOURS, но уже посчитанные
+оценки не нужно пересчитывать с течением времени: пересчитываются только
+рецепты с новыми добавлениями.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Count
+
+from foodgram_backend.settings import (
+    TRENDING_FAVORITE_WEIGHT, TRENDING_HALF_LIFE_HOURS,
+    TRENDING_SHOPPING_CART_WEIGHT, TRENDING_WINDOW_DAYS
+)
+from recipes.models import Favorite, Recipe, RecipeInShoppingCart
+
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+ACTIVITY = (
+    (Favorite, TRENDING_FAVORITE_WEIGHT),
+    (RecipeInShoppingCart, TRENDING_SHOPPING_CART_WEIGHT),
+)
+
+
+def get_trending_score(events):
+    """log2 суммы weight * 2 ** (часов от EPOCH / период полураспада)."""
+    if not events:
+        return 0
+    exponents = [
+        (
+            (added_at - EPOCH).total_seconds() / 3600
+            / TRENDING_HALF_LIFE_HOURS,
+            weight
+        )
+        for added_at, weight in events
+    ]
+    top = max(exponent for exponent, _ in exponents)
+    return top + math.log2(sum(
+        weight * 2 ** (exponent - top) for exponent, weight in exponents))
+
+
+def get_active_recipe_ids(since):
+    recipe_ids = set()
+    for model, _ in ACTIVITY:
+        recipe_ids.update(model.objects.filter(
+            added_at__gte=since).values_list('recipe_id', flat=True))
+    return recipe_ids
+
+
+def update_scores(recipe_ids, now):
+    """Пересчитывает оценки рецептов, возвращает число изменившихся."""
+    popularity = defaultdict(int)
+    events = defaultdict(list)
+    window_start = now - timedelta(days=TRENDING_WINDOW_DAYS)
+    for model, weight in ACTIVITY:
+        for recipe_id, count in model.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values('recipe_id').annotate(
+            count=Count('id')
+        ).values_list('recipe_id', 'count'):
+            popularity[recipe_id] += count
+        for recipe_id, added_at in model.objects.filter(
+            recipe_id__in=recipe_ids, added_at__gte=window_start
+        ).values_list('recipe_id', 'added_at'):
+            events[recipe_id].append((added_at, weight))
+    changed = []
+    for recipe in Recipe.objects.filter(id__in=recipe_ids).only(
+        'id', 'popularity', 'trending'
+    ):
+        trending = get_trending_score(events[recipe.id])
+        if (
+            recipe.popularity != popularity[recipe.id]
+            or recipe.trending != trending
+        ):
+            recipe.popularity = popularity[recipe.id]
+            recipe.trending = trending
+            changed.append(recipe)
+    Recipe.objects.bulk_update(changed, ('popularity', 'trending'))
+    return len(changed)
@@ -0,0 +1,677 @@
+import csv
+from io import StringIO
+from tempfile import NamedTemporaryFile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .csv_export import get_csv_chunks
+from .deletion import (
+    get_model_label, run_in_background, schedule_deletion
+)
+from .feed import get_feed, get_popular_author_ids, update_popular_authors
+from .management.commands.load_ingredients import Command
+from .models import (
+    Change, DeletionTask, Favorite, Ingredient, IngredientInRecipe, Recipe,
+    RecipeCard, RecipeInShoppingCart, Tag, TimelineEntry
+)
+from .pantry import PantryIndex
+from .similar import get_candidate_ids, index_recipe
+from users.models import PopularAuthor, Subscription, User
+
+
+# Страница списка админки - 100 строк, данных больше страницы, чтобы
+# лишний запрос на строку сразу менял число запросов.
+ROWS = 110
+
+
+class AdminChangelistQueriesTests(TestCase):
+    """Число запросов списков админки не зависит от числа строк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create(
+            User(
+                email=f'user{number}@foodgram.test',
+                username=f'user{number}',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+            )
+            for number in range(ROWS)
+        )
+        users = list(User.objects.order_by('id'))
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        )
+        cls.tag = Tag.objects.first()
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ing{number:03}', measurement_unit='г')
+            for number in range(ROWS)
+        )
+        ingredients = list(Ingredient.objects.order_by('id'))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=users[number % 10],
+                name=f'Рецепт {number}',
+                text='Описание рецепта',
+                image='recipes/images/recipe.png',
+                cooking_time=10,
+                short_link=f'link{number}',
+            )
+            for number in range(ROWS)
+        )
+        recipes = list(Recipe.objects.order_by('id'))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=cls.tag)
+            for recipe in recipes
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, name=ingredient, amount=1)
+            for recipe, ingredient in zip(recipes, ingredients)
+        )
+        for model in (Favorite, RecipeInShoppingCart):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe)
+                for user, recipe in zip(users, recipes)
+            )
+        cls.favorite = Favorite.objects.first()
+        Subscription.objects.bulk_create(
+            Subscription(user=user, following=users[0])
+            for user in users[1:]
+        )
+        cls.recipe = recipes[0]
+        cls.admin = User.objects.create_superuser(
+            email='admin@foodgram.test', username='admin', password=None,
+            first_name='Администратор', last_name='Администратор'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assert_page(self, url, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_recipe_changelist(self):
+        # Сессия, пользователь, ограниченный подсчет, страница с авторами и
+        # числом добавлений в избранное, теги для фильтра.
+        response = self.assert_page('/admin/recipes/recipe/', 5)
+        self.assertEqual(len(response.context['cl'].result_list), 100)
+
+    def test_recipe_changelist_filtered(self):
+        self.assert_page(
+            f'/admin/recipes/recipe/?tags__id__exact={self.tag.id}', 5)
+
+    def test_recipe_changelist_search(self):
+        self.assert_page('/admin/recipes/recipe/?q=user1', 5)
+
+    def test_related_changelists(self):
+        for url in (
+            '/admin/recipes/ingredientinrecipe/',
+            '/admin/recipes/favorite/',
+            '/admin/recipes/recipeinshoppingcart/',
+            '/admin/recipes/ingredient/',
+            '/admin/recipes/tag/',
+            '/admin/users/user/',
+            '/admin/users/subscription/',
+        ):
+            with self.subTest(url=url):
+                self.assert_page(url, 4)
+
+    def test_delete_confirmation_skips_related_objects(self):
+        # Сессия, пользователь и сам объект, страница выполняется в
+        # транзакции (два запроса SAVEPOINT внутри теста).
+        self.assert_page(
+            f'/admin/recipes/recipe/{self.recipe.id}/delete/', 5)
+        self.assert_page(
+            f'/admin/users/user/{self.recipe.author_id}/delete/', 5)
+
+    def test_change_pages(self):
+        # Автодополнение загружает подпись выбранного ингредиента отдельным
+        # запросом для каждой строки, у рецепта одна строка.
+        self.assert_page(
+            f'/admin/recipes/recipe/{self.recipe.id}/change/', 11)
+        self.assert_page(
+            f'/admin/recipes/favorite/{self.favorite.id}/change/', 11)
+
+    def test_autocomplete(self):
+        response = self.assert_page(
+            '/admin/autocomplete/?app_label=recipes&model_name=favorite'
+            '&field_name=recipe&term=Рецепт',
+            4
+        )
+        self.assertEqual(len(response.json()['results']), 20)
+
+
+class FeedTests(TestCase):
+    """Ленты подписок обновляются при любом создании рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, *cls.followers = (
+            User.objects.create(
+                email=f'{name}@foodgram.test', username=name,
+                first_name=name, last_name=name,
+            )
+            for name in ('author', 'first', 'second')
+        )
+        Subscription.objects.bulk_create(
+            Subscription(user=follower, following=cls.author)
+            for follower in cls.followers
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def create_recipe(self, number=0):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                author=self.author, name=f'Рецепт {number}', text='Текст',
+                image='recipes/images/recipe.png', cooking_time=10,
+                short_link=f'link{number}',
+            )
+
+    def get_feed_ids(self, user):
+        return [recipe_id for recipe_id, _ in get_feed(user)]
+
+    def test_recipe_created_outside_api(self):
+        recipe = self.create_recipe()
+        self.assertEqual(
+            TimelineEntry.objects.filter(recipe=recipe).count(), 2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe.save()
+        self.assertEqual(callbacks, [])
+
+    def test_popular_author(self):
+        with mock.patch('recipes.feed.FEED_POPULAR_AUTHOR_FOLLOWERS', 1):
+            self.assertEqual(
+                update_popular_authors(), ({self.author.id}, set()))
+        recipe = self.create_recipe()
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.get_feed_ids(self.followers[0]), [recipe.id])
+
+        self.assertEqual(update_popular_authors(), (set(), {self.author.id}))
+        self.assertFalse(PopularAuthor.objects.exists())
+        self.assertEqual(
+            TimelineEntry.objects.filter(recipe=recipe).count(), 2)
+        self.assertEqual(self.get_feed_ids(self.followers[0]), [recipe.id])
+
+    def test_popular_authors_are_not_counted_on_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            get_popular_author_ids()
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('GROUP BY', queries[0]['sql'])
+
+
+class SimilarRecipesTests(TestCase):
+    """Кандидаты в похожие рецепты читаются из корзин с ограничением."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            email='author@foodgram.test', username='author',
+            first_name='author', last_name='author',
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                image='recipes/images/recipe.png', cooking_time=10,
+                short_link=f'link{number}',
+            )
+            for number in range(8)
+        )
+        cls.recipe_ids = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True))
+        # У первых шести рецептов одинаковые ингредиенты, у остальных -
+        # никаких общих.
+        for number, recipe_id in enumerate(cls.recipe_ids):
+            index_recipe(
+                recipe_id,
+                [1, 2, 3] if number < 6 else [10 + number, 20 + number],
+                created=True
+            )
+
+    def test_candidates(self):
+        first, *same, _, _ = self.recipe_ids
+        self.assertEqual(get_candidate_ids(first), same[::-1])
+        self.assertEqual(get_candidate_ids(self.recipe_ids[-1]), [])
+
+    @mock.patch('recipes.similar.SIMILAR_BUCKET_LIMIT', 2)
+    def test_bucket_limit(self):
+        self.assertEqual(
+            get_candidate_ids(self.recipe_ids[0]), self.recipe_ids[5:3:-1])
+
+    def test_orm_changes(self):
+        author = Recipe.objects.get(id=self.recipe_ids[0]).author
+        salt, pepper = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'перец')
+        )
+        first, second = (
+            Recipe.objects.create(
+                author=author, name=name, text='Текст',
+                image='recipes/images/recipe.png', cooking_time=10,
+                short_link=name,
+            )
+            for name in ('first', 'second')
+        )
+        for recipe in (first, second):
+            for ingredient in (salt, pepper):
+                IngredientInRecipe.objects.create(
+                    recipe=recipe, name=ingredient, amount=1)
+        self.assertIn(second.id, get_candidate_ids(first.id))
+        salt.delete()
+        pepper.delete()
+        self.assertEqual(get_candidate_ids(first.id), [])
+
+
+class PantryIndexTests(TestCase):
+    """Индекс ингредиентов видит изменения из журнала в любом порядке."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='author@foodgram.test', username='author',
+            first_name='author', last_name='author',
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ing{number}', measurement_unit='г')
+            for number in range(3)
+        )
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+
+    def setUp(self):
+        self.index = PantryIndex()
+        self.recipes = 0
+
+    def create_recipe(self, *ingredients):
+        self.recipes += 1
+        recipe = Recipe.objects.create(
+            author=self.author, name=f'Рецепт {self.recipes}', text='Текст',
+            image='recipes/images/recipe.png', cooking_time=10,
+            short_link=f'link{self.recipes}',
+        )
+        for ingredient in ingredients:
+            IngredientInRecipe.objects.create(
+                recipe=recipe, name=ingredient, amount=1)
+        return recipe
+
+    def search(self):
+        return set(self.index.search(
+            [ingredient.id for ingredient in self.ingredients], 0))
+
+    @mock.patch('api.v1.views.PANTRY_MAX_RESULTS', 2)
+    def test_limit_is_applied_after_filters(self):
+        tag = Tag.objects.create(name='Тег', slug='tag')
+        tagged = [self.create_recipe(self.ingredients[0]) for _ in range(3)]
+        for recipe in tagged:
+            recipe.tags.add(tag)
+        tagged[-1].is_hidden = True
+        tagged[-1].save()
+        for _ in range(3):
+            self.create_recipe(self.ingredients[0])
+        with mock.patch('api.v1.views.pantry_index', self.index):
+            response = self.client.get(
+                '/api/recipes/pantry/',
+                {'ingredients': self.ingredients[0].id, 'tags': 'tag'}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [tagged[1].id, tagged[0].id]
+        )
+
+    def test_rebuild_does_not_block_search(self):
+        def get_cursor():
+            self.assertFalse(self.index.lock.locked())
+            return 0
+
+        recipe = self.create_recipe(self.ingredients[0])
+        with mock.patch('recipes.pantry.get_initial_cursor', get_cursor):
+            self.assertEqual(self.search(), {recipe.id})
+
+    def test_changes_and_deletions(self):
+        first = self.create_recipe(self.ingredients[0])
+        self.assertEqual(self.search(), {first.id})
+        second = self.create_recipe(self.ingredients[1])
+        IngredientInRecipe.objects.create(
+            recipe=first, name=Ingredient.objects.create(
+                name='missing', measurement_unit='г'),
+            amount=1
+        )
+        self.assertEqual(self.search(), {second.id})
+        second.delete()
+        self.assertEqual(self.search(), set())
+
+    def test_change_committed_out_of_order(self):
+        recipe = self.create_recipe(self.ingredients[0])
+        self.search()
+        late = Change.objects.create(kind=Change.RECIPE, object_id=0)
+        late_id = late.id
+        late.delete()
+        self.create_recipe(self.ingredients[1])
+        self.search()
+        # Запись с меньшим id становится видна после записи с большим.
+        self.create_recipe()
+        recipe_id = Recipe.objects.latest('id').id
+        IngredientInRecipe.objects.bulk_create((IngredientInRecipe(
+            recipe_id=recipe_id, name=self.ingredients[2], amount=1),))
+        Change.objects.filter(kind=Change.RECIPE, object_id=recipe_id).update(
+            id=late_id)
+        self.assertIn(recipe_id, self.search())
+        self.assertIn(recipe.id, self.search())
+
+
+class RecipeCardTests(TestCase):
+    """Карточки пересобираются при изменениях через модели."""
+
+    def test_orm_changes(self):
+        author = User.objects.create(
+            email='author@foodgram.test', username='author',
+            first_name='Имя', last_name='Фамилия',
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст',
+            image='recipes/images/recipe.png', cooking_time=10,
+            short_link='link',
+        )
+        tag = Tag.objects.create(name='Тег', slug='tag')
+        recipe.tags.add(tag)
+        IngredientInRecipe.objects.create(
+            recipe=recipe, amount=5, name=Ingredient.objects.create(
+                name='соль', measurement_unit='г'))
+        author.first_name = 'Другое'
+        author.save()
+        card = RecipeCard.objects.get(recipe=recipe).data
+        self.assertEqual(card['name'], 'Рецепт')
+        self.assertEqual([tag['slug'] for tag in card['tags']], ['tag'])
+        self.assertEqual(
+            [ingredient['amount'] for ingredient in card['ingredients']], [5])
+        self.assertEqual(card['author']['first_name'], 'Другое')
+
+    def test_load_ingredients_updates_cards(self):
+        author = User.objects.create(
+            email='author@foodgram.test', username='author',
+            first_name='Имя', last_name='Фамилия',
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст',
+            image='recipes/images/recipe.png', cooking_time=10,
+            short_link='link',
+        )
+        IngredientInRecipe.objects.create(
+            recipe=recipe, amount=5, name=Ingredient.objects.create(
+                name='соль', measurement_unit='г'))
+        with NamedTemporaryFile('w', suffix='.csv') as data:
+            data.write('соль,кг\n')
+            data.flush()
+            call_command(
+                'load_ingredients', data.name, '--update-units',
+                stdout=StringIO()
+            )
+        card = RecipeCard.objects.get(recipe=recipe).data
+        self.assertEqual(
+            [ingredient['measurement_unit']
+             for ingredient in card['ingredients']],
+            ['кг']
+        )
+
+
+class LoadIngredientsTests(TestCase):
+    """Команда load_ingredients считает только действительно добавленные."""
+
+    def load(self, content):
+        output = StringIO()
+        with NamedTemporaryFile('w', suffix='.csv') as data:
+            data.write(content)
+            data.flush()
+            call_command('load_ingredients', data.name, stdout=output)
+        return output.getvalue()
+
+    def test_rerun_inserts_nothing(self):
+        self.assertIn(
+            'Добавлено: 2, пропущено: 0', self.load('соль,г\nсахар,г\n'))
+        self.assertIn(
+            'Добавлено: 0, пропущено: 2', self.load('соль,г\nсахар,г\n'))
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+    def test_concurrent_insert_is_not_counted(self):
+        insert = Command.insert
+
+        def insert_after_other_load(rows):
+            Ingredient.objects.create(name='соль', measurement_unit='г')
+            return insert(rows)
+
+        with mock.patch.object(
+            Command, 'insert', side_effect=insert_after_other_load
+        ):
+            output = self.load('соль,г\nсахар,г\n')
+        self.assertIn('Добавлено: 1, пропущено: 1', output)
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+
+class ExportImportTests(TestCase):
+    """Выгрузка и загрузка сохраняют скрытые рецепты и связи с ними."""
+
+    def test_hidden_recipe_round_trip(self):
+        author = User.objects.create(
+            email='author@foodgram.test', username='author',
+            first_name='Имя', last_name='Фамилия',
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст',
+            image='recipes/images/recipe.png', cooking_time=10,
+            short_link='link', is_hidden=True,
+        )
+        Favorite.objects.create(user=author, recipe=recipe)
+        with NamedTemporaryFile('w+', suffix='.ndjson') as data:
+            call_command('export_data', data.name, stdout=StringIO())
+            self.assertIn('"is_hidden": true', data.read())
+            Recipe._base_manager.all().delete()
+            call_command('import_data', data.name, stdout=StringIO())
+        recipe = Recipe._base_manager.get(short_link='link')
+        self.assertTrue(recipe.is_hidden)
+        self.assertTrue(
+            Favorite.objects.filter(user=author, recipe=recipe).exists())
+        with NamedTemporaryFile('w+', suffix='.ndjson') as data:
+            call_command('export_data', data.name, stdout=StringIO())
+            output = StringIO()
+            call_command('import_data', data.name, stdout=output)
+        self.assertIn('recipe: добавлено 0, пропущено 1', output.getvalue())
+        self.assertIn('favorite: добавлено 0, пропущено 1', output.getvalue())
+
+
+class ChangeLogTests(TestCase):
+    """Изменения связей вне API записываются в журнал сигналами."""
+
+    def setUp(self):
+        self.author, self.reader = (
+            User.objects.create(
+                email=f'{name}@foodgram.test', username=name,
+                first_name=name, last_name=name,
+            )
+            for name in ('author', 'reader')
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст',
+            image='recipes/images/recipe.png', cooking_time=10,
+            short_link='link',
+        )
+
+    def get_changes(self, user):
+        return list(Change.objects.filter(user=user).order_by(
+            'id').values_list('kind', 'object_id', 'deleted'))
+
+    def test_orm_changes(self):
+        favorite = Favorite.objects.create(
+            user=self.reader, recipe=self.recipe)
+        Subscription.objects.create(user=self.reader, following=self.author)
+        favorite.delete()
+        Subscription.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.get_changes(self.reader), [
+            (Change.FAVORITE, self.recipe.id, False),
+            (Change.SUBSCRIPTION, self.author.id, False),
+            (Change.FAVORITE, self.recipe.id, True),
+            (Change.SUBSCRIPTION, self.author.id, True),
+        ])
+
+    def test_cascade_deletion(self):
+        for model in (Favorite, RecipeInShoppingCart):
+            model.objects.create(user=self.reader, recipe=self.recipe)
+        Change.objects.all().delete()
+        recipe_id = self.recipe.id
+        self.recipe.delete()
+        self.assertEqual(
+            sorted(self.get_changes(self.reader)),
+            [
+                (Change.FAVORITE, recipe_id, True),
+                (Change.SHOPPING_CART, recipe_id, True),
+            ]
+        )
+        self.assertEqual(
+            self.get_changes(None), [(Change.RECIPE, recipe_id, True)])
+
+
+class CsvExportTests(TestCase):
+    """Ячейки, похожие на формулы, не выполняются табличным редактором."""
+
+    def test_formula_cells_are_escaped(self):
+        names = (
+            '=HYPERLINK("http://example.com")', '+1', '-1', '@SUM(A1)',
+            '\tтаб', '\rвозврат', 'соль', 'a=b',
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='-г') for name in names)
+        output = ''.join(get_csv_chunks(
+            Ingredient.objects.order_by('id'),
+            (('id', 'id'), ('name', 'Название'),
+             ('measurement_unit', 'Единица')),
+        ))
+        header, *rows = csv.reader(StringIO(output.lstrip('\ufeff')))
+        self.assertEqual(header, ['id', 'Название', 'Единица'])
+        self.assertEqual(
+            [name for _, name, _ in rows],
+            [
+                '\'=HYPERLINK("http://example.com")', "'+1", "'-1",
+                "'@SUM(A1)", "'\tтаб", "'\rвозврат", 'соль', 'a=b',
+            ]
+        )
+        self.assertEqual({unit for _, _, unit in rows}, {"'-г"})
+        self.assertTrue(all(row_id.isdigit() for row_id, _, _ in rows))
+
+
+class DeletionTests(TransactionTestCase):
+    """Фоновое удаление без Collector'а, с записью ошибок и повтором."""
+
+    def setUp(self):
+        self.author, self.reader = (
+            User.objects.create(
+                email=f'{name}@foodgram.test', username=name,
+                first_name=name, last_name=name,
+            )
+            for name in ('author', 'reader')
+        )
+        tag = Tag.objects.create(name='Тег', slug='tag')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        Subscription.objects.create(user=self.reader, following=self.author)
+        Subscription.objects.create(user=self.author, following=self.reader)
+        self.recipes = []
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'Рецепт {number}', text='Текст',
+                image='recipes/images/missing.png', cooking_time=10,
+                short_link=f'link{number}',
+            )
+            recipe.tags.add(tag)
+            IngredientInRecipe.objects.create(
+                recipe=recipe, name=ingredient, amount=1)
+            for model in (Favorite, RecipeInShoppingCart):
+                model.objects.create(user=self.reader, recipe=recipe)
+            self.recipes.append(recipe)
+
+    def get_task(self, instance):
+        return DeletionTask.objects.get(
+            model=get_model_label(type(instance)), object_id=instance.pk)
+
+    @mock.patch(
+        'django.db.models.deletion.Collector.collect',
+        side_effect=AssertionError('Collector не должен использоваться')
+    )
+    def test_delete_user(self, collect):
+        schedule_deletion((self.author,))
+        self.assertFalse(User.objects.filter(id=self.author.id).exists())
+        self.assertTrue(User.objects.filter(id=self.reader.id).exists())
+        for model in (
+            Recipe, RecipeCard, IngredientInRecipe, Favorite,
+            RecipeInShoppingCart, Subscription, TimelineEntry,
+            Recipe.tags.through,
+        ):
+            with self.subTest(model=model):
+                self.assertFalse(model._base_manager.exists())
+        task = self.get_task(self.author)
+        self.assertIsNotNone(task.finished_at)
+        self.assertEqual(task.attempts, 0)
+        recipe_ids = sorted(recipe.id for recipe in self.recipes)
+        self.assertEqual(
+            sorted(Change.objects.filter(
+                user=None, kind=Change.RECIPE, deleted=True
+            ).values_list('object_id', flat=True)),
+            recipe_ids
+        )
+        for kind, object_ids in (
+            (Change.FAVORITE, recipe_ids),
+            (Change.SHOPPING_CART, recipe_ids),
+            (Change.SUBSCRIPTION, [self.author.id]),
+        ):
+            with self.subTest(kind=kind):
+                self.assertEqual(
+                    sorted(Change.objects.filter(
+                        user=self.reader, kind=kind, deleted=True
+                    ).values_list('object_id', flat=True)),
+                    object_ids
+                )
+
+    def test_error_is_recorded_and_raised(self):
+        recipe = self.recipes[0]
+        with mock.patch(
+            'recipes.deletion.delete_rows',
+            side_effect=OperationalError('database is locked')
+        ), self.assertRaises(OperationalError):
+            schedule_deletion((recipe,))
+        task = self.get_task(recipe)
+        self.assertIsNone(task.finished_at)
+        self.assertEqual(task.attempts, 1)
+        self.assertIn('database is locked', task.error)
+        self.assertTrue(Recipe.all_objects.get(id=recipe.id).is_hidden)
+
+    @mock.patch('recipes.deletion.retry')
+    def test_background_retry(self, retry):
+        recipe = self.recipes[0]
+        with mock.patch('recipes.deletion.run_tasks'):
+            schedule_deletion((recipe,))
+        label, ids = get_model_label(Recipe), [recipe.id]
+        with mock.patch(
+            'recipes.deletion.delete_rows',
+            side_effect=OperationalError('database is locked')
+        ):
+            with self.assertLogs('recipes.deletion', 'ERROR'):
+                run_in_background(label, ids)
+            retry.assert_called_once_with(label, ids, 2)
+            retry.reset_mock()
+            with mock.patch(
+                'recipes.deletion.DELETION_MAX_ATTEMPTS', 2
+            ), self.assertLogs('recipes.deletion', 'ERROR'):
+                run_in_background(label, ids, 2)
+            retry.assert_not_called()
+        self.assertEqual(self.get_task(recipe).attempts, 2)
+        run_in_background(label, ids, 3)
+        self.assertIsNotNone(self.get_task(recipe).finished_at)
+        self.assertFalse(Recipe.all_objects.filter(id=recipe.id).exists())
@@ -1,9 +1,15 @@
 from django.contrib import admin
 
 from .models import Subscription, User
+from recipes.csv_export import CsvExportAdminMixin
+from recipes.deletion import BackgroundDeletionAdminMixin
+from recipes.paginator import CappedCountAdminMixin
 
 
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(
+    BackgroundDeletionAdminMixin, CsvExportAdminMixin, CappedCountAdminMixin,
+    admin.ModelAdmin
+):
     list_display = (
         'id',
         'email',
@@ -20,18 +26,26 @@ class UserAdmin(admin.ModelAdmin):
         'avatar',
     )
     search_fields = ('email', 'username',)
+    csv_export_fields = (
+        ('id', 'id'),
+        ('email', 'Почта'),
+        ('username', 'Никнейм'),
+        ('first_name', 'Имя'),
+        ('last_name', 'Фамилия'),
+        ('is_active', 'Активен'),
+        ('is_staff', 'Администратор'),
+        ('date_joined', 'Дата регистрации'),
+    )
 
 
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(CappedCountAdminMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'user',
         'following',
     )
-    list_editable = (
-        'user',
-        'following',
-    )
+    list_select_related = ('user', 'following',)
+    autocomplete_fields = ('user', 'following',)
 
 
 admin.site.register(User, UserAdmin)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from django.db.models.signals import post_save
+
+        from .models import User
+        from .revocation import user_saved
+        post_save.connect(user_saved, sender=User)
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.3 on 2026-10-19 09:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_popular_authors(apps, schema_editor):
+    """Отмечает авторов, популярных на момент миграции."""
+    alias = schema_editor.connection.alias
+    PopularAuthor = apps.get_model('users', 'PopularAuthor')
+    Subscription = apps.get_model('users', 'Subscription')
+    PopularAuthor.objects.using(alias).bulk_create(
+        PopularAuthor(author_id=author_id, followers=followers)
+        for author_id, followers in Subscription.objects.using(
+            alias
+        ).order_by().values('following').annotate(
+            followers=models.Count('id')
+        ).filter(
+            followers__gt=settings.FEED_POPULAR_AUTHOR_FOLLOWERS
+        ).values_list('following', 'followers')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_remove_user_role'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularAuthor',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='users.user', verbose_name='Автор')),
+                ('followers', models.PositiveIntegerField(verbose_name='Число подписчиков')),
+            ],
+            options={
+                'verbose_name': 'популярный автор',
+                'verbose_name_plural': 'Популярные авторы',
+            },
+        ),
+        migrations.RunPython(
+            fill_popular_authors, migrations.RunPython.noop),
+    ]
@@ -40,6 +40,8 @@ class User(AbstractUser):
     )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name',)
+    # Поля, при изменении которых отзываются выпущенные токены.
+    TOKEN_FIELDS = ('password', 'is_active', 'is_staff', 'is_superuser',)
 
     class Meta:
         ordering = ('username',)
@@ -49,6 +51,19 @@ class User(AbstractUser):
     def __str__(self):
         return f'Пользователь "{self.username}"'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.saved_token_values = instance.get_token_values()
+        return instance
+
+    def get_token_values(self):
+        """Загруженные значения полей из TOKEN_FIELDS."""
+        return {
+            name: self.__dict__[name]
+            for name in self.TOKEN_FIELDS if name in self.__dict__
+        }
+
 
 class Subscription(models.Model):
     user = models.ForeignKey(
@@ -73,3 +88,23 @@ class Subscription(models.Model):
 
     def __str__(self):
         return f'"{self.user.username}" на "{self.following.username}"'
+
+
+class PopularAuthor(models.Model):
+    """Автор, рецепты которого не копируются в ленты подписчиков."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    followers = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',)
+
+    class Meta:
+        verbose_name = 'популярный автор'
+        verbose_name_plural = 'Популярные авторы'
+
+    def __str__(self):
+        return f'Автор "{self.author_id}": {self.followers} подписчиков'
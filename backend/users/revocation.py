@@ -0,0 +1,88 @@
+"""Отзыв подписанных токенов доступа и обновления.
+
+Отзывается либо один токен (по jti), либо все токены пользователя,
+выпущенные до отзыва: при выходе, смене пароля или прав, деактивации и
+удалении. Отметки хранятся в кэше REVOKED_TOKENS_CACHE и живут не дольше
+самих токенов. Кэш находится в памяти, чтобы проверка не обращалась к
+базе; отзыв виден всем процессам, только если кэш общий, как memcached в
+Docker Compose.
+"""
+from datetime import datetime, timezone
+
+from django.core.cache import caches
+
+from foodgram_backend.settings import REFRESH_TOKEN_LIFETIME
+
+
+REVOKED_TOKENS_CACHE = 'revoked_tokens'
+
+
+def get_timestamp():
+    return datetime.now(timezone.utc).timestamp()
+
+
+def get_user_key(user_id):
+    return f'user:{user_id}'
+
+
+def revoke_jti(jti, timeout):
+    if timeout > 0:
+        caches[REVOKED_TOKENS_CACHE].set(jti, True, int(timeout) + 1)
+
+
+def revoke_token(token):
+    """Отзывает токен до истечения его срока.
+
+    Вместе с токеном доступа отзывается и токен обновления, с которым он
+    выпущен.
+    """
+    revoke_jti(token['jti'], token['exp'] - get_timestamp())
+    refresh_jti = token.get('refresh_jti')
+    if refresh_jti is not None:
+        revoke_jti(refresh_jti, REFRESH_TOKEN_LIFETIME.total_seconds())
+
+
+def revoke_user_tokens(user_ids):
+    """Отзывает все выпущенные до этого момента токены пользователей."""
+    revoked_at = get_timestamp()
+    caches[REVOKED_TOKENS_CACHE].set_many(
+        {get_user_key(user_id): revoked_at for user_id in user_ids},
+        int(REFRESH_TOKEN_LIFETIME.total_seconds()) + 1
+    )
+
+
+def is_token_revoked(token):
+    """Проверяет отзыв токена и всех токенов его пользователя.
+
+    Обе отметки читаются одним обращением к кэшу.
+    """
+    user_key = get_user_key(token['user_id'])
+    revoked = caches[REVOKED_TOKENS_CACHE].get_many((token['jti'], user_key))
+    if token['jti'] in revoked:
+        return True
+    revoked_at = revoked.get(user_key)
+    return revoked_at is not None and token.get('iat', 0) <= revoked_at
+
+
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Отзывает токены при смене пароля, деактивации и изменении прав.
+
+    Токен доступа хранит флаги пользователя, поэтому токены, выпущенные
+    до изменения, больше не принимаются. Значения сравниваются с
+    загруженными из базы; поле, значение которого не загружалось,
+    считается измененным.
+    """
+    values = {
+        name: value for name, value in instance.get_token_values().items()
+        if update_fields is None or name in update_fields
+    }
+    saved = getattr(instance, 'saved_token_values', {})
+    if not created and (
+        not instance.is_active
+        or any(
+            name not in saved or saved[name] != value
+            for name, value in values.items()
+        )
+    ):
+        revoke_user_tokens((instance.pk,))
+    instance.saved_token_values = {**saved, **values}
@@ -0,0 +1,437 @@
+"""Нагрузочный прогон сценариев postman-коллекции.
+
+Каждый виртуальный пользователь по порядку выполняет запросы коллекции
+со своими адресами почты и никнеймами, переменные коллекции заполняются
+из ответов так же, как это делают тесты коллекции. По каждому адресу
+выводятся пропускная способность и задержки p50/p95/p99, результаты
+сохраняются в JSON для сравнения прогонов между коммитами.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import requests
+
+
+COLLECTION = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'foodgram.postman_collection.json'
+)
+BACKEND_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'
+)
+# Переменные с почтой и никнеймом получают суффикс виртуального
+# пользователя, чтобы параллельные регистрации не конфликтовали.
+UNIQUE_VARIABLES = (
+    'email', 'username', 'secondUserEmail', 'secondUserUsername',
+    'thirdUserEmail', 'thirdUserUsername',
+)
+PERCENTILES = (50, 95, 99)
+SERVER_START_TIMEOUT = 30
+
+VARIABLE = re.compile(r'{{(\w+)}}')
+LOCAL_FROM_RESPONSE = re.compile(
+    r'const (\w+) = _\.get\(responseData, "(\w+)"\)')
+SET_VARIABLE = re.compile(
+    r'pm\.collectionVariables\.set\(["\'](\w+)["\'], (.+)\)$')
+RESPONSE_ITEM = re.compile(
+    r'^responseData\[(\d+)\]\.(\w+)(\.slice\(0,\s*(\d+)\))?$')
+
+
+class Step:
+    """Один запрос коллекции и правила заполнения переменных из ответа."""
+
+    def __init__(self, item, path, auth):
+        request = item['request']
+        self.name = item['name']
+        self.path = path
+        self.method = request['method']
+        url = request['url']
+        self.url = url['raw'] if isinstance(url, dict) else url
+        self.headers = [
+            (header['key'], header['value'])
+            for header in request.get('header', ())
+            if not header.get('disabled')
+        ]
+        self.body = request.get('body', {}).get('raw')
+        if self.body is not None:
+            self.headers.append(('Content-Type', 'application/json'))
+        self.auth = request.get('auth', auth)
+        self.anonymous = self.auth is None or self.auth['type'] == 'noauth'
+        self.endpoint = '{} {}{}'.format(
+            self.method,
+            self.url.replace('{{baseUrl}}', ''),
+            ' (аноним)' if self.anonymous else ''
+        )
+        self.setters = parse_setters(item.get('event', ()))
+
+    def build(self, variables):
+        headers = {
+            substitute(key, variables): substitute(value, variables)
+            for key, value in self.headers
+        }
+        if not self.anonymous and self.auth['type'] == 'apikey':
+            options = {
+                option['key']: option['value']
+                for option in self.auth['apikey']
+            }
+            headers[options.get('key', 'Authorization')] = substitute(
+                options['value'], variables)
+        body = self.body
+        if body is not None:
+            body = substitute(body, variables).encode()
+        return substitute(self.url, variables), headers, body
+
+    def update_variables(self, response, variables):
+        if not self.setters:
+            return
+        try:
+            data = response.json()
+        except ValueError:
+            return
+        for name, getter in self.setters:
+            try:
+                value = getter(data)
+            except (IndexError, KeyError, TypeError):
+                continue
+            if value is not None:
+                variables[name] = str(value)
+
+
+def substitute(text, variables):
+    return VARIABLE.sub(
+        lambda match: variables.get(match.group(1), match.group(0)), text)
+
+
+def parse_setters(events):
+    """Находит в тестах коллекции присваивания переменных из ответа."""
+    setters = []
+    for event in events:
+        if event.get('listen') != 'test':
+            continue
+        local = {}
+        for line in event['script'].get('exec', ()):
+            line = line.strip().rstrip(';')
+            match = LOCAL_FROM_RESPONSE.search(line)
+            if match:
+                local[match.group(1)] = match.group(2)
+                continue
+            match = SET_VARIABLE.search(line)
+            if not match:
+                continue
+            name, expression = match.groups()
+            if expression in local:
+                field = local[expression]
+                setters.append((name, lambda data, field=field: data[field]))
+                continue
+            match = RESPONSE_ITEM.match(expression)
+            if match:
+                index, field, _, length = match.groups()
+                setters.append((
+                    name, make_item_getter(int(index), field, length)))
+    return setters
+
+
+def make_item_getter(index, field, length):
+    def getter(data):
+        if isinstance(data, dict):
+            data = data['results']
+        value = data[index][field]
+        return value[:int(length)] if length else value
+    return getter
+
+
+def load_steps(collection, with_bad_requests, folders):
+    steps = []
+
+    def walk(items, path, auth):
+        for item in items:
+            item_path = path + (item['name'],)
+            if 'item' in item:
+                if not with_bad_requests and 'bad_requests' in item['name']:
+                    continue
+                walk(item['item'], item_path, item.get('auth', auth))
+            else:
+                steps.append(Step(item, item_path, auth))
+
+    for folder in collection['item']:
+        name = folder['name'].split(' //')[0]
+        if folders and name not in folders:
+            continue
+        walk((folder,), (), collection.get('auth'))
+    return steps
+
+
+def make_variables(collection, base_url, suffix):
+    variables = {
+        variable['key']: variable['value']
+        for variable in collection.get('variable', ())
+    }
+    variables['baseUrl'] = base_url
+    for name in UNIQUE_VARIABLES:
+        value = variables[name]
+        if name.lower().endswith('email'):
+            variables[name] = value.replace('@', f'+{suffix}@', 1)
+        else:
+            variables[name] = value[:-1] + f'-{suffix}"'
+    return variables
+
+
+class Results:
+    """Задержки и статусы ответов по адресам, общие для всех потоков."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, endpoint, latency, status):
+        with self.lock:
+            self.latencies[endpoint].append(latency)
+            self.statuses[endpoint][status] += 1
+
+
+def run_user(number, steps, collection, options, results, deadline):
+    session = requests.Session()
+    iteration = 0
+    while iteration < options.iterations and time.monotonic() < deadline:
+        variables = make_variables(
+            collection, options.base_url,
+            f'{options.run_id}u{number}i{iteration}'
+        )
+        for step in steps:
+            if time.monotonic() >= deadline:
+                return
+            url, headers, body = step.build(variables)
+            started = time.perf_counter()
+            try:
+                response = session.request(
+                    step.method, url, headers=headers, data=body,
+                    timeout=options.timeout
+                )
+            except requests.RequestException:
+                results.add(
+                    step.endpoint, time.perf_counter() - started, 'error')
+                continue
+            results.add(
+                step.endpoint, time.perf_counter() - started,
+                response.status_code
+            )
+            step.update_variables(response, variables)
+            if options.think_max:
+                time.sleep(random.uniform(
+                    options.think_min, options.think_max))
+        iteration += 1
+
+
+def percentile(values, percent):
+    """Процентиль по ближайшему рангу для отсортированного списка."""
+    index = max(0, -(-len(values) * percent // 100) - 1)
+    return values[index]
+
+
+def summarize(results, elapsed):
+    endpoints = {}
+    for endpoint, latencies in sorted(results.latencies.items()):
+        latencies.sort()
+        endpoints[endpoint] = {
+            'requests': len(latencies),
+            'throughput': round(len(latencies) / elapsed, 2),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2),
+            **{
+                f'p{percent}_ms': round(
+                    percentile(latencies, percent) * 1000, 2)
+                for percent in PERCENTILES
+            },
+            'statuses': {
+                str(status): count
+                for status, count in results.statuses[endpoint].items()
+            },
+        }
+    total = sum(endpoint['requests'] for endpoint in endpoints.values())
+    return {
+        'requests': total,
+        'throughput': round(total / elapsed, 2),
+        'endpoints': endpoints,
+    }
+
+
+def print_summary(summary, baseline=None):
+    baseline = (baseline or {}).get('endpoints', {})
+    header = '{:<64} {:>7} {:>8} {:>8} {:>8} {:>8}'.format(
+        'Адрес', 'Запр.', 'RPS', 'p50, мс', 'p95, мс', 'p99, мс')
+    print(header)
+    print('-' * len(header))
+    for endpoint, stats in summary['endpoints'].items():
+        line = '{:<64} {:>7} {:>8} {:>8} {:>8} {:>8}'.format(
+            endpoint[:64], stats['requests'], stats['throughput'],
+            stats['p50_ms'], stats['p95_ms'], stats['p99_ms']
+        )
+        previous = baseline.get(endpoint)
+        if previous:
+            change = (
+                stats['p95_ms'] / previous['p95_ms'] - 1
+                if previous['p95_ms'] else 0
+            )
+            line += f' p95 {change:+.0%}'
+        print(line)
+    print(
+        f'Всего: {summary["requests"]} запросов, '
+        f'{summary["throughput"]} запросов/с'
+    )
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(options):
+    """Запускает gunicorn с бэкендом и ждет, пока он начнет отвечать."""
+    host = options.base_url.split('://', 1)[-1].rstrip('/')
+    server = subprocess.Popen(
+        (
+            sys.executable, '-m', 'gunicorn', '--bind', host,
+            '--workers', str(options.workers), 'foodgram_backend.wsgi'
+        ),
+        cwd=BACKEND_DIR
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit('Сервер завершился при запуске.')
+        try:
+            requests.get(f'{options.base_url}/api/tags/', timeout=1)
+            return server
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.terminate()
+    sys.exit('Сервер не ответил за отведенное время.')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument(
+        '--users', type=int, default=10,
+        help='Число параллельных виртуальных пользователей.'
+    )
+    parser.add_argument(
+        '--iterations', type=int, default=1,
+        help='Сколько раз каждый пользователь проходит коллекцию.'
+    )
+    parser.add_argument(
+        '--duration', type=float, default=None,
+        help='Ограничение длительности прогона в секундах.'
+    )
+    parser.add_argument(
+        '--think-min', type=float, default=0,
+        help='Минимальная пауза между запросами в секундах.'
+    )
+    parser.add_argument(
+        '--think-max', type=float, default=0,
+        help='Максимальная пауза между запросами в секундах.'
+    )
+    parser.add_argument(
+        '--folders', nargs='*', default=(),
+        help='Папки верхнего уровня коллекции, по умолчанию все.'
+    )
+    parser.add_argument(
+        '--with-bad-requests', action='store_true',
+        help='Выполнять и запросы из папок *_bad_requests.'
+    )
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument(
+        '--output', default=None,
+        help='Файл для результатов, по умолчанию benchmark-<время>.json.'
+    )
+    parser.add_argument(
+        '--compare', default=None,
+        help='Файл результатов прошлого прогона для сравнения p95.'
+    )
+    parser.add_argument(
+        '--start-server', action='store_true',
+        help='Запустить бэкенд через gunicorn на время прогона.'
+    )
+    parser.add_argument('--workers', type=int, default=1)
+    options = parser.parse_args()
+    options.base_url = options.base_url.rstrip('/')
+    options.think_max = max(options.think_max, options.think_min)
+    return options
+
+
+def main():
+    options = parse_args()
+    random.seed(options.seed)
+    options.run_id = format(int(time.time()), 'x')
+    with open(COLLECTION, encoding='utf-8') as file:
+        collection = json.load(file)
+    steps = load_steps(
+        collection, options.with_bad_requests, set(options.folders))
+    baseline = None
+    if options.compare:
+        with open(options.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    server = start_server(options) if options.start_server else None
+    try:
+        results = Results()
+        deadline = time.monotonic() + (options.duration or float('inf'))
+        threads = [
+            threading.Thread(
+                target=run_user,
+                args=(number, steps, collection, options, results, deadline)
+            )
+            for number in range(options.users)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    summary = summarize(results, elapsed)
+    print_summary(summary, baseline)
+    report = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'commit': get_commit(),
+        'options': {
+            name: getattr(options, name)
+            for name in (
+                'base_url', 'users', 'iterations', 'duration', 'think_min',
+                'think_max', 'with_bad_requests', 'workers', 'seed',
+            )
+        },
+        'duration': round(elapsed, 3),
+        **summary,
+    }
+    output = options.output or 'benchmark-{}.json'.format(
+        datetime.now().strftime('%Y%m%d-%H%M%S'))
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f'Результаты сохранены в {output}')
+
+
+if __name__ == '__main__':
+    main()